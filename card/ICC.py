@@ -34,15 +34,12 @@ import os
 import re
 
 # smartcard python modules from pyscard
-from smartcard.CardType import AnyCardType
-from smartcard.CardType import ATRCardType
-from smartcard.CardRequest import CardRequest
 from smartcard.CardConnection import CardConnection
 from smartcard.ATR import ATR
-from smartcard.Exceptions import CardConnectionException
 from smartcard.util import toHexString
 
 from card.utils import *
+from card.transport import *
         
 ###########################################################
 # ISO7816 class with attributes and methods as defined 
@@ -120,6 +117,18 @@ class ISO7816(object):
         0xFE : 'TERMINATE CARD USAGE',
         }
                
+    # status words of a card that does not support the selection by path
+    # (see select_path())
+    PATH_SELECT_SW = ((0x6A, 0x86), (0x6B, 0x00), (0x6A, 0x81))
+    
+    # commands that change the structure or the life cycle status of files,
+    # which are indicated in their FCP (see self.fcp_cache)
+    FCP_INS = (0x04, 0x44, 0xD4, 0xE0, 0xE4, 0xE6, 0xE8, 0xFE)
+    
+    # bytes that an additional UPDATE BINARY command costs: the command 
+    # header and the status word (see update_binary())
+    UPDATE_BINARY_OVERHEAD = 7
+    
     file_tags = {
         0x80 : 'Size',
         0x81 : 'Length',
@@ -142,33 +151,225 @@ class ISO7816(object):
         0xAB : 'Security Attribute expanded',
         }     
                
-    def __init__(self, atr=None, CLA=0x00):
+    def __init__(self, atr=None, CLA=0x00, transport=None):
         """
         connect smartcard and defines class CLA code for communication
-        uses "pyscard" library services
+        uses "pyscard" library services through a PcscTransport, unless
+        another transport (e.g. a simulated card, see simulator.py) is passed
         
         creates self.CLA attribute with CLA code
         and self.coms attribute with associated "apdu_stack" instance
         """
-        if (atr):
-            cardtype = ATRCardType(atr)
-        else:
-            cardtype = AnyCardType()
-        cardrequest = CardRequest(timeout=1, cardType=cardtype)
-        self.cardservice = cardrequest.waitforcard()
-        self.cardservice.connection.connect()
-        self.reader = self.cardservice.connection.getReader()
-        self.ATR = self.cardservice.connection.getATR()
+        if transport is None:
+            transport = PcscTransport(atr)
+        self.transport = transport
+        self.transport.connect()
+        if atr and self.transport.atr != bytes(atr):
+            raise TransportError('card ATR does not match')
+        self.reader = self.transport.reader
+        self.ATR = list(self.transport.atr)
+        self.__set_protocol()
+        self.set_extended_length(ATR_card_capabilities(self.ATR))
         
         self.CLA = CLA
         self.coms = apdu_stack()
+        # FCP of the files seen during the session, by absolute path
+        self.fcp_cache = fcp_cache()
+        # support for the selection by path, None until it is tried
+        self.path_selection = None
+        self.select_seq = 0
+        self.__reset_channels()
+    
+    def __reset_channels(self):
+        # logical channel in use, and the ADF known to be the current DF
+        # on each channel (see set_channel() and SELECT_FILE())
+        self.channel = 0
+        self.channel_ADF = {}
+        # last selection made on each channel, numbered from 
+        # self.select_seq (see selection_changed())
+        self.channel_select = {}
+        # channels opened for applications, by AID (see UICC)
+        self.app_channels = {}
+        self.use_channels = True
+    
+    def __set_protocol(self):
+        # over T=1, case 4 commands are sent with Le, so that the response
+        # data is returned without a GET RESPONSE command
+        self.protocol = self.transport.protocol
+        self.case4 = self.protocol == 1
+        if self.dbg:
+            log(3, '(ISO7816) transmission protocol T=%u' % self.protocol)
+    
+    def selection_changed(self):
+        """
+        selection_changed() -> int
+        
+        called for each command that may change the current file on the 
+        current channel (SELECT FILE, or READ / UPDATE with a SFI), 
+        returns a new sequence number, also kept in self.channel_select
+        
+        a user that remembers the selection it made (e.g. Simcard) knows 
+        it is still valid as long as self.channel_select has the same 
+        number for the channel, a reset clears self.channel_select
+        """
+        self.select_seq += 1
+        self.channel_select[self.channel] = self.select_seq
+        return self.select_seq
+    
+    def set_extended_length(self, capabilities):
+        """
+        set_extended_length(capabilities=[0x.., 0x.., 0x..] or None) -> None
+        
+        sets self.extended_length from the card capabilities (ISO 7816-4, 
+        8.1.1.2.7, from the ATR or EF.ATR): extended Lc and Le fields are 
+        used when the card supports them and T=1 is used 
+        (over T=0, they would require the ENVELOPE command)
+        """
+        self.capabilities = capabilities
+        self.extended_length = self.protocol == 1 and capabilities is not None \
+                               and len(capabilities) >= 3 \
+                               and bool(capabilities[2] & 0x40)
+        if self.dbg:
+            log(3, '(ISO7816) extended length: %s' % self.extended_length)
+    
+    def read_binary(self, length, offset=0, buf=None, sfi=None):
+        """
+        read_binary(length, offset=0, buf=None, sfi=None) -> apdu_response
+        
+        reads length bytes from the current transparent EF, starting at
+        offset, with as few READ BINARY commands as possible: 
+        256 bytes per command, or 65536 with extended length (see
+        set_extended_length())
+        if buf (bytearray or writable memoryview) is given, the data is 
+        read into it, otherwise a bytearray is allocated
+        if sfi is given, the EF with this short file identifier in the 
+        current DF is read instead (offset must be below 256), the first
+        command selects it, so that it becomes the current EF
+        returns the response to the last READ BINARY command, its data is 
+        replaced by a memoryview of all data read, which is shorter than 
+        length when the card returned an error or the end of the file
+        """
+        if buf is None:
+            buf = bytearray(length)
+        buf = memoryview(buf)
+        chunk = 65536 if self.extended_length else 256
+        pos = 0
+        while True:
+            off = offset + pos
+            Le = min(length - pos, chunk)
+            if sfi is not None and pos == 0:
+                P1 = 0x80 | sfi
+            else:
+                P1 = (off >> 8) & 0x7F
+            resp = self.READ_BINARY(P1=P1, P2=off & 0xFF, Le=Le)
+            if resp.sw1 == 0x6C and 0 < resp.sw2 < Le:
+                # end of file: read what is left
+                resp = self.READ_BINARY(P1=P1, P2=off & 0xFF, Le=resp.sw2)
+            n = min(len(resp.data), len(buf) - pos)
+            buf[pos:pos+n] = resp.data[:n]
+            pos += n
+            if (resp.sw1, resp.sw2) != (0x90, 0x00) or n == 0 \
+            or pos >= length:
+                break
+        resp.data = buf[:pos]
+        return resp
+    
+    def update_binary(self, data, offset=0, old=None):
+        """
+        update_binary(data, offset=0, old=None) -> apdu_response
+        
+        writes data into the current transparent EF, starting at offset,
+        with as few UPDATE BINARY commands as possible: 255 bytes per 
+        command, or 65535 with extended length (see set_extended_length())
+        if old (the current content of the EF from offset on, as it was 
+        read before) is given, only the ranges that differ from it are 
+        written, ranges that are closer to each other than the overhead of 
+        a command (UPDATE_BINARY_OVERHEAD) are written together; when 
+        nothing differs, no command is sent and None is returned
+        returns the response to the last UPDATE BINARY command, the update
+        stops at the first error
+        """
+        data = memoryview(bytes(data))
+        if old is None:
+            spans = [(0, len(data))]
+        else:
+            spans = diff_spans(old, data, self.UPDATE_BINARY_OVERHEAD)
+        chunk = 65535 if self.extended_length else 255
+        resp = None
+        for start, end in spans:
+            pos = start
+            while True:
+                off = offset + pos
+                resp = self.UPDATE_BINARY(P1=(off >> 8) & 0x7F, P2=off & 0xFF, \
+                                          Data=data[pos:min(pos+chunk, end)])
+                pos += chunk
+                if (resp.sw1, resp.sw2) != (0x90, 0x00):
+                    return resp
+                if pos >= end:
+                    break
+        return resp
     
     def disconnect(self):
         """
         disconnect smartcard: stops the session
-        uses "pyscard" library service
+        through the transport
         """
-        self.cardservice.connection.disconnect()
+        self.transport.disconnect()
+    
+    def set_channel(self, channel=0):
+        """
+        set_channel(channel=0) -> None
+        
+        routes the following commands to the given logical channel, by 
+        coding its number into the CLA byte (ISO 7816-4, 5.4.1): 
+        channels 0 to 3 in b2-b1 (first interindustry values), 
+        channels 4 to 19 in b4-b1 with b7 set (further interindustry values)
+        """
+        if channel < 4:
+            self.CLA = (self.CLA & 0x8C) | channel
+        else:
+            self.CLA = (self.CLA & 0x80) | 0x40 | (channel - 4)
+        self.channel = channel
+    
+    def open_channel(self):
+        """
+        open_channel() -> int (channel number) or None
+        
+        opens a supplementary logical channel through the basic channel,
+        the channel number is assigned by the card
+        returns None when the card refuses it (no channel left, 
+        or no support for logical channels)
+        """
+        channel = self.channel
+        self.set_channel(0)
+        resp = self.MANAGE_CHANNEL(P1=0x00, P2=0x00)
+        self.set_channel(channel)
+        if (resp.sw1, resp.sw2) != (0x90, 0x00) or len(resp.data) != 1:
+            if self.dbg >= 2:
+                log(2, '(open_channel) %s' % resp)
+            return None
+        # a new channel opened from the basic channel has the MF selected
+        self.channel_ADF.pop(resp.data[0], None)
+        self.channel_select.pop(resp.data[0], None)
+        return resp.data[0]
+    
+    def close_channel(self, channel):
+        """
+        close_channel(channel) -> None
+        
+        closes a supplementary logical channel, through the basic channel
+        """
+        if self.channel == channel:
+            self.set_channel(0)
+        current = self.channel
+        self.set_channel(0)
+        self.MANAGE_CHANNEL(P1=0x80, P2=channel)
+        self.set_channel(current)
+        self.channel_ADF.pop(channel, None)
+        self.channel_select.pop(channel, None)
+        for aid in [aid for aid in self.app_channels \
+                    if self.app_channels[aid] == channel]:
+            del self.app_channels[aid]
     
     def define_class(self, CLA=0x00):
         """
@@ -322,32 +523,52 @@ class ISO7816(object):
     def sr_apdu(self, apdu, force=False):
         """
         sr_apdu(apdu=[0x.., 0x.., ...]) -> 
-            list   [ string(apdu sent information),
+            apdu_response, indexable like the list
+                   [ string(apdu sent information),
                      string(SW codes interpretation),
                      2-tuple(sw1, sw2),
-                     list(response bytes) ]
+                     bytes(response) ]
                      
         generic function to send apdu, receive and interpret response
-        force: force card reconnection if pyscard transmission fails
+        the strings are only computed when they are accessed
+        force: force card reset if the transmission fails
         """
         if force:
             try: 
-                data, sw1, sw2 = self.cardservice.connection.transmit(apdu)
-            except CardConnectionException:
-                ISO7816.__init__(self, CLA = self.CLA)
-                data, sw1, sw2 = self.cardservice.connection.transmit(apdu)
+                data, (sw1, sw2) = self.transport.transmit(bytes(apdu))
+            except TransportError:
+                self.ATR = list(self.transport.reset())
+                self.__set_protocol()
+                self.set_extended_length(self.capabilities)
+                # the reset closes all logical channels
+                self.set_channel(0)
+                self.__reset_channels()
+                data, (sw1, sw2) = self.transport.transmit(bytes(apdu))
         else:
-            data, sw1, sw2 = self.cardservice.connection.transmit(apdu)
-        # replaces INS code by strings when available
-        if apdu[1] in self.INS_dic.keys(): 
-            apdu_name =  self.INS_dic[apdu[1]] + ' '
-        else: 
-            apdu_name = ''
-        sw_stat = self.sw_status(sw1, sw2)
-        return ['%sapdu: %s' % (apdu_name, toHexString(apdu)),
-                'sw1, sw2: %s - %s' % ( toHexString([sw1, sw2]), sw_stat ),
-                (sw1, sw2),
-                data ]
+            data, (sw1, sw2) = self.transport.transmit(bytes(apdu))
+        if apdu[1] in self.FCP_INS:
+            self.fcp_cache.invalidate()
+        return apdu_response(self, apdu, sw1, sw2, data)
+    
+    def sr_apdu_case4(self, apdu):
+        """
+        sr_apdu_case4(apdu=[0x.., 0x.., ...] without Le) -> apdu_response
+        
+        sends a case 4 command (command data and response data):
+        over T=1, Le=0x00 is appended and the response data is returned
+        directly, over T=0 the APDU is sent without Le and the card answers
+        with SW1 0x61 / 0x9F, the caller has then to send GET RESPONSE;
+        if the card rejects the Le byte, the latter is done for the rest 
+        of the session
+        """
+        if self.case4:
+            resp = self.sr_apdu(bytes(apdu) + b'\x00')
+            if resp.sw1 not in (0x67, 0x6C):
+                return resp
+            self.case4 = False
+            if self.dbg:
+                log(2, '(sr_apdu_case4) Le refused, using GET RESPONSE')
+        return self.sr_apdu(apdu)
     
     def bf_cla(self, start=0, param=[0xA4, 0x00, 0x00, 0x02, 0x3F, 0x00]):
         """
@@ -405,11 +626,19 @@ class ISO7816(object):
     def READ_BINARY(self, P1=0x00, P2=0x00, Le=0x01):
         """
         APDU command to read the content of EF file with transparent structure
-        Le: length of data bytes to be read
+        Le: length of data bytes to be read (1 to 256, 256 being coded 0x00,
+            or up to 65536 with an extended Le field)
         
         call sr_apdu method
         """
-        READ_BINARY = [self.CLA, 0xB0, P1, P2, Le]
+        if Le > 256:
+            READ_BINARY = bytes((self.CLA, 0xB0, P1, P2, 0x00, \
+                                 (Le >> 8) & 0xFF, Le & 0xFF))
+        else:
+            READ_BINARY = bytes((self.CLA, 0xB0, P1, P2, Le & 0xFF))
+        if P1 & 0x80:
+            # SFI referencing, the EF becomes the current file
+            self.selection_changed()
         return self.sr_apdu(READ_BINARY)
     
     def WRITE_BINARY(self, P1=0x00, P2=0x00, Data=[]):
@@ -419,17 +648,24 @@ class ISO7816(object):
         Data: list of data bytes to be written
         call sr_apdu method
         """
-        WRITE_BINARY = [self.CLA, 0xD0, P1, P2, len(Data)] + Data
+        WRITE_BINARY = bytes((self.CLA, 0xD0, P1, P2, len(Data))) + bytes(Data)
         return self.sr_apdu(WRITE_BINARY)
     
     def UPDATE_BINARY(self, P1=0x00, P2=0x00, Data=[]):
         """
         APDU command to update the content of EF file with transparent structure
         
-        Data: list of data bytes to be written
+        Data: list of data bytes to be written (more than 255 bytes are sent
+              with an extended Lc field)
         call sr_apdu method
         """
-        UPDATE_BINARY = [self.CLA, 0xD6, P1, P2, len(Data)] + Data
+        if len(Data) > 255:
+            UPDATE_BINARY = bytes((self.CLA, 0xD6, P1, P2, 0x00, \
+                                   len(Data) >> 8, len(Data) & 0xFF)) + bytes(Data)
+        else:
+            UPDATE_BINARY = bytes((self.CLA, 0xD6, P1, P2, len(Data))) + bytes(Data)
+        if P1 & 0x80:
+            self.selection_changed()
         return self.sr_apdu(UPDATE_BINARY)
     
     def ERASE_BINARY(self, P1=0x00, P2=0x00, Lc=None, Data=[]):
@@ -441,9 +677,9 @@ class ISO7816(object):
         call sr_apdu method
         """
         if Lc is None: 
-            ERASE_BINARY = [self.CLA, 0x0E, P1, P2]
+            ERASE_BINARY = bytes((self.CLA, 0x0E, P1, P2))
         else: 
-            ERASE_BINARY = [self.CLA, 0x0E, P1, P2, 0x02] + Data
+            ERASE_BINARY = bytes((self.CLA, 0x0E, P1, P2, 0x02)) + bytes(Data)
         return self.sr_apdu(ERASE_BINARY)        
     
     def READ_RECORD(self, P1=0x00, P2=0x00, Le=0x00):
@@ -455,7 +691,10 @@ class ISO7816(object):
         Le: length of data bytes to be read
         call sr_apdu method
         """
-        READ_RECORD = [self.CLA, 0xB2, P1, P2, Le]
+        READ_RECORD = bytes((self.CLA, 0xB2, P1, P2, Le))
+        if P2 >> 3:
+            # SFI referencing, the EF becomes the current file
+            self.selection_changed()
         return self.sr_apdu(READ_RECORD)
     
     def WRITE_RECORD(self, P1=0x00, P2=0x00, Data=[]):
@@ -467,7 +706,7 @@ class ISO7816(object):
         Data: list of data bytes to be written in the record
         call sr_apdu method
         """
-        WRITE_RECORD = [self.CLA, 0xD2, P1, P2, len(Data)] + Data
+        WRITE_RECORD = bytes((self.CLA, 0xD2, P1, P2, len(Data))) + bytes(Data)
         return self.sr_apdu(WRITE_RECORD)
     
     def APPEND_RECORD(self, P2=0x00, Data=[]):
@@ -478,7 +717,7 @@ class ISO7816(object):
         Data: list of data bytes to be appended on the record
         call sr_apdu method
         """
-        APPEND_RECORD = [self.CLA, 0xE2, 0x00, P2, len(Data)] + Data
+        APPEND_RECORD = bytes((self.CLA, 0xE2, 0x00, P2, len(Data))) + bytes(Data)
         return self.sr_apdu(APPEND_RECORD)
     
     def UPDATE_RECORD(self, P1=0x00, P2=0x00, Data=[]):
@@ -490,7 +729,9 @@ class ISO7816(object):
         Data: list of data bytes to update the record
         call sr_apdu method
         """
-        APPEND_RECORD = [self.CLA, 0xDC, P1, P2, len(Data)] + Data
+        APPEND_RECORD = bytes((self.CLA, 0xDC, P1, P2, len(Data))) + bytes(Data)
+        if P2 >> 3:
+            self.selection_changed()
         return self.sr_apdu(APPEND_RECORD)
     
     def GET_DATA(self, P1=0x00, P2=0x00, Le=0x01):
@@ -501,7 +742,7 @@ class ISO7816(object):
         Le: number of bytes expected in the response
         call sr_apdu method
         """
-        GET_DATA = [self.CLA, 0xCA, P1, P2, Le]
+        GET_DATA = bytes((self.CLA, 0xCA, P1, P2, Le))
         return self.sr_apdu(GET_DATA)
     
     def PUT_DATA(self, P1=0x00, P2=0x00, Data=[]):
@@ -513,12 +754,12 @@ class ISO7816(object):
         call sr_apdu method
         """
         if len(Data) == 0: 
-            PUT_DATA = [self.CLA, 0xDA, P1, P2]
+            PUT_DATA = bytes((self.CLA, 0xDA, P1, P2))
         elif 1 <= len(Data) <= 255: 
-            PUT_DATA = [self.CLA, 0xDA, P1, P2, len(Data)] + Data
+            PUT_DATA = bytes((self.CLA, 0xDA, P1, P2, len(Data))) + bytes(Data)
         # should never be the case, however... who wants to try
         else:
-            PUT_DATA = [self.CLA, 0xDA, P1, P2, 0xFF] + Data[0:255]
+            PUT_DATA = bytes((self.CLA, 0xDA, P1, P2, 0xFF)) + bytes(Data[0:255])
         return self.sr_apdu(PUT_DATA)       
     
     def SELECT_FILE(self, P1=0x00, P2=0x00, Data=[0x3F, 0x00], \
@@ -528,12 +769,25 @@ class ISO7816(object):
         
         P1 and P2: selection control
         Data: list of bytes describing the file identifier or address
-        call sr_apdu method
+        call sr_apdu method, or sr_apdu_case4 when P2 asks for a response
         """
+        addr = Data
         if with_length:
-            Data = [min(len(Data), 255)] + Data
-        SELECT_FILE = [self.CLA, 0xA4, P1, P2] + Data
-        return self.sr_apdu(SELECT_FILE)
+            Data = bytes((min(len(Data), 255),)) + bytes(Data)
+        SELECT_FILE = bytes((self.CLA, 0xA4, P1, P2)) + bytes(Data)
+        if with_length and len(Data) > 1 and P2 & 0x0C != 0x0C:
+            resp = self.sr_apdu_case4(SELECT_FILE)
+        else:
+            resp = self.sr_apdu(SELECT_FILE)
+        # keep track of the ADF selected on the current channel: selecting
+        # an EF by FID keeps it, selecting anything else may change the 
+        # current DF
+        if P1 == 0x04 and resp.sw1 in (0x90, 0x61):
+            self.channel_ADF[self.channel] = tuple(addr)
+        elif P1 != 0x00 or len(addr) != 2 or addr[0] in (0x3F, 0x7F, 0x5F):
+            self.channel_ADF.pop(self.channel, None)
+        self.selection_changed()
+        return resp
     
     def VERIFY(self, P2=0x00, Data=[]):
         """
@@ -544,12 +798,12 @@ class ISO7816(object):
         call sr_apdu method
         """
         if len(Data) == 0: 
-            VERIFY = [self.CLA, 0x20, 0x00, P2]
+            VERIFY = bytes((self.CLA, 0x20, 0x00, P2))
         elif 1 <= len(Data) <= 255: 
-            VERIFY = [self.CLA, 0x20, 0x00, P2, len(Data)] + Data
+            VERIFY = bytes((self.CLA, 0x20, 0x00, P2, len(Data))) + bytes(Data)
         # should never be the case, however... who wants to try
         else: 
-            VERIFY = [self.CLA, 0x20, 0x00, P2, 0xFF] + Data[0:255]
+            VERIFY = bytes((self.CLA, 0x20, 0x00, P2, 0xFF)) + bytes(Data[0:255])
         return self.sr_apdu(VERIFY)
     
     def INTERNAL_AUTHENTICATE(self, P1=0x00, P2=0x00, Data=[]):
@@ -558,10 +812,10 @@ class ISO7816(object):
         
         P1 and P2: reference control (algo, secret key selection...)
         Data: list of bytes containing the authentication challenge
-        call sr_apdu method
+        call sr_apdu_case4 method
         """
-        INTERNAL_AUTHENTICATE = [self.CLA, 0x88, P1, P2, len(Data)] + Data
-        return self.sr_apdu(INTERNAL_AUTHENTICATE)
+        INTERNAL_AUTHENTICATE = bytes((self.CLA, 0x88, P1, P2, len(Data))) + bytes(Data)
+        return self.sr_apdu_case4(INTERNAL_AUTHENTICATE)
     
     def EXTERNAL_AUTHENTICATE(self, P1=0x00, P2=0x00, Data=[]):
         """
@@ -573,12 +827,12 @@ class ISO7816(object):
         call sr_apdu method
         """
         if len(Data) == 0: 
-            EXTERNAL_AUTHENTICATE = [self.CLA, 0x82, P1, P2]
+            EXTERNAL_AUTHENTICATE = bytes((self.CLA, 0x82, P1, P2))
         elif 1 <= len(Data) <= 255: 
-            EXTERNAL_AUTHENTICATE = [self.CLA, 0x82, P1, P2, len(Data)] + Data
+            EXTERNAL_AUTHENTICATE = bytes((self.CLA, 0x82, P1, P2, len(Data))) + bytes(Data)
         # should never be the case, however... who wants to try
         else: 
-            EXTERNAL_AUTHENTICATE = [self.CLA, 0x82, P1, P2, 0xFF] + Data[0:255]
+            EXTERNAL_AUTHENTICATE = bytes((self.CLA, 0x82, P1, P2, 0xFF)) + bytes(Data[0:255])
         return self.sr_apdu(EXTERNAL_AUTHENTICATE)
     
     def GET_CHALLENGE(self):
@@ -588,7 +842,7 @@ class ISO7816(object):
         
         call sr_apdu method
         """
-        GET_CHALLENGE = [self.CLA, 0x84, 0x00, 0x00]
+        GET_CHALLENGE = bytes((self.CLA, 0x84, 0x00, 0x00))
         return self.sr_apdu(GET_CHALLENGE)
     
     def MANAGE_CHANNEL(self, P1=0x00, P2=0x00):
@@ -600,9 +854,9 @@ class ISO7816(object):
         call sr_apdu method
         """
         if (P1, P2) == (0x00, 0x00): 
-            MANAGE_CHANNEL = [self.CLA, 0x70, P1, P2, 0x01]
+            MANAGE_CHANNEL = bytes((self.CLA, 0x70, P1, P2, 0x01))
         else:  
-            MANAGE_CHANNEL = [self.CLA, 0x70, P1, P2]
+            MANAGE_CHANNEL = bytes((self.CLA, 0x70, P1, P2))
         return self.sr_apdu(MANAGE_CHANNEL)
     
     def GET_RESPONSE(self, Le=0x01):
@@ -613,7 +867,7 @@ class ISO7816(object):
         Le: expected length of data
         call sr_apdu method
         """
-        GET_RESPONSE = [self.CLA, 0xC0, 0x00, 0x00, Le]
+        GET_RESPONSE = bytes((self.CLA, 0xC0, 0x00, 0x00, Le))
         return self.sr_apdu(GET_RESPONSE)
     
     def ENVELOPE(self, Data=[]):
@@ -625,9 +879,9 @@ class ISO7816(object):
         call sr_apdu method
         """
         if len(Data) == 0: 
-            ENVELOPE = [self.CLA, 0xC2, 0x00, 0x00]
+            ENVELOPE = bytes((self.CLA, 0xC2, 0x00, 0x00))
         elif 1 <= len(Data) <= 255: 
-            ENVELOPE = [self.CLA, 0xC2, 0x00, 0x00, len(Data)] + Data
+            ENVELOPE = bytes((self.CLA, 0xC2, 0x00, 0x00, len(Data))) + bytes(Data)
         return self.sr_apdu(ENVELOPE)
     
     def SEARCH_RECORD(self, P1=0x00, P2=0x00, Data=[]):
@@ -640,7 +894,7 @@ class ISO7816(object):
         Data: list of bytes describing a pattern to search for
         call sr_apdu method
         """
-        SEARCH_RECORD = [self.CLA, 0xA2, P1, P2, len(Data)] + Data
+        SEARCH_RECORD = bytes((self.CLA, 0xA2, P1, P2, len(Data))) + bytes(Data)
         return self.sr_apdu(SEARCH_RECORD)
     
     def DISABLE_CHV(self, P1=0x00, P2=0x00, Data=[]):
@@ -652,7 +906,7 @@ class ISO7816(object):
         Data: list of bytes for CHV value
         call sr_apdu method
         """
-        DISABLE_CHV = [self.CLA, 0x26, P1, P2, len(Data)] + Data
+        DISABLE_CHV = bytes((self.CLA, 0x26, P1, P2, len(Data))) + bytes(Data)
         return self.sr_apdu(DISABLE_CHV)
     
     def ENABLE_CHV(self, P1=0x00, P2=0x00, Data=[]):
@@ -664,7 +918,7 @@ class ISO7816(object):
         Data: list of bytes for CHV value
         call sr_apdu method
         """
-        ENABLE_CHV = [self.CLA, 0x28, P1, P2, len(Data)] + Data
+        ENABLE_CHV = bytes((self.CLA, 0x28, P1, P2, len(Data))) + bytes(Data)
         return self.sr_apdu(ENABLE_CHV)
     
     def UNBLOCK_CHV(self, P2=0x00, Data=[]):
@@ -678,9 +932,9 @@ class ISO7816(object):
         call sr_apdu method
         """
         if len(Data) != 16:
-            UNBLOCK_CHV = [self.CLA, 0x2C, 0x00, P2]
+            UNBLOCK_CHV = bytes((self.CLA, 0x2C, 0x00, P2))
         else: 
-            UNBLOCK_CHV = [self.CLA, 0x2C, 0x00, P2, 0x10] + Data
+            UNBLOCK_CHV = bytes((self.CLA, 0x2C, 0x00, P2, 0x10)) + bytes(Data)
         return self.sr_apdu(UNBLOCK_CHV) 
     
     def FETCH(self, Le=0x01):
@@ -691,7 +945,7 @@ class ISO7816(object):
         Le: expected length of data
         call sr_apdu method
         """
-        FETCH = [self.CLA, 0x12, 0x00, 0x00, Le]
+        FETCH = bytes((self.CLA, 0x12, 0x00, 0x00, Le))
         return self.sr_apdu(FETCH)
     
     def TERMINAL_RESPONSE(self, Data=[]):
@@ -700,7 +954,7 @@ class ISO7816(object):
         
         Data: list of bytes for the response to be provided to the ICC
         """
-        TERMINAL_RESP = [self.CLA, 0x14, 0x00, 0x00, len(Data)] + Data
+        TERMINAL_RESP = bytes((self.CLA, 0x14, 0x00, 0x00, len(Data))) + bytes(Data)
         return self.sr_apdu(TERMINAL_RESP)
     
     ##########################
@@ -767,11 +1021,10 @@ class ISO7816(object):
         """
         fil = {}
         # loop on the Data bytes to parse TLV'style attributes
-        toProcess = Data
-        while len(toProcess) > 0:
+        # (same TLV walk as decode_FCP())
+        for T, L, V in FCP_TLV_parser(Data):
             # TODO: seemd full compliance 
             # would require to work with the BERTLV parser...
-            [T, L, V] = first_TLV_parser(toProcess)
             if self.dbg >= 3:
                 if T in self.file_tags.keys(): 
                     Tag = self.file_tags[T]
@@ -819,12 +1072,6 @@ class ISO7816(object):
                     fil[self.file_tags[T]] = V
                 else:
                     fil[T] = V
-            
-            # truncate the data to process and loop
-            if L < 256:
-                toProcess = toProcess[L+2:]
-            else:
-                toProcess = toProcess[L+4:]
         
         # and return the file 
         return fil
@@ -1124,51 +1371,62 @@ class ISO7816(object):
         return fil
     
     
-    def read_EF(self, fil):
+    def read_EF(self, fil, offset=0, length=None, records=None):
         """
         interprets the content of file parameters (Structure, Size, Length...)
         and enriches the file dictionary passed as argument
         with "Data" key and corresponding 
         - list of bytes for EF transparent
         - list of list of bytes for cyclic or linear EF
+        
+        offset, length: byte range to read from an EF transparent
+                        (default: up to the end of the file)
+        records: record numbers to read from a cyclic or linear EF
+                 (default: all records)
         """
         # read EF transparent data
         if fil['Structure'] == 'transparent':
-            self.coms.push( self.READ_BINARY(Le=fil['Size']) )
+            if length is None or length > fil['Size'] - offset:
+                length = fil['Size'] - offset
+            self.coms.push( self.read_binary(length, offset) )
             if self.coms()[2] != (0x90, 0x00):
                 if self.dbg >= 3: 
                     log(3,  '(read_EF) %s' % self.coms())
                 return fil
-            fil['Data'] = self.coms()[3]
+            fil['Data'] = list(self.coms()[3])
         
         # read EF cyclic / linear all records data
         elif fil['Structure'] != 'transparent':
             fil['Data'] = []
             # for record data: need to check the number of recordings
             # stored in the file, and iterate for each
-            for i in range( (fil['Size'] // fil['Record Length']) ):
-                self.coms.push( self.READ_RECORD(P1=i+1, P2=0x04, \
+            if records is None:
+                records = range(1, (fil['Size'] // fil['Record Length']) + 1)
+            for i in records:
+                self.coms.push( self.READ_RECORD(P1=i, P2=0x04, \
                     Le=fil['Record Length']) )
                 if self.coms()[2] != (0x90, 0x00):
                     # should mean there is an issue 
                     # somewhere in the file parsing process
                     if self.dbg >= 2:
                         log(2, '(read_EF) error in iterating the RECORD ' \
-                            'parsing at iteration %s\n%s' % (i, self.coms()))
+                            'parsing at record %s\n%s' % (i, self.coms()))
                     return fil
-                if self.coms()[3][1:] == len(self.coms()[3][1:]) * [255]:
+                if self.coms()[3][1:] == len(self.coms()[3][1:]) * b'\xff':
                     # record is empty, contains padding only
                     pass
                 else: 
-                    fil['Data'].append(self.coms()[3])
+                    fil['Data'].append(list(self.coms()[3]))
         
         # return the [Data] for transparent or 
         # [[Record1],[Record2]...] for cyclic / linear
         return fil
     
-    def select(self, addr=[0x3F, 0x00], type="fid", with_length=True):
+    def select(self, addr=[0x3F, 0x00], type="fid", with_length=True, \
+               lazy=False, offset=0, length=None, records=None):
         """
-        self.select(addr=[0x.., 0x..], type="fid", with_length=True) 
+        self.select(addr=[0x.., 0x..], type="fid", with_length=True, 
+                    lazy=False, offset=0, length=None, records=None) 
             -> dict() on success, None on error
         
         selects the file at the given address
@@ -1193,6 +1451,12 @@ class ISO7816(object):
         with_length: correspond to the Lc byte prepended to the address
                      in the SELECT_FILE APDU
         
+        lazy: the content of an EF is not read at selection, but when the
+              ['Data'] key of the returned lazy_file is first accessed
+        offset, length, records: only read a byte range of an EF 
+                                 transparent, or the given record numbers
+                                 of a record EF (see read_EF())
+        
         APDUs exchanged available thanks to the attribute `self`.coms
         """
         # get the UICC trigger
@@ -1217,37 +1481,95 @@ class ISO7816(object):
         #    P1, P2 = 0x00, 0x0C
         # this is however not correct... commented
         
+        # when the FCP of the file is known from an earlier selection 
+        # (see self.fcp_cache), it is not requested again
+        path = self.cache_path(addr, type) if is_UICC else None
+        info = self.fcp_cache.get(path) if path else None
+        if info is not None:
+            self.coms.push(self.SELECT_FILE(P1=P1, P2=0x0C, Data=addr, \
+                with_length=with_length))
+            if self.coms()[2] == (0x90, 0x00):
+                if info.file is None:
+                    info.file = self.parse_file(info.fcp)
+                return self.__select_content(dict(info.file), addr, type, \
+                    lazy, offset, length, records)
+            # the file has changed or disappeared, select it as usual
+            self.fcp_cache.invalidate(path)
+        
         # select file and check SW; if error, returns None, 
         # else get response
         self.coms.push(self.SELECT_FILE(P1=P1, P2=P2, Data=addr, \
             with_length=with_length))
         
+        # over T=0, the response has to be fetched with GET RESPONSE
+        # (over T=1, it is returned with the SELECT_FILE command)
         # different SW codes for UICC and old ISO card (e.g. SIM)
-        if is_UICC and self.coms()[2][0] != 0x61 \
-        or not is_UICC and self.coms()[2][0] != 0x9F:
-            if self.dbg >= 3: 
-                log(3, '(select) %s' % self.coms())
-            return None
-            
-        # get response and check SW: 
+        if is_UICC and self.coms()[2][0] == 0x61 \
+        or not is_UICC and self.coms()[2][0] == 0x9F:
+            self.coms.push(self.GET_RESPONSE(Le=self.coms()[2][1]))
+        
+        # check SW and response: 
         # if error, return None, else parse file info
-        self.coms.push(self.GET_RESPONSE(Le=self.coms()[2][1]))
-        if self.coms()[2] != (0x90, 0x00):
+        if self.coms()[2] != (0x90, 0x00) or not len(self.coms()[3]):
             if self.dbg >= 3: 
                 log(3, '(select) %s' % self.coms())
             return None
         
         data = self.coms()[3]
         # take the parse_file() method from the instance:
-        # ISO7816, UICC (for USIM) or SIM
-        file = self.parse_file(data)
-        if 'Type' in file.keys() and file['Type'][0:2] == 'EF':
-            file = self.read_EF(file)
+        # ISO7816, UICC (for USIM) or SIM, the file dictionary holds
+        # lists of bytes, as documented
+        file = self.parse_file(list(data))
+        if path:
+            info = self.fcp_cache.get(path)
+            if info is None or info.fcp != bytes(data):
+                info = self.fcp_cache.put(path, file_info(data))
+            info.file = dict(file)
         
         # finally returns the whole file dictionary, 
         # containing the ['Data'] key for EF file content
+        return self.__select_content(file, addr, type, lazy, offset, length, \
+            records)
+    
+    def __select_content(self, file, addr, type, lazy, offset, length, \
+                         records):
+        # read the content of an EF, now or on first access (see select())
+        if 'Type' not in file.keys() or file['Type'][0:2] != 'EF':
+            return file
+        if not lazy:
+            return self.read_EF(file, offset, length, records)
+        file = lazy_file(self, file, offset, length, records)
+        # a file with an absolute address can be selected again, when
+        # another file is selected before its content is accessed
+        if self.cache_path(addr, type) is not None:
+            addr = list(addr)
+            file.reselect = lambda: self.select(addr, type, lazy=True) \
+                                    is not None
         return file
     
+    @staticmethod
+    def cache_path(addr, type="fid"):
+        """
+        cache_path(addr=[0x.., 0x..], type="fid") -> tuple of bytes or None
+        
+        returns the absolute path of a file, as used by self.fcp_cache,
+        for the address types of select() which do not depend on the 
+        current DF or application: "pmf" (unless the path starts with
+        0x7FFF), "aid", and "fid" for the MF
+        """
+        addr = bytes(addr)
+        if type == "aid":
+            return (addr,) if addr else None
+        elif type == "pmf":
+            if len(addr) % 2 or not addr or addr[0:2] == b'\x7F\xFF':
+                return None
+            if addr[0:2] != b'\x3F\x00':
+                addr = b'\x3F\x00' + addr
+            return tuple(addr[i:i+2] for i in range(0, len(addr), 2))
+        elif type == "fid" and addr == b'\x3F\x00':
+            return (addr,)
+        return None
+    
     ###############
     # The following may need some improvements
     ###############
@@ -1257,22 +1579,56 @@ class ISO7816(object):
         self.go_to_path(path=[0x.., 0x.., 0x.., 0x.., ..], under_AID=None)
             -> void
         
-        selects all DF addresses successively from the path given
-        uses the .select() method with "fid" as selection type 
-        works with AID number too
+        selects the last DF address of the path given, from the MF or
+        from the ADF of the given AID number
+        uses the .select_path() method, which falls back to selecting
+        all DF addresses successively when the card requires it
         """
         # check path length
         if len(path) % 2:
             log(1, '(go_to_path) path length not correct: %s' % path)
             return
-        # init under MF
-        self.select([0x3F, 0x00])
-        # init under AID if needed
+        # select under AID if needed, with a path relative to the ADF
         if isinstance(self, UICC) and under_AID is not None:
             self.select_by_aid(under_AID)
-        # select over the whole path
-        [self.select(addr, 'fid') for addr in \
-            [path[i:i+2] for i in range(0,len(path),2)]]
+            if path:
+                self.select_path(path, 'pdf')
+        elif path:
+            self.select_path(path, 'pmf')
+        else:
+            self.select([0x3F, 0x00])
+    
+    def select_path(self, path=[], type="pmf"):
+        """
+        self.select_path(path=[0x.., 0x.., 0x.., 0x.., ..], type="pmf")
+            -> dict() on success, None on error
+        
+        selects the file at the end of a path with a single SELECT_FILE
+        command, "pmf": path from MF, "pdf": path from the current DF, 
+        see select()
+        cards that do not support it (as found out with the first path, 
+        see self.path_selection) get the files of the path selected 
+        one after the other, by file id
+        """
+        if self.path_selection is not False:
+            file = self.select(path, type)
+            if file is not None:
+                self.path_selection = True
+                return file
+            if self.path_selection is not None \
+            or self.coms()[2] not in self.PATH_SELECT_SW:
+                return None
+            self.path_selection = False
+            if self.dbg:
+                log(2, '(select_path) selection by path not supported')
+        if type == "pmf":
+            self.select([0x3F, 0x00])
+        file = None
+        for i in range(0, len(path), 2):
+            file = self.select(path[i:i+2], 'fid')
+            if file is None:
+                return None
+        return file
     
     
     # the MF or AID directory structure is a dictionary:
@@ -1359,6 +1715,9 @@ class ISO7816(object):
         #
         # init to path
         self.go_to_path(dir_path, under_AID)
+        # the content of the EF found is only read when it is accessed
+        # (UICC only, the files are then selected again by path)
+        lazy = isinstance(self, UICC)
         # bruteforce child file addresses
         i, j = 0, 0
         for i in range(hi_addr[0], hi_addr[1]+1):
@@ -1372,11 +1731,14 @@ class ISO7816(object):
                     pass
                 # select by direct file id
                 else:
-                    file = self.select(addr, 'fid')
+                    file = self.select(addr, 'fid', lazy=lazy)
                     if file:
                         if self.dbg:
                             log(3, '(scan_DF) found file at path: %s' \
                                   % (dir_path + addr))
+                        if isinstance(file, lazy_file):
+                            file.reselect = self.__path_reselect( \
+                                dir_path + addr, under_AID)
                         # keep track of absolute path
                         file['Absolut Path'] = dir_path + addr
                         # add result to grow the filesystem
@@ -1399,6 +1761,17 @@ class ISO7816(object):
         self.select([0x3F, 0x00])
         return FS, child_DF
     
+    def __path_reselect(self, path, under_AID=None):
+        # returns a function that selects again a file found by scan_DF(),
+        # by its path from the MF or from the ADF of the AID number
+        def reselect():
+            if under_AID is not None:
+                if self.select_by_aid(under_AID) is None:
+                    return False
+                return self.select(path, 'pdf', lazy=True) is not None
+            return self.select(path, 'pmf', lazy=True) is not None
+        return reselect
+    
     def explore_DF(self, DF_path=[], under_AID=None, recursive=True):
         """
         self.explore_DF(dir_path=[0x.., 0x.., 0x.., 0x..], under_AID=None, \
@@ -1572,7 +1945,7 @@ class UICC(ISO7816):
         initialized on the MF
         """
         ISO7816.__init__(self, CLA=0x00)
-        self.AID = []
+        self.clear_AID()
         self.AID_GP = {}
         
         if self.dbg >= 2:
@@ -1652,13 +2025,67 @@ class UICC(ISO7816):
         fil['PIN Status'] = PIN_status
         return fil
     
-    def get_AID(self):
+    def get_capabilities(self):
+        """
+        checks EF_ATR at the MF level for the card capabilities, when they 
+        are not in the ATR already, and enables the use of extended Lc / Le
+        fields accordingly (see set_extended_length())
+        """
+        if self.capabilities is not None:
+            return
+        EF_ATR = self.select([0x2F, 0x01], type='pmf')
+        if self.dbg >= 3: 
+            log(3, '(get_capabilities) EF_ATR: %s' % EF_ATR)
+        if EF_ATR is None or 'Data' not in EF_ATR: 
+            return
+        self.set_extended_length(EF_ATR_card_capabilities(EF_ATR['Data']))
+    
+    def select_aid_channel(self, aid):
+        """
+        self.select_aid_channel(aid=[0x.., 0x.., ...]) -> bool
+        
+        routes the following commands to the logical channel of the 
+        application with the given AID: on first use, a channel is opened
+        and the ADF is selected on it, afterwards the channel is only 
+        switched to (without any APDU), as long as the ADF stays the current
+        DF there
+        if the card does not provide logical channels, the ADF is selected 
+        on the basic channel
+        returns False if the ADF selection failed
+        """
+        aid = tuple(aid)
+        channel = self.app_channels.get(aid)
+        if channel is None and self.use_channels:
+            channel = self.open_channel()
+            if channel is None:
+                if self.dbg:
+                    log(2, '(select_aid_channel) no logical channel, ' \
+                           'using the basic channel')
+                self.use_channels = False
+            else:
+                self.app_channels[aid] = channel
+        if channel is None:
+            channel = 0
+        self.set_channel(channel)
+        if self.channel_ADF.get(channel) == aid:
+            return True
+        if self.select(addr=list(aid), type='aid') is None:
+            return False
+        return True
+    
+    def get_AID(self, force=False):
         """
         checks EF_DIR at the MF level, 
         and available AID (Application ID) referenced
         
-        puts it into self.AID
+        puts it into self.AID, and the type of each application (see 
+        app_type()) into self.AID_app
+        EF_DIR is only read once per session (see self.AID_read), unless
+        force is set
         """
+        if self.AID_read and not force:
+            return
+        
         #go back to MF and select EF_DIR
         #self.select(addr=[])
         
@@ -1668,17 +2095,54 @@ class UICC(ISO7816):
             log(3, '(get_AID) EF_DIR: %s' % EF_DIR)
         if EF_DIR is None: 
             return
+        if force:
+            self.clear_AID()
+        self.AID_read = True
         
         # EF_DIR is an EF with linear fixed structure: contains records:
-        for rec in EF_DIR['Data']:
+        for aid in DIR_AIDs(EF_DIR['Data']):
             # check for a (new) AID:
-            if (rec[0], rec[2]) == (0x61, 0x4F) and len(rec) > 6 \
-            and rec[4:4+rec[3]] not in self.AID:
-                self.AID.append( rec[4:4+rec[3]] )
+            if aid not in self.AID:
+                self.AID.append( aid )
+                self.AID_app[bytes(aid)] = self.app_type(aid)
         
         #for aid in self.AID:
         #    self.interpret_AID(aid)
     
+    def clear_AID(self):
+        """
+        forgets the applications read from EF_DIR, the next call to 
+        get_AID() reads it again (e.g. after EF_DIR has been updated)
+        """
+        self.AID = []
+        self.AID_app = {}
+        self.AID_read = False
+    
+    @staticmethod
+    def app_type(aid=[]):
+        """
+        app_type(aid) -> 'USIM', 'ISIM' or None (unknown application)
+        """
+        if tuple(aid[0:5]) == (0xA0, 0x00, 0x00, 0x00, 0x87):
+            if tuple(aid[5:7]) == (0x10, 0x02):
+                return 'USIM'
+            elif tuple(aid[5:7]) == (0x10, 0x04):
+                return 'ISIM'
+        return None
+    
+    def get_app_AID(self, app='USIM'):
+        """
+        get_app_AID(app='USIM') -> AID of the first application of the 
+        given type (see app_type()), or None
+        
+        EF_DIR is read when it was not read before in the session
+        """
+        self.get_AID()
+        for aid in self.AID:
+            if self.AID_app.get(bytes(aid)) == app:
+                return aid
+        return None
+    
     @staticmethod
     def interpret_AID(aid=[]):
         """
@@ -1726,7 +2190,7 @@ class UICC(ISO7816):
             if self.coms()[2] == (0x90, 0x00):
                 # positive response, where we could read the data returned by
                 # the application
-                self.AID_GP[tuple(aid)] = BERTLV_extract(self.coms()[3])
+                self.AID_GP[tuple(aid)] = BERTLV_extract(list(self.coms()[3]))
     
     def get_ICCID(self):
         """
@@ -1737,7 +2201,7 @@ class UICC(ISO7816):
         #self.select(addr=[])
         
         # EF_ICCID is at the MF level and contains Application ID:
-        EF_ICCID = self.select([0x2F, 0xE2], type='pmf')
+        EF_ICCID = self.select([0x2F, 0xE2], type='pmf', length=10)
         if self.dbg >= 3: 
             log(3, '(get_ICCID) EF_ICCID: %s' % EF_ICCID)
         if EF_ICCID is None: 
@@ -100,12 +100,12 @@ class SIM(ISO7816):
     use self.dbg = 1 or more to print live debugging information
     """
     
-    def __init__(self, atr = None):
+    def __init__(self, atr = None, transport = None):
         """
         initialize like an ISO7816-4 card with CLA=0xA0
         can also be used for USIM working in SIM mode,
         """
-        ISO7816.__init__(self, atr, CLA=0xA0)
+        ISO7816.__init__(self, atr, CLA=0xA0, transport=transport)
         
         if self.dbg >= 2:
             log(3, '(SIM.__init__) type definition: %s' % type(self))
@@ -303,17 +303,15 @@ class SIM(ISO7816):
             return None
         # run authentication
         self.coms.push(self.INTERNAL_AUTHENTICATE(P1=0x00, P2=0x00, Data=RAND))
-        if self.coms()[2][0] != 0x9F:
+        # get authentication response (over T=1, it is already there)
+        if self.coms()[2][0] == 0x9F:
+            self.coms.push(self.GET_RESPONSE(Le=self.coms()[2][1]))
+        if self.coms()[2] != (0x90, 0x00) or not len(self.coms()[3]):
             if self.dbg >= 2: 
                 log(3, '(run_gsm_alg) %s' % self.coms())
             return None
-        # get authentication response
-        self.coms.push(self.GET_RESPONSE(Le=self.coms()[2][1]))
-        if self.coms()[2] != (0x90, 0x00):
-            if self.dbg >= 2: 
-                log(3, '(run_gsm_alg) %s' % self.coms())
-            return None
-        SRES, Kc = self.coms()[3][0:4], self.coms()[3][4:]
+        val = list(self.coms()[3])
+        SRES, Kc = val[0:4], val[4:]
         return [ SRES, Kc ]
     
     def get_imsi(self):
@@ -330,8 +328,8 @@ class SIM(ISO7816):
                 log(3, '(get_imsi) %s' % self.coms())
             return None
         
-        # select IMSI file
-        imsi = self.select([0x6F, 0x07])
+        # select IMSI file, and read the 9 bytes of the IMSI
+        imsi = self.select([0x6F, 0x07], length=9)
         if self.coms()[2] != (0x90, 0x00): 
             if self.dbg >= 2: 
                 log(3, '(get_imsi) %s' % self.coms())
@@ -439,7 +437,7 @@ class SIM(ISO7816):
             return None
         
         # select IMSI file
-        iccid = self.select([0x2F, 0xE2])
+        iccid = self.select([0x2F, 0xE2], length=10)
         if self.coms()[2] != (0x90, 0x00): 
             if self.dbg >= 2: 
                 log(3, '(get_ICCID) %s' % self.coms())
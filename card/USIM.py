@@ -177,7 +177,7 @@ class USIM(UICC):
     use self.dbg = 1 or more to print live debugging information
     """
     
-    def __init__(self, atr = None):
+    def __init__(self, atr = None, transport = None):
         """
         initializes like an ISO7816-4 card with CLA=0x00
         and checks available AID (Application ID) read from EF_DIR
@@ -185,8 +185,8 @@ class USIM(UICC):
         initializes on the MF
         """
         # initialize like a UICC
-        ISO7816.__init__(self, atr, CLA=0x00)
-        self.AID = []
+        ISO7816.__init__(self, atr, CLA=0x00, transport=transport)
+        self.clear_AID()
         
         if self.dbg >= 2:
             log(3, '(UICC.__init__) type definition: %s' % type(self))
@@ -198,33 +198,35 @@ class USIM(UICC):
         # USIM selection from AID
         if self.dbg:
             log(3, '(USIM.__init__) UICC AID found:')
-        self.get_AID()
-        for aid in self.AID:
-            if  tuple(aid[0:5]) == (0xA0, 0x00, 0x00, 0x00, 0x87) \
-            and tuple(aid[5:7]) == (0x10, 0x02) :
-                usim = self.select(addr=aid, type='aid')
-                if usim is None and self.dbg:
-                    log(2, '(USIM.__init__) USIM AID selection failed')
-                if usim is not None:
-                    self.USIM_AID = aid
-                    if self.dbg:
-                        log(3, '(USIM.__init__) USIM AID selection succeeded\n')
+        # EF_DIR is read on the basic channel, once per session
+        self.set_channel(0)
+        aid = self.get_app_AID('USIM')
+        if aid is not None:
+            # the ADF stays selected on its own logical channel
+            usim = self.select_aid_channel(aid)
+            if not usim and self.dbg:
+                log(2, '(USIM.__init__) USIM AID selection failed')
+            if usim:
+                self.USIM_AID = aid
+                if self.dbg:
+                    log(3, '(USIM.__init__) USIM AID selection succeeded\n')
 
     def SELECT_ADF_ISIM(self):
         # USIM selection from AID
         if self.dbg:
             log(3, '(ISIM.__init__) UICC AID found:')
-        self.get_AID()
-        for aid in self.AID:
-            if  tuple(aid[0:5]) == (0xA0, 0x00, 0x00, 0x00, 0x87) \
-            and tuple(aid[5:7]) == (0x10, 0x04) :
-                usim = self.select(addr=aid, type='aid')
-                if usim is None and self.dbg:
-                    log(2, '(ISIM.__init__) ISIM AID selection failed')
-                if usim is not None:
-                    self.USIM_AID = aid
-                    if self.dbg:
-                        log(3, '(ISIM.__init__) ISIM AID selection succeeded\n')
+        # EF_DIR is read on the basic channel, once per session
+        self.set_channel(0)
+        aid = self.get_app_AID('ISIM')
+        if aid is not None:
+            # the ADF stays selected on its own logical channel
+            usim = self.select_aid_channel(aid)
+            if not usim and self.dbg:
+                log(2, '(ISIM.__init__) ISIM AID selection failed')
+            if usim:
+                self.USIM_AID = aid
+                if self.dbg:
+                    log(3, '(ISIM.__init__) ISIM AID selection succeeded\n')
 
     @staticmethod
     def sw_status(sw1, sw2):
@@ -249,8 +251,8 @@ class USIM(UICC):
         reads IMSI value at address [0x6F, 0x07]
         returns IMSI string on success or None on error
         """
-        # select IMSI file
-        imsi = self.select([0x6F, 0x07])
+        # select IMSI file, and read the 9 bytes of the IMSI
+        imsi = self.select([0x6F, 0x07], length=9)
         if imsi is None: 
             return None
         # and parse the received data into the IMSI structure
@@ -446,34 +448,35 @@ class USIM(UICC):
             inp = [len(RAND)] + RAND
             
         self.coms.push( self.INTERNAL_AUTHENTICATE(P2=P2, Data=inp) )
+        # over T=1, the response comes with the command
         if self.coms()[2][0] in (0x9F, 0x61):
             self.coms.push( self.GET_RESPONSE(Le=self.coms()[2][1]) )
-            if self.coms()[2] == (0x90, 0x00):
-                val = self.coms()[3]
-                if P2 == 0x80:
-                    if self.dbg: 
-                        log(3, '(authenticate) successful 2G authentication. ' \
-                               'Get [RES, Kc]')
-                    values = LV_parser(val)
-                    # returned values are (RES, Kc)
-                    return values
-                # not adapted to 2G context with Kc, RES: to be confirmed...
-                if val[0] == 0xDB:
-                    if P2 == 0x81 and self.dbg: 
-                        log(3, '(authenticate) successful 3G authentication. ' \
-                               'Get [RES, CK, IK(, Kc)]')
-                    elif P2 == 0x84 and self.dbg: 
-                        log(3, '(authenticate) successful GBA authentication.' \
-                               ' Get [RES]')
-                    values = LV_parser(val[1:])
-                    # returned values can be (RES, CK, IK) or (RES, CK, IK, Kc)
-                    return values
-                elif val[0] == 0xDC:
-                    if self.dbg: 
-                        log(2, '(authenticate) synchronization failure. ' \
-                               'Get [AUTS]')
-                    values = LV_parser(val[1:])
-                    return values
+        if self.coms()[2] == (0x90, 0x00) and len(self.coms()[3]):
+            val = list(self.coms()[3])
+            if P2 == 0x80:
+                if self.dbg: 
+                    log(3, '(authenticate) successful 2G authentication. ' \
+                           'Get [RES, Kc]')
+                values = LV_parser(val)
+                # returned values are (RES, Kc)
+                return values
+            # not adapted to 2G context with Kc, RES: to be confirmed...
+            if val[0] == 0xDB:
+                if P2 == 0x81 and self.dbg: 
+                    log(3, '(authenticate) successful 3G authentication. ' \
+                           'Get [RES, CK, IK(, Kc)]')
+                elif P2 == 0x84 and self.dbg: 
+                    log(3, '(authenticate) successful GBA authentication.' \
+                           ' Get [RES]')
+                values = LV_parser(val[1:])
+                # returned values can be (RES, CK, IK) or (RES, CK, IK, Kc)
+                return values
+            elif val[0] == 0xDC:
+                if self.dbg: 
+                    log(2, '(authenticate) synchronization failure. ' \
+                           'Get [AUTS]')
+                values = LV_parser(val[1:])
+                return values
         #else:
         if self.dbg: 
             log(1, '(authenticate) error: %s' % self.coms())
@@ -505,16 +508,17 @@ class USIM(UICC):
         inp = [0xDE] + [len(NAF_ID)] + NAF_ID + [len(IMPI)] + IMPI
         
         self.coms.push( self.INTERNAL_AUTHENTICATE(P2=P2, Data=inp) )
+        # over T=1, the response comes with the command
         if self.coms()[2][0] in (0x9F, 0x61):
             self.coms.push( self.GET_RESPONSE(Le=self.coms()[2][1]) )
-            if self.coms()[2] == (0x90, 0x00):
-                val = self.coms()[3]
-                if val[0] == 0xDB: # not adapted to 2G context with Kc, RES
-                    if self.dbg: 
-                        log(3, '(GBA_derivation) successful GBA derivation. ' \
-                               'Get [Ks_EXT_NAF]')
-                    values = LV_parser(val[1:])
-                    return values
+        if self.coms()[2] == (0x90, 0x00) and len(self.coms()[3]):
+            val = list(self.coms()[3])
+            if val[0] == 0xDB: # not adapted to 2G context with Kc, RES
+                if self.dbg: 
+                    log(3, '(GBA_derivation) successful GBA derivation. ' \
+                           'Get [Ks_EXT_NAF]')
+                values = LV_parser(val[1:])
+                return values
         if self.dbg: 
             log(3, '(GBA_derivation) authentication failure: %s' % self.coms())
         return None
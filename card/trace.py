@@ -0,0 +1,230 @@
+# -*- coding: UTF-8 -*-
+"""
+card: Library adapted to request (U)SIM cards and other types of telco cards.
+Copyright (C) 2026 by sysmocom - s.f.m.c. GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+#################################
+# Binary APDU trace recorder
+# and replay
+#################################
+
+# file layout (all integers big endian):
+#
+# header: magic "APDUTRC1" (8 bytes)
+#         start time, ns since epoch (8 bytes)
+#         reserved (4 bytes, 0)
+#
+# records: type (1 byte)
+#          length of the command (2 bytes)
+#          length of the response (2 bytes)
+#          time of the command, ns since start of trace (8 bytes)
+#          duration of the exchange, us (4 bytes)
+#          command (TRACE_REC_APDU) or transmission protocol, 0 for T=0
+#          and 1 for T=1, (1 byte, TRACE_REC_ATR, empty in older traces)
+#          response incl. SW (TRACE_REC_APDU) or ATR (TRACE_REC_ATR)
+
+import mmap
+import time
+import atexit
+import struct
+
+from card.utils import *
+from card.transport import *
+
+TRACE_MAGIC = b'APDUTRC1'
+TRACE_HEADER = struct.Struct('>8sQ4x')
+TRACE_RECORD = struct.Struct('>BHHQI')
+
+TRACE_REC_ATR = 0x01
+TRACE_REC_APDU = 0x02
+
+
+def trace_atr(rec):
+    """
+    trace_atr(TRACE_REC_ATR record) -> (bytes(ATR), protocol)
+    """
+    if len(rec[3]):
+        return bytes(rec[4]), rec[3][0]
+    return bytes(rec[4]), 0
+
+
+class TraceWriter(object):
+    """
+    appends ATR and APDU records to a binary trace file
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'wb')
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter_ns()
+        self.file.write(TRACE_HEADER.pack(TRACE_MAGIC, self.start_ns))
+        atexit.register(self.close)
+
+    def write(self, rec_type, command, response, start, end):
+        """
+        write(record type, bytes(command), bytes(response),
+              start, end (time.perf_counter_ns() values)) -> None
+        """
+        self.file.write(TRACE_RECORD.pack(rec_type, len(command),
+                                          len(response), start - self.start,
+                                          (end - start) // 1000))
+        self.file.write(command)
+        self.file.write(response)
+
+    def close(self):
+        self.file.close()
+
+
+class TraceReader(object):
+    """
+    reads a binary trace through mmap, records are not loaded into memory
+    but returned as memoryview slices of the mapped file
+
+    iterating yields tuples:
+        (type, time (ns since start), duration (us), command, response)
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf = memoryview(self.map)
+        if len(self.buf) < TRACE_HEADER.size:
+            raise TransportError('%s is not an APDU trace' % filename)
+        magic, self.start_ns = TRACE_HEADER.unpack_from(self.buf, 0)
+        if magic != TRACE_MAGIC:
+            raise TransportError('%s is not an APDU trace' % filename)
+
+    def __iter__(self):
+        buf = self.buf
+        unpack = TRACE_RECORD.unpack_from
+        rec_size = TRACE_RECORD.size
+        offset = TRACE_HEADER.size
+        end = len(buf)
+        while offset + rec_size <= end:
+            rec_type, cmd_len, rsp_len, t, duration = unpack(buf, offset)
+            offset += rec_size
+            command = buf[offset:offset+cmd_len]
+            offset += cmd_len
+            response = buf[offset:offset+rsp_len]
+            offset += rsp_len
+            if offset > end:
+                raise TransportError('trace is truncated')
+            yield rec_type, t, duration, command, response
+
+    def close(self):
+        """
+        close() -> None
+
+        unmaps the trace, if records returned by the iterator are still
+        referenced, the mapping is released when they are garbage collected
+        """
+        self.buf.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+
+
+class RecordingTransport(Transport):
+    """
+    wraps another transport and records the ATR and all APDU exchanges
+    into a binary trace
+    """
+
+    def __init__(self, transport, filename):
+        self.transport = transport
+        self.writer = TraceWriter(filename)
+
+    def __atr(self, start):
+        self.atr = self.transport.atr
+        self.reader = self.transport.reader
+        self.protocol = self.transport.protocol
+        self.writer.write(TRACE_REC_ATR, bytes((self.protocol,)), self.atr,
+                          start, time.perf_counter_ns())
+        return self.atr
+
+    def connect(self):
+        start = time.perf_counter_ns()
+        self.transport.connect()
+        self.__atr(start)
+
+    def disconnect(self):
+        self.transport.disconnect()
+        self.writer.file.flush()
+
+    def reset(self):
+        start = time.perf_counter_ns()
+        self.transport.reset()
+        return self.__atr(start)
+
+    def transmit(self, apdu):
+        start = time.perf_counter_ns()
+        data, sw = self.transport.transmit(apdu)
+        self.writer.write(TRACE_REC_APDU, apdu, data + bytes(sw), start,
+                          time.perf_counter_ns())
+        return data, sw
+
+
+class TraceReplayTransport(Transport):
+    """
+    plays back a binary trace, each command APDU must match the recorded
+    one, otherwise TransportError is raised
+    """
+    reader = 'replay'
+
+    def __init__(self, filename):
+        self.trace = TraceReader(filename)
+        self.records = iter(self.trace)
+        self.pending = None
+        # the first record must be an ATR, it is consumed on connect()
+        rec = self.__next()
+        if rec[0] != TRACE_REC_ATR:
+            raise TransportError('trace %s does not start with ATR' % filename)
+        self.atr, self.protocol = trace_atr(rec)
+        self.pending = rec
+
+    def __next(self):
+        if self.pending:
+            rec, self.pending = self.pending, None
+            return rec
+        try:
+            return next(self.records)
+        except StopIteration:
+            raise TransportError('end of trace reached')
+
+    def __next_atr(self):
+        rec = self.__next()
+        if rec[0] != TRACE_REC_ATR:
+            self.pending = rec
+        else:
+            self.atr, self.protocol = trace_atr(rec)
+        return self.atr
+
+    def connect(self):
+        self.__next_atr()
+
+    def reset(self):
+        return self.__next_atr()
+
+    def transmit(self, apdu):
+        rec_type, t, duration, command, response = self.__next()
+        if rec_type != TRACE_REC_APDU or command != apdu:
+            raise TransportError('APDU %s does not match trace (expected %s)'
+                                 % (bytes(apdu).hex(),
+                                    bytes(command).hex() or 'ATR'))
+        return bytes(response[:-2]), (response[-2], response[-1])
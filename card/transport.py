@@ -0,0 +1,303 @@
+# -*- coding: UTF-8 -*-
+"""
+card: Library adapted to request (U)SIM cards and other types of telco cards.
+Copyright (C) 2026 by sysmocom - s.f.m.c. GmbH
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+#################################
+# Transports used by the ISO7816
+# class to exchange APDUs with
+# a card
+#################################
+
+import socket
+import struct
+
+from smartcard.CardType import AnyCardType
+from smartcard.CardType import ATRCardType
+from smartcard.CardRequest import CardRequest
+from smartcard.CardConnection import CardConnection
+from smartcard.Exceptions import CardConnectionException
+
+from card.utils import *
+
+
+class TransportError(Exception):
+    """
+    raised when a transport fails to exchange data with the card
+    """
+    pass
+
+
+def atr_protocols(atr):
+    """
+    atr_protocols(atr) -> set of int
+
+    returns the transmission protocols (0 for T=0, 1 for T=1, ...) indicated
+    in the TDi bytes of an ATR, T=0 is implied when none is indicated,
+    T=15 (global interface bytes) is not a transmission protocol
+    """
+    protocols = set()
+    if len(atr) < 2:
+        return {0}
+    Y = atr[1] >> 4
+    i = 2
+    while Y & 8:
+        # skip TAi, TBi and TCi, when present
+        i += bin(Y & 7).count('1')
+        if i >= len(atr):
+            break
+        TD = atr[i]
+        if TD & 0x0F != 15:
+            protocols.add(TD & 0x0F)
+        Y = TD >> 4
+        i += 1
+    return protocols or {0}
+
+
+class Transport(object):
+    """
+    abstract transport, moves APDUs between the ISO7816 class and a card
+
+    subclasses implement connect(), disconnect(), reset() and transmit(),
+    set self.atr (bytes), self.reader (string) and self.protocol (int, the
+    transmission protocol in use: 0 for T=0, 1 for T=1)
+    """
+    dbg = 0
+
+    atr = b''
+    reader = ''
+    protocol = 0
+
+    def connect(self):
+        """
+        connect() -> None
+
+        powers up the card and makes self.atr available
+        """
+        pass
+
+    def disconnect(self):
+        """
+        disconnect() -> None
+
+        ends the session with the card
+        """
+        pass
+
+    def reset(self):
+        """
+        reset() -> bytes(ATR)
+
+        resets the card, all selections and security states are lost
+        """
+        self.disconnect()
+        self.connect()
+        return self.atr
+
+    def transmit(self, apdu):
+        """
+        transmit(bytes(apdu)) -> (bytes(response data), (sw1, sw2))
+
+        sends a command APDU and returns the response data and status word
+        """
+        raise NotImplementedError
+
+
+class PcscTransport(Transport):
+    """
+    transport to a card in a PC/SC reader, uses "pyscard" library services
+
+    T=1 is negotiated when the ATR indicates it, otherwise (or if the reader
+    refuses it) T=0 is used
+    """
+
+    def __init__(self, atr=None, timeout=1):
+        """
+        waits (max. timeout seconds) for a card, optionally only for a
+        card that matches the given ATR (list of bytes)
+        """
+        if (atr):
+            cardtype = ATRCardType(list(atr))
+        else:
+            cardtype = AnyCardType()
+        cardrequest = CardRequest(timeout=timeout, cardType=cardtype)
+        self.cardservice = cardrequest.waitforcard()
+        self.connection = self.cardservice.connection
+
+    def connect(self):
+        try:
+            self.connection.connect()
+        except CardConnectionException as err:
+            raise TransportError(str(err))
+        self.reader = self.connection.getReader()
+        self.atr = bytes(self.connection.getATR())
+        if 1 in atr_protocols(self.atr) \
+        and self.connection.getProtocol() != CardConnection.T1_protocol:
+            try:
+                self.connection.disconnect()
+                self.connection.connect(CardConnection.T1_protocol)
+            except CardConnectionException as err:
+                if self.dbg:
+                    log(2, '(PcscTransport) T=1 refused, using T=0: %s' % err)
+                try:
+                    self.connection.connect(CardConnection.T0_protocol)
+                except CardConnectionException as err:
+                    raise TransportError(str(err))
+        if self.connection.getProtocol() == CardConnection.T1_protocol:
+            self.protocol = 1
+        else:
+            self.protocol = 0
+
+    def disconnect(self):
+        self.connection.disconnect()
+
+    def transmit(self, apdu):
+        try:
+            data, sw1, sw2 = self.connection.transmit(list(apdu))
+        except CardConnectionException as err:
+            raise TransportError(str(err))
+        return bytes(data), (sw1, sw2)
+
+
+###########################################################
+# remote transport: exchanges APDUs with a reader proxy
+# over a TCP socket
+#
+# messages in both directions: type (1 byte), length
+# (2 bytes, big endian), payload
+###########################################################
+
+REMOTE_MSG_APDU = 0x01
+REMOTE_MSG_RESET = 0x02
+REMOTE_MSG_CONNECT = 0x03
+REMOTE_MSG_DISCONNECT = 0x04
+REMOTE_MSG_PROTOCOL = 0x05
+REMOTE_MSG_ERROR = 0xFF
+
+REMOTE_DEFAULT_PORT = 9998
+
+def remote_send(sock, msg_type, payload=b''):
+    sock.sendall(struct.pack('>BH', msg_type, len(payload)) + payload)
+
+def remote_recv(sock):
+    header = b''
+    while len(header) < 3:
+        chunk = sock.recv(3 - len(header))
+        if not chunk:
+            raise TransportError('connection to remote reader lost')
+        header += chunk
+    msg_type, length = struct.unpack('>BH', header)
+    payload = b''
+    while len(payload) < length:
+        chunk = sock.recv(length - len(payload))
+        if not chunk:
+            raise TransportError('connection to remote reader lost')
+        payload += chunk
+    return msg_type, payload
+
+
+class RemoteTransport(Transport):
+    """
+    transport to a card that is attached to a remote reader proxy, see
+    serve_transport()
+    """
+
+    def __init__(self, host='localhost', port=REMOTE_DEFAULT_PORT):
+        self.reader = 'remote %s:%u' % (host, port)
+        try:
+            self.sock = socket.create_connection((host, port))
+        except OSError as err:
+            raise TransportError(str(err))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def __request(self, msg_type, payload=b''):
+        remote_send(self.sock, msg_type, payload)
+        msg_type, payload = remote_recv(self.sock)
+        if msg_type == REMOTE_MSG_ERROR:
+            raise TransportError(payload.decode('utf-8', 'replace'))
+        return payload
+
+    def __protocol(self):
+        # servers that do not know REMOTE_MSG_PROTOCOL only support T=0
+        try:
+            self.protocol = self.__request(REMOTE_MSG_PROTOCOL)[0]
+        except (TransportError, IndexError):
+            self.protocol = 0
+
+    def connect(self):
+        self.atr = self.__request(REMOTE_MSG_CONNECT)
+        self.__protocol()
+
+    def disconnect(self):
+        self.__request(REMOTE_MSG_DISCONNECT)
+
+    def reset(self):
+        self.atr = self.__request(REMOTE_MSG_RESET)
+        self.__protocol()
+        return self.atr
+
+    def transmit(self, apdu):
+        response = self.__request(REMOTE_MSG_APDU, bytes(apdu))
+        if len(response) < 2:
+            raise TransportError('short response from remote reader')
+        return response[:-2], (response[-2], response[-1])
+
+
+def serve_transport(transport, host='localhost', port=REMOTE_DEFAULT_PORT):
+    """
+    serve_transport(transport, host, port) -> None
+
+    makes a transport (e.g. a PcscTransport) available to RemoteTransport
+    clients, one client at a time, runs forever
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(1)
+    while True:
+        sock, addr = server.accept()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if transport.dbg:
+            log(3, '(serve_transport) client %s:%u connected' % addr)
+        try:
+            while True:
+                msg_type, payload = remote_recv(sock)
+                try:
+                    if msg_type == REMOTE_MSG_APDU:
+                        data, sw = transport.transmit(payload)
+                        response = data + bytes(sw)
+                    elif msg_type == REMOTE_MSG_RESET:
+                        response = transport.reset()
+                    elif msg_type == REMOTE_MSG_CONNECT:
+                        transport.connect()
+                        response = transport.atr
+                    elif msg_type == REMOTE_MSG_DISCONNECT:
+                        transport.disconnect()
+                        response = b''
+                    elif msg_type == REMOTE_MSG_PROTOCOL:
+                        response = bytes((transport.protocol,))
+                    else:
+                        raise TransportError('unknown message type %u'
+                                             % msg_type)
+                except TransportError as err:
+                    remote_send(sock, REMOTE_MSG_ERROR, str(err).encode())
+                else:
+                    remote_send(sock, msg_type, response)
+        except (TransportError, OSError):
+            pass
+        sock.close()
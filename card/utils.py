@@ -26,7 +26,9 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 import sys
 
 from collections import deque
+from collections import OrderedDict
 from smartcard.util import toBytes
+from smartcard.util import toHexString
 
 
 ###############
@@ -70,18 +72,17 @@ BER_TAG = {
 
 # from python 2.6, format('b') allows to use 0b10010110 notation: 
 # much convenient
+# bits of each byte value, MSB first, see "byteToBit()"
+BYTE_BITS = tuple( tuple((b >> (7-i)) & 1 for i in range(8)) 
+                   for b in range(256) )
+
 def byteToBit(byte):
     '''
     byteToBit(0xAB) -> [1, 0, 1, 0, 1, 0, 1, 1]
     
     converts a byte integer value into a list of bits
     '''
-    bit = [0, 0, 0, 0, 0, 0, 0, 0]
-    for i in range(8):
-        if byte % pow(2, i+1):
-            bit[7-i] = 1
-            byte = byte - pow(2, i)
-    return bit
+    return list(BYTE_BITS[byte])
 
 # equivalent to the pyscard function "toASCIIBytes"
 # new version of python (>2.6) seems to have a built-in "bytes" type
@@ -117,6 +118,19 @@ def byteToString(bytelist):
     else:
         return bytes(bytelist)
 
+def LV_iter(bytelist):
+    '''
+    LV_iter([0x02, 0xAB, 0xCD, 0x01, 0x12]) -> generator of [171, 205], [18]
+    
+    walks the Length-Value records of a list of bytes by offset, 
+    length coded on 1 byte, each value is a slice of the input
+    '''
+    off, end = 0, len(bytelist)
+    while off < end:
+        l = bytelist[off]
+        yield bytelist[off+1:off+1+l]
+        off += 1 + l
+
 def LV_parser(bytelist):
     '''
     LV_parser([0x02, 0xAB, 0xCD, 0x01, 0x12, 0x34]) -> [[171, 205], [18], []]
@@ -125,126 +139,143 @@ def LV_parser(bytelist):
     returns a list of list of bytes
     length coded on 1 byte
     '''
-    values = []
-    while len(bytelist) > 0:
-        l = bytelist[0]
-        values.append( bytelist[1:1+l] )
-        bytelist = bytelist[1+l:]
-    return values
+    return list(LV_iter(bytelist))
 
-def first_TLV_parser(bytelist):
+def first_TLV_parser(bytelist, offset=0):
     '''
     first_TLV_parser([0xAA, 0x02, 0xAB, 0xCD, 0xFF, 0x00]) -> (170, 2, [171, 205])
     
     parses first TLV format record in a list of bytelist 
+    (or the one at offset)
     returns a 3-Tuple: Tag, Length, Value
     Value is a list of bytes
     parsing of length is ETSI'style 101.220
     '''
-    Tag = bytelist[0]
-    if bytelist[1] == 0xFF:
-        Len = bytelist[2]*256 + bytelist[3]
-        Val = bytelist[4:4+Len]
+    Tag = bytelist[offset]
+    if bytelist[offset+1] == 0xFF:
+        Len = (bytelist[offset+2] << 8) + bytelist[offset+3]
+        Val = bytelist[offset+4:offset+4+Len]
     else:
-        Len = bytelist[1]
-        Val = bytelist[2:2+Len]
+        Len = bytelist[offset+1]
+        Val = bytelist[offset+2:offset+2+Len]
     return (Tag, Len, Val)
 
+def TLV_iter(bytelist, padding=True):
+    '''
+    TLV_iter([0xAA, ..., 0xFF]) -> generator of (T, L, [V]), (T, L, [V]), ...
+    
+    walks the TLV records of a list of bytes by offset, length coding as 
+    in "first_TLV_parser()", each Value is a slice of the input (a 
+    memoryview when the input is one, so that nothing is copied)
+    stops at the first 0xFF tag (padding bytes), unless padding is False
+    '''
+    off, end = 0, len(bytelist)
+    while off + 1 < end:
+        T, L = bytelist[off], bytelist[off+1]
+        if T == 0xFF and padding:
+            break
+        off += 2
+        if L == 0xFF:
+            L = (bytelist[off] << 8) + bytelist[off+1]
+            off += 2
+        yield (T, L, bytelist[off:off+L])
+        off += L
+
 def TLV_parser(bytelist):
     '''
     TLV_parser([0xAA, ..., 0xFF]) -> [(T, L, [V]), (T, L, [V]), ...]
     
-    loops on the input list of bytes with the "first_TLV_parser()" function
+    parses the TLV records of a list of bytes with "TLV_iter()"
     returns a list of 3-Tuples
     '''
-    ret = []
-    while len(bytelist) > 0:
-        T, L, V = first_TLV_parser(bytelist)
-        if T == 0xFF:
-            # padding bytes
-            break
-        ret.append( (T, L, V) )
-        # need to manage length of L
-        if L > 0xFE: 
-            bytelist = bytelist[ L+4 : ]
-        else: 
-            bytelist = bytelist[ L+2 : ]
-    return ret
+    return list(TLV_iter(bytelist))
 
-def first_BERTLV_parser(bytelist):
+def FCP_TLV_parser(Data):
+    '''
+    FCP_TLV_parser([0x82, 0x02, 0x78, 0x21, 0x83, 0x02, 0x3F, 0x00]) 
+        -> generator of (130, 2, [120, 33]), (131, 2, [63, 0])
+    
+    walks the TLV records of Data, see "TLV_iter()", 0xFF tags are not 
+    treated as padding
+    '''
+    return TLV_iter(Data, padding=False)
+
+BER_TAG_CLASS = ('universal', 'applicative', 'contextual', 'private')
+
+def first_BERTLV_parser(bytelist, offset=0):
     '''
     first_BERTLV_parser([0xAA, 0x02, 0xAB, 0xCD, 0xFF, 0x00]) 
         -> ([1, 'contextual', 'constructed', 10], [1, 2], [171, 205])
     
     parses first BER-TLV format record in a list of bytes
+    (or the one at offset)
     returns a 3-Tuple: Tag, Length, Value
-        Tag: [Tag class, Tag DO, Tag number]
+        Tag: [Tag length, Tag class, Tag DO, Tag number]
         Length: [Length of length, Length value]
         Value: [Value bytes list]
-    parsing of length is ETSI'style 101.220
     '''
     # Tag class and DO
-    byte0 = byteToBit(bytelist[0])
-    if byte0[0:2] == [0, 0]:
-        Tag_class = 'universal'
-    elif byte0[0:2] == [0, 1]:
-        Tag_class = 'applicative'
-    elif byte0[0:2] == [1, 0]:
-        Tag_class = 'contextual'
-    elif byte0[0:2] == [1, 1]:
-        Tag_class = 'private'
-    if byte0[2:3] == [0]:
-        Tag_DO = 'primitive'
-    elif byte0[2:3] == [1]:
+    byte0 = bytelist[offset]
+    Tag_class = BER_TAG_CLASS[byte0 >> 6]
+    if byte0 & 0x20:
         Tag_DO = 'constructed'
+    else:
+        Tag_DO = 'primitive'
     # Tag coded with more than 1 byte
-    i = 0
-    if byte0[3:8] == [1, 1, 1, 1, 1]:
-        Tag_bits = byteToBit(bytelist[1])[1:8]
-        i += 1
-        while byteToBit(bytelist[i])[0] == 1:
+    i = offset
+    if byte0 & 0x1F == 0x1F:
+        Tag_num = 0
+        while True:
             i += 1
-            Tag_bits += byteToBit(bytelist[i])[1:8]
+            Tag_num = (Tag_num << 7) + (bytelist[i] & 0x7F)
+            if not bytelist[i] & 0x80:
+                break
     # Tag coded with 1 byte
     else:
-        Tag_bits = byte0[3:8]
-    
-    # Tag number calculation
-    Tag_num = 0
-    for j in range(len(Tag_bits)):
-        Tag_num += Tag_bits[len(Tag_bits)-j-1] * pow(2, j)
+        Tag_num = byte0 & 0x1F
+    i += 1
     
     # Length coded with more than 1 byte (BER long form)
-    if bytelist[i+1] & 0x80:
-        Len_num = bytelist[i+1] - 0x80
-        Len = reduce(lambda x,y: (x<<8)+y, bytelist[i+2:i+2+Len_num])
-        Val = bytelist[i+2+Len_num:i+2+Len_num+Len]
+    if bytelist[i] & 0x80:
+        Len_num = 1 + (bytelist[i] & 0x7F)
+        Len = 0
+        for j in range(i+1, i+Len_num):
+            Len = (Len << 8) + bytelist[j]
     
     # Length coded with 1 byte (BER short form)
     else:
         Len_num = 1
-        Len = bytelist[i+1]
-        Val = bytelist[i+2:i+2+Len]
-
-    return ([i+1, Tag_class, Tag_DO, Tag_num], [Len_num, Len], Val)
+        Len = bytelist[i]
+    i += Len_num
+    
+    return ([i-offset-Len_num, Tag_class, Tag_DO, Tag_num], [Len_num, Len],
+            bytelist[i:i+Len])
     #return ([Tag_class, Tag_DO, Tag_num], Len, Val)
 
-def BERTLV_parser(bytelist):
+def BERTLV_iter(bytelist):
     '''
-    BERTLV_parser([0xAA, ..., 0xFF]) -> [([T], L, [V]), ([T], L, [V]), ...]
+    BERTLV_iter([0xAA, ..., 0xFF]) -> generator of ([T], L, [V]), ...
     
-    loops on the input bytes with the "first_BERTLV_parser()" function
-    returns a list of 3-Tuples containing BERTLV records
+    walks the BER-TLV records of a list of bytes by offset, with the 
+    "first_BERTLV_parser()" function
     '''
-    ret = []
-    while len(bytelist) > 0:
-        T, L, V = first_BERTLV_parser(bytelist)
+    off, end = 0, len(bytelist)
+    while off < end:
+        T, L, V = first_BERTLV_parser(bytelist, off)
         #if T == 0xFF: 
         #    break # padding bytes
-        ret.append( (T[1:], L[1], V) )
+        yield (T[1:], L[1], V)
         # need to manage lengths of Tag and Length
-        bytelist = bytelist[ T[0] + L[0] + L[1] : ]
-    return ret
+        off += T[0] + L[0] + L[1]
+
+def BERTLV_parser(bytelist):
+    '''
+    BERTLV_parser([0xAA, ..., 0xFF]) -> [([T], L, [V]), ([T], L, [V]), ...]
+    
+    parses the input bytes with the "BERTLV_iter()" function
+    returns a list of 3-Tuples containing BERTLV records
+    '''
+    return list(BERTLV_iter(bytelist))
 
 def BERTLV_extract(bytelist):
     '''
@@ -306,19 +337,113 @@ def decode_OID(data=[]):
         arcs[0] = arcs[0]-80
         return '2 ' + ' '.join(['%i' % v for v in data])
 
+# digits of each byte value for "decode_BCD()": 4 LSB first, padding 
+# nibbles (> 9) are skipped
+BCD_DIGITS = tuple( ''.join(str(n) for n in (b & 0x0F, b >> 4) if n < 10) 
+                    for b in range(256) )
+# swaps the nibbles of each byte value, with bytes.translate()
+SWAP_NIBBLES = bytes( ((b & 0x0F) << 4) | (b >> 4) for b in range(256) )
+# deletes the padding nibbles from a hex string, with str.translate()
+BCD_PADDING = str.maketrans('', '', 'abcdef')
+
 def decode_BCD(data=[]):
     '''
     decode_BCD([0x21, 0xFE, 0xA3]) -> '121415310'
     
     to decode serial number (IMSI, ICCID...) from list of bytes
     '''
-    string = ''
-    for B in data:
-        # 1st digit (4 LSB), can be padding (e.g. 0xF)
-        if (B&0x0F) < 10: string += str(B&0x0F)
-        # 2nd digit (4 MSB), can be padding (e.g. 0xF)
-        if (B>>4) < 10: string += str(B>>4)
-    return string
+    return ''.join([BCD_DIGITS[B] for B in data])
+
+def decode_BCD_batch(rows=[]):
+    '''
+    decode_BCD_batch([[0x98, 0x88, ...], [0x98, 0x88, ...]]) 
+        -> ['8988...', '8988...']
+    
+    decodes a column of serial numbers (IMSI, ICCID...) like 
+    "decode_BCD()", all the rows are converted at once
+    '''
+    rows = [bytes(r) for r in rows]
+    digits = b''.join(rows).translate(SWAP_NIBBLES).hex()
+    ret, pos = [], 0
+    for r in rows:
+        ret.append( digits[pos:pos+2*len(r)].translate(BCD_PADDING) )
+        pos += 2*len(r)
+    return ret
+
+def ATR_historical_bytes(atr=[]):
+    '''
+    ATR_historical_bytes([0x3B, 0x9F, 0x96, 0x80, ...]) -> [0x80, 0x31, ...]
+    
+    returns the historical bytes of an ATR (ISO 7816-3, 8.2.1), their number
+    is given by T0, they follow the interface bytes
+    '''
+    if len(atr) < 2:
+        return []
+    K = atr[1] & 0x0F
+    Y = atr[1] >> 4
+    i = 2
+    while True:
+        # skip TAi, TBi, TCi and TDi
+        i += bin(Y).count('1')
+        if not Y & 8 or i > len(atr):
+            break
+        Y = atr[i-1] >> 4
+    return list(atr[i:i+K])
+
+def ATR_card_capabilities(atr=[]):
+    '''
+    ATR_card_capabilities([0x3B, 0x9F, ...]) -> [0xFE, 0x21, 0x1B] or None
+    
+    returns the card capabilities (compact-TLV data object with tag 7, 
+    ISO 7816-4, 8.1.1.2.7) from the historical bytes of an ATR, 
+    or None when they are not present
+    '''
+    hist = ATR_historical_bytes(atr)
+    if not hist:
+        return None
+    # category indicator: 0x00, the last 3 bytes are a status indicator
+    # 0x80, only compact-TLV data objects
+    if hist[0] == 0x00:
+        hist = hist[1:-3]
+    elif hist[0] == 0x80:
+        hist = hist[1:]
+    else:
+        return None
+    i = 0
+    while i < len(hist):
+        T, L = hist[i] >> 4, hist[i] & 0x0F
+        if T == 7:
+            return hist[i+1:i+1+L]
+        i += 1 + L
+    return None
+
+def EF_ATR_card_capabilities(data=[]):
+    '''
+    EF_ATR_card_capabilities([0x80, 0x31, ..., 0x47, 0x03, ...]) -> 
+        [0x.., 0x.., 0x..] or None
+    
+    returns the card capabilities from the content of EF.ATR, where they
+    are a BER-TLV data object with tag 0x47 (ISO 7816-4, 8.2.1.1), 
+    or None when they are not present
+    '''
+    i = 0
+    while i + 1 < len(data):
+        T = data[i]
+        if T in (0x00, 0xFF):
+            # padding
+            i += 1
+            continue
+        if T & 0x1F == 0x1F:
+            # 2-bytes tag, e.g. 0x7F66
+            i += 1
+        L = data[i+1]
+        if T == 0x47:
+            return list(data[i+2:i+2+L])
+        i += 2 + L
+    return None
+
+# sum of the digits of each decimal digit doubled, for "compute_luhn()"
+LUHN_DOUBLE = (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)
 
 def compute_luhn(digit_str=''):
     '''
@@ -329,12 +454,14 @@ def compute_luhn(digit_str=''):
     if not digit_str.isdigit():
         print('you must provide a string of digits')
         return
-    # append 0
-    d = [int(c) for c in digit_str + '0']
-    # sum of odd digits
-    cs = sum(d[-1::-2])
-    # sum of (sum of digits(even digits * 2))
-    cs += sum([(v*2)%9 if v != 9 else 9 for v in d[-2::-2]])
+    # sum of the digits, every second digit being doubled, from the right
+    # and starting with the doubled one (the luhn code is appended)
+    cs = 0
+    double = True
+    for c in reversed(digit_str):
+        if double: cs += LUHN_DOUBLE[ord(c) - 0x30]
+        else: cs += ord(c) - 0x30
+        double = not double
     # modulo 10: luhn checksum
     cs = cs%10
     # return the luhn code
@@ -389,6 +516,132 @@ def make_graph(FS, master_name='(0x3F, 0x00)\nMF'):
     
     
 
+#######################################################
+# Response to an APDU, as returned by ISO7816.sr_apdu #
+#######################################################
+class apdu_response(object):
+    '''
+    response of the card to an APDU command
+    
+    behaves like the former sr_apdu() return value:
+        [ string(apdu sent information),
+          string(SW codes interpretation),
+          2-tuple(sw1, sw2),
+          list(response bytes) ]
+    but only keeps the raw values, the strings are computed on access
+    '''
+    __slots__ = ('card', 'apdu', 'sw1', 'sw2', 'data')
+    
+    def __init__(self, card, apdu, sw1, sw2, data):
+        self.card = card
+        self.apdu = apdu
+        self.sw1 = sw1
+        self.sw2 = sw2
+        self.data = data
+    
+    @property
+    def sw(self):
+        return (self.sw1, self.sw2)
+    
+    @property
+    def apdu_str(self):
+        '''
+        sent APDU, with the INS name when available
+        '''
+        name = self.card.INS_dic.get(self.apdu[1])
+        if name:
+            return '%s apdu: %s' % (name, toHexString(list(self.apdu)))
+        return 'apdu: %s' % toHexString(list(self.apdu))
+    
+    @property
+    def sw_str(self):
+        '''
+        status word, with its interpretation
+        '''
+        return 'sw1, sw2: %s - %s' % (toHexString([self.sw1, self.sw2]),
+                                      self.card.sw_status(self.sw1, self.sw2))
+    
+    def __getitem__(self, index):
+        # fast path for the SW and the data, which are accessed most
+        if index == 2:
+            return (self.sw1, self.sw2)
+        elif index == 3:
+            return self.data
+        return list(self)[index]
+    
+    def __len__(self):
+        return 4
+    
+    def __iter__(self):
+        yield self.apdu_str
+        yield self.sw_str
+        yield self.sw
+        yield self.data
+    
+    def __repr__(self):
+        return repr(list(self))
+
+
+#######################################################
+# File returned by ISO7816.select(lazy=True)          #
+#######################################################
+class lazy_file(dict):
+    '''
+    file dictionary of an EF, as returned by ISO7816.select(), without 
+    the content: the ['Data'] key is read from the card on first access
+    (file['Data'], file.get('Data'), or write_dict()), once
+    
+    if another file has been selected on the card in the meantime, the
+    file is selected again with reselect() (a function returning True 
+    on success), when there is none, or it fails, 'Data' is missing as 
+    it is when the content can not be read
+    '''
+    
+    def __init__(self, card, fil, offset=0, length=None, records=None):
+        dict.__init__(self, fil)
+        self.card = card
+        self.channel = card.channel
+        self.seq = card.channel_select.get(card.channel)
+        self.reselect = None
+        self.range = (offset, length, records)
+    
+    def __fetch(self):
+        card, self.card = self.card, None
+        channel = card.channel
+        card.set_channel(self.channel)
+        try:
+            if card.channel_select.get(self.channel) != self.seq \
+            and (self.reselect is None or not self.reselect()):
+                if card.dbg:
+                    log(2, '(lazy_file) file can not be selected again')
+                return
+            card.read_EF(self, *self.range)
+        finally:
+            card.set_channel(channel)
+    
+    def __missing__(self, key):
+        if key == 'Data' and self.card is not None:
+            self.__fetch()
+            if 'Data' in dict.keys(self):
+                return dict.__getitem__(self, 'Data')
+        raise KeyError(key)
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def keys(self):
+        if self.card is not None:
+            return list(dict.keys(self)) + ['Data']
+        return dict.keys(self)
+    
+    def __contains__(self, key):
+        return dict.__contains__(self, key) \
+               or key == 'Data' and self.card is not None
+
+
 #######################################################
 # Generic class to keep track of sent / received APDU #
 #######################################################
@@ -433,3 +686,190 @@ class apdu_stack:
         except IndexError:
             return None
 
+
+
+#######################################################
+# Cache of the selection responses of the files seen  #
+# during a session, by absolute path                  #
+#######################################################
+class file_info(object):
+    '''
+    what is known about a file from the response to its selection:
+    the FCP, and when the FCP has been parsed (see decode_FCP()), the file
+    size, structure (file descriptor byte b3-b1, 0 for a DF), record 
+    length, SFI (None when not indicated), life cycle status byte and 
+    whether it is a DF (or ADF)
+    
+    file: the parse_file() dictionary, kept by ISO7816.select()
+    '''
+    __slots__ = ('fcp', 'size', 'structure', 'record_length', 'sfi', 'df',
+                 'life_cycle', 'file')
+    
+    def __init__(self, fcp):
+        self.fcp = bytes(fcp)
+        self.size = None
+        self.structure = None
+        self.record_length = None
+        self.sfi = None
+        self.df = None
+        self.life_cycle = None
+        self.file = None
+
+
+def decode_FCP(fcp, info=None):
+    '''
+    decode_FCP(fcp, info=None) -> file_info
+    
+    decodes the FCP template returned when selecting a file (ETSI TS 
+    102 221, 11.1.1.3), tag 0x62 and length included, in one pass over 
+    a memoryview of it: file size (tag 0x80, 0 when absent), DF or EF, 
+    structure and record length (tag 0x82), SFI (tag 0x88, an empty 
+    value means no SFI) and life cycle status (tag 0x8A)
+    completes info when given, otherwise returns a new file_info
+    raises ValueError when fcp is not a FCP template
+    '''
+    if info is None:
+        info = file_info(fcp)
+    buf = memoryview(fcp)
+    if len(buf) < 2 or buf[0] != 0x62:
+        raise ValueError('not a FCP template: %s' % bytes(buf[:1]).hex())
+    # template length, BER coded
+    if buf[1] == 0x81:
+        off, end = 3, 3 + buf[2]
+    elif buf[1] == 0x82:
+        off, end = 4, 4 + ((buf[2] << 8) + buf[3])
+    else:
+        off, end = 2, 2 + buf[1]
+    
+    info.size = 0
+    info.df = False
+    info.structure = 0
+    for T, L, V in FCP_TLV_parser(buf[off:end]):
+        if T == 0x80:
+            info.size = int.from_bytes(V, 'big')
+        elif T == 0x82 and L:
+            # file descriptor byte, data coding byte, and for record 
+            # oriented files the record length (11.1.1.4.3)
+            info.df = V[0] & 0x38 == 0x38
+            info.structure = V[0] & 0x07
+            if L >= 4:
+                info.record_length = (V[2] << 8) + V[3]
+        elif T == 0x88 and L:
+            info.sfi = V[0] >> 3
+        elif T == 0x8A and L:
+            info.life_cycle = V[0]
+    return info
+
+def decode_FCPs(fcps):
+    '''
+    decode_FCPs([fcp, fcp, ...]) -> [file_info, file_info, ...]
+    
+    decodes many FCP templates with "decode_FCP()", None for each one 
+    which is not a FCP template
+    '''
+    ret = []
+    for fcp in fcps:
+        try:
+            ret.append( decode_FCP(fcp) )
+        except (ValueError, IndexError):
+            ret.append( None )
+    return ret
+
+def DIR_AIDs(records):
+    '''
+    DIR_AIDs([record, record, ...]) -> [AID, AID, ...]
+    
+    extracts the AID (tag 0x4F) of the application templates (tag 0x61) 
+    found in the records of EF_DIR (ETSI TS 102 221, 13.1), in the order 
+    of the records, without duplicates; empty records (0xFF) are skipped
+    '''
+    ret = []
+    for rec in records:
+        if len(rec) < 2 or rec[0] != 0x61:
+            continue
+        for T, L, V in TLV_iter(rec[2:2+rec[1]]):
+            if T == 0x4F:
+                if L and V not in ret:
+                    ret.append( V )
+                break
+    return ret
+
+def diff_spans(old, new, gap=0):
+    '''
+    diff_spans(old, new, gap=0) -> [(start, end), ...]
+
+    returns the ranges of new that differ from old, bytes of new beyond
+    the end of old always differ; ranges that are separated by less than
+    gap equal bytes are merged into a single range
+    '''
+    spans = []
+    diff = [i for i, (a, b) in enumerate(zip(old, new)) if a != b]
+    if len(new) > len(old):
+        diff.extend(range(len(old), len(new)))
+    for i in diff:
+        if spans and i - spans[-1][1] < gap:
+            spans[-1][1] = i + 1
+        else:
+            spans.append( [i, i + 1] )
+    return [tuple(s) for s in spans]
+
+
+class fcp_cache(object):
+    '''
+    least recently used cache of file_info objects, by absolute path
+    
+    the path is a tuple of bytes: the FIDs from the MF, e.g.
+        (b'\\x3F\\x00', b'\\x7F\\x20', b'\\x6F\\x07')
+    or, for the files of an application, the AID of the ADF followed by 
+    the FIDs from the ADF
+    
+    the FCP of a file only changes when the file structure is changed
+    (e.g. CREATE FILE, DELETE FILE, RESIZE FILE, or changes of the life 
+    cycle status), invalidate() must then be called
+    '''
+    
+    def __init__(self, limit=64):
+        self.limit = limit
+        self.files = OrderedDict()
+    
+    def get(self, path):
+        '''
+        get(path) -> file_info or None
+        '''
+        info = self.files.get(path)
+        if info is not None:
+            self.files.move_to_end(path)
+        return info
+    
+    def put(self, path, info):
+        '''
+        put(path, file_info) -> file_info
+        
+        adds (or replaces) a file, the least recently used one is dropped
+        when the limit is reached
+        '''
+        self.files[path] = info
+        self.files.move_to_end(path)
+        if len(self.files) > self.limit:
+            self.files.popitem(last=False)
+        return info
+    
+    def invalidate(self, path=None):
+        '''
+        invalidate(path=None) -> None
+        
+        drops a file and everything below it, or the whole cache when
+        no path is given
+        '''
+        if path is None:
+            self.files.clear()
+            return
+        n = len(path)
+        for p in [p for p in self.files if p[0:n] == path]:
+            del self.files[p]
+    
+    def __contains__(self, path):
+        return path in self.files
+    
+    def __len__(self):
+        return len(self.files)
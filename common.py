@@ -24,19 +24,68 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from utils import *
+from card.transport import *
+from card.trace import *
+import simulator
 import sys, getopt
 
-COMMON_GETOPTS = "hfa:J:nN:lL:kK:tT:oO:C:sSip"
+COMMON_GETOPTS = "hfa:J:nN:lL:kK:tT:oO:C:sSipr:R:U"
 COMMON_GETOPTS_LONG = ["help", "force", "adm1=", "set-imsi=", "mnclen",
 		       "set-mnclen=", "milenage", "set-milenage=", "key",
 		       "set-key=", "auth", "set-auth=", "opc", "set-op=",
 		       "set-opc=", "seq-parameters", "reset-seq-parameters"
-		       "iccid", "aid"]
+		       "iccid", "aid", "transport=", "record=",
+		       "skip-unchanged"]
+
+# Common tasks, in the order in which they are carried out, which is also
+# the order of their output: the option (attribute of Common) that requests
+# the task, None for steps that are always carried out, and the step itself.
+# The order must be kept, each show task shows the contents as they were
+# left by the tasks before it.
+COMMON_TASKS = [
+	("write_imsi", lambda c: c.sim.write_imsi(c.write_imsi)),
+	("show_mnclen", lambda c: c.sim.show_mnclen()),
+	("write_mnclen", lambda c: c.sim.write_mnclen(c.write_mnclen)),
+	("write_milenage", lambda c: c.sim.write_milenage_params(c.write_milenage)),
+	("show_milenage", lambda c: c.sim.show_milenage_params()),
+	("write_key", lambda c: c.sim.write_key_params(c.write_key)),
+	("show_key", lambda c: c.sim.show_key_params()),
+	("show_auth", lambda c: c.sim.show_auth_params()),
+	("write_auth", lambda c: c._write_auth()),
+	("show_opc", lambda c: c.sim.show_opc_params()),
+	("write_op", lambda c: c.sim.write_opc_params(0, c.write_op)),
+	("write_opc", lambda c: c.sim.write_opc_params(1, c.write_opc)),
+	("show_seq_par", lambda c: c.sim.show_milenage_sqn_params()),
+	("reset_seq_par", lambda c: c.sim.reset_milenage_sqn_params()),
+	(None, lambda c: c.sim.flush_staged()),
+	("show_iccid", lambda c: c.sim.show_iccid()),
+	("show_aid", lambda c: c.sim.show_aid()),
+]
+
+# Create a transport from its commandline specification, returns None for
+# PC/SC, which is the default.
+def transport_from_spec(spec):
+	kind, sep, arg = spec.partition(':')
+	if kind == "pcsc" and not arg:
+		return None
+	elif kind == "sim" and arg:
+		args = arg.split(':', 1)
+		return simulator.sim_create(*args)
+	elif kind == "replay" and arg:
+		return TraceReplayTransport(arg)
+	elif kind == "remote" and arg:
+		host, sep, port = arg.partition(':')
+		if port:
+			return RemoteTransport(host, int(port))
+		return RemoteTransport(host)
+	raise ValueError("invalid transport specification: %s" % spec)
 
 # Parse common commandline options and keep them as flags
 class Common():
 
 	sim = None
+	transport = None
+	record = None
 
 	show_helptext = None
 	force = False
@@ -57,6 +106,7 @@ class Common():
 	reset_seq_par = False
 	show_iccid = False
 	show_aid = False
+	skip_unchanged = False
 
 	# This flag specifies whether the commandline options should offer writing auth parameters (algorithm to use
 	# for authentication). The commandline options are not implemented separately for each card since the method
@@ -119,6 +169,16 @@ class Common():
 				self.show_iccid = True
 			elif opt in ("-p", "--aid"):
 				self.show_aid = True
+			elif opt in ("-r", "--transport"):
+				try:
+					self.transport = transport_from_spec(arg)
+				except (ValueError, OSError, TransportError) as err:
+					print(" * Error: %s" % str(err))
+					sys.exit(2)
+			elif opt in ("-R", "--record"):
+				self.record = arg
+			elif opt in ("-U", "--skip-unchanged"):
+				self.skip_unchanged = True
 
 		# Check for ADM1 key
 		if not self.adm1:
@@ -126,6 +186,16 @@ class Common():
 			print("")
 			sys.exit(1)
 
+		# Record all APDUs exchanged with the card
+		if self.record:
+			try:
+				if self.transport is None:
+					self.transport = PcscTransport()
+				self.transport = RecordingTransport(self.transport, self.record)
+			except Exception as err:
+				print(" * Error: unable to record APDU trace: %s" % str(err))
+				sys.exit(2)
+
 		# Set flags for specific options
 		self._options(opts)
 
@@ -161,6 +231,10 @@ class Common():
 		print("   -S  --reset-seq-parameters ..... Reset MILENAGE SEQ/SQN parameters to default")
 		print("   -i  --iccid .................... Show ICCID")
 		print("   -p  --aid ...................... Show AID list (installed applications)")
+		print("   -r  --transport SPEC ........... Card access: pcsc (default), sim:MODEL[:STATEFILE],")
+		print("                                    replay:TRACEFILE or remote:HOST[:PORT]")
+		print("   -R  --record TRACEFILE ......... Record all APDUs into a binary trace")
+		print("   -U  --skip-unchanged ........... Only write files whose contents differ")
 		self._helptext()
 
 
@@ -172,59 +246,45 @@ class Common():
 		if self.sim.admin_auth(self.adm1, self.force) == False:
 			exit(1)
 
-		# First run the card specific tasks
-		self._execute()
-
-		# And then the common tasks
-		if self.write_imsi:
-			self.sim.write_imsi(self.write_imsi)
-
-		if self.show_mnclen:
-			self.sim.show_mnclen()
-
-		if self.write_mnclen:
-			self.sim.write_mnclen(self.write_mnclen)
-
-		if self.write_milenage:
-			self.sim.write_milenage_params(self.write_milenage)
-
-		if self.show_milenage:
-			self.sim.show_milenage_params()
-
-		if self.write_key:
-			self.sim.write_key_params(self.write_key)
-
-		if self.show_key:
-			self.sim.show_key_params()
-
-		if self.show_auth:
-			self.sim.show_auth_params()
+		# Compare files against their new contents before writing them
+		self.sim.skip_unchanged = self.skip_unchanged
 
-		if self.write_auth:
-			if self.write_auth_4g5g and len(self.write_auth) > 2:
-				self.sim.write_auth_params(self.write_auth[0], self.write_auth[1], self.write_auth[2])
-			else:
-				self.sim.write_auth_params(self.write_auth[0], self.write_auth[1])
+		# Changes to the proprietary files are staged and the contents
+		# of the files are kept, so that each file is read and written at
+		# most once, even when options are combined (e.g. -T, -K and -C)
+		self.sim.begin_staging()
 
-		if self.show_opc:
-			self.sim.show_opc_params()
-
-		if self.write_op:
-			self.sim.write_opc_params(0, self.write_op)
-
-		if self.write_opc:
-			self.sim.write_opc_params(1, self.write_opc)
+		# First run the card specific tasks, and then the common tasks,
+		# when a task fails (invalid parameters raise ValueError), the
+		# staged changes are dropped
+		try:
+			self._execute()
+			for step in self.__steps():
+				step(self)
+		except ValueError as err:
+			print(" * Error: %s" % str(err))
+			print("")
+			self.sim.drop_staged()
+			sys.exit(1)
+		except BaseException:
+			self.sim.drop_staged()
+			raise
 
-		if self.show_seq_par:
-			self.sim.show_milenage_sqn_params()
+		print("Done!")
 
-		if self.reset_seq_par:
-			self.sim.reset_milenage_sqn_params()
 
-		if self.show_iccid:
-			self.sim.show_iccid()
+	# Steps of COMMON_TASKS for the options that are set, in the order of
+	# the table. The steps are not reordered, the files are read once while
+	# changes are staged (see __common_execute) and the MF is only selected
+	# when a step needs it (see Sysmo_usim._init).
+	def __steps(self):
+		return [step for option, step in COMMON_TASKS
+			if option is None or getattr(self, option)]
 
-		if self.show_aid:
-			self.sim.show_aid()
 
-		print("Done!")
+	# Set the authentication algorithms (option -T)
+	def _write_auth(self):
+		if self.write_auth_4g5g and len(self.write_auth) > 2:
+			self.sim.write_auth_params(self.write_auth[0], self.write_auth[1], self.write_auth[2])
+		else:
+			self.sim.write_auth_params(self.write_auth[0], self.write_auth[1])
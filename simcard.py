@@ -38,6 +38,17 @@ GSM_SIM_EF_AD = [0x6f, 0xAD]
 GSM_SIM_EF_ICCID = [0x2F, 0xE2]
 GSM_USIM_EF_DIR = [0x2F, 0x00] # See also: 3GPP TS 31.102 Table 105
 
+# Short file identifiers of standard EFs, by parent (the MF, or the AID
+# prefix of the application), see also ETSI TS 102 221, chapter 13 and
+# 3GPP TS 31.102, chapter 4.2
+GSM_USIM_AID_PREFIX = b'\xa0\x00\x00\x00\x87\x10\x02'
+GSM_SFI = {
+	(b'\x3f\x00', b'\x2f\xe2') : 0x02, # EF.ICCID
+	(b'\x3f\x00', b'\x2f\x00') : 0x1e, # EF.DIR
+	(GSM_USIM_AID_PREFIX, b'\x6f\x07') : 0x07, # EF.IMSI
+	(GSM_USIM_AID_PREFIX, b'\x6f\xad') : 0x03, # EF.AD
+}
+
 # Card types
 GSM_SIM = 0
 GSM_USIM = 1
@@ -57,13 +68,17 @@ GSM_SIM_INS_UPDATE_RECORD_PREV = 0x03
 GSM_SIM_INS_UPDATE_RECORD_ABS = 0x04
 
 class Card_res_apdu():
-	apdu = None
-	sw = None
+	__slots__ = ('apdu', 'sw')
+
+	def __init__(self):
+		self.apdu = None
+		self.sw = None
 
-	# convert Benoit Michau style result to sysmocom style result
+	# convert Benoit Michau style result to sysmocom style result, the
+	# response data is not copied, slices of self.apdu are memoryviews
 	def from_mich(self, mich):
-		self.apdu = mich[3]
-		self.sw = [ mich[2][0], mich[2][1] ]
+		self.apdu = memoryview(mich.data)
+		self.sw = [ mich.sw1, mich.sw2 ]
 
 	def __str__(self):
 		dump = ""
@@ -74,98 +89,413 @@ class Card_res_apdu():
 		dump += ", SW: " + hexdump(self.sw)
 		return dump
 
+# Selection state of a logical channel, as far as it is known to
+# Simcard.select(): the absolute path of the current DF (see
+# ISO7816.fcp_cache, None when unknown), the current DF and the current
+# file (the current DF itself or an EF in it) as (fid, response, file_info)
+# tuples, and the number of the selection that lead there (see
+# ISO7816.selection_changed)
+class Card_sel_state():
+	__slots__ = ('seq', 'path', 'df', 'cur')
+
+	def __init__(self, seq, path, df, cur):
+		self.seq = seq
+		self.path = path
+		self.df = df
+		self.cur = cur
+
 # A class to abstract a simcard.
 class Simcard():
 
 	card = None
 	filelen = 0 #length of the currently selected file
+	sel_state = None #selection state by logical channel
+	mf_deferred = False #the MF is to be selected (see select_mf)
+	mf_deferred_seq = None #selection on the basic channel at that time
+	contents = None #contents of transparent EFs by absolute path (see keep_contents)
+	capabilities_checked = False #EF.ATR was checked (see __check_capabilities)
 	has_isim = False
 	has_usim = False
 
 	# Constructor: Create a new simcard object
-	def __init__(self, cardtype = GSM_USIM, atr = None):
+	def __init__(self, cardtype = GSM_USIM, atr = None, transport = None):
+		self.sel_state = {}
 		if cardtype == GSM_USIM:
-			self.card = USIM(atr)
+			self.card = USIM(atr, transport)
 			self.usim = True
 
-			# Detect ISIM / USIM applications
-			self.card.get_AID()
-			AID = self.card.AID
-			for a in AID:
-				if a[0:7] == [0xA0, 0x00, 0x00, 0x00, 0x87, 0x10, 0x04]:
-					self.has_isim = True
-				elif a[0:7] == [0xA0, 0x00, 0x00, 0x00, 0x87, 0x10, 0x02]:
-					self.has_usim = True
+			# Detect ISIM / USIM applications, EF_DIR has been read
+			# already (see USIM.SELECT_ADF_USIM)
+			self.has_isim = self.card.get_app_AID('ISIM') is not None
+			self.has_usim = self.card.get_app_AID('USIM') is not None
 		else:
-			self.card = SIM(atr)
+			self.card = SIM(atr, transport)
 			self.usim = False
 
 	# Find the right class byte, depending on the simcard type
 	def __get_cla(self, usim):
 		return self.card.CLA
 
-	# Get file size from FCP
-	def __get_len_from_tlv(self, fcp):
-		# Note: This has been taken from http://git.osmocom.org/pysim/tree/pySim/commands.py,
-		# but pySim uses ascii-hex strings for its internal data representation. We use
-		# regular lists with integers, so we must convert to an ascii-hex string first:
-		fcp =  ''.join('{:02x}'.format(x) for x in fcp)
-
-		# see also: ETSI TS 102 221, chapter 11.1.1.3.1 Response for MF,
-		# DF or ADF
-		from pytlv.TLV import TLV
-		tlvparser = TLV(['82', '83', '84', 'a5', '8a', '8b', '8c', '80', 'ab', 'c6', '81', '88'])
-
-		# pytlv is case sensitive!
-		fcp = fcp.lower()
-
-		if fcp[0:2] != '62':
-			raise ValueError('Tag of the FCP template does not match, expected 62 but got %s'%fcp[0:2])
-
-		# Unfortunately the spec is not very clear if the FCP length is
-		# coded as one or two byte vale, so we have to try it out by
-		# checking if the length of the remaining TLV string matches
-		# what we get in the length field.
-		# See also ETSI TS 102 221, chapter 11.1.1.3.0 Base coding.
-		exp_tlv_len = int(fcp[2:4], 16)
-		if len(fcp[4:])/2 == exp_tlv_len:
-			skip = 4
-		else:
-			exp_tlv_len = int(fcp[2:6], 16)
-			if len(fcp[4:])/2 == exp_tlv_len:
-				skip = 6
-
-		# Skip FCP tag and length
-		tlv = fcp[skip:]
-		tlv_parsed = tlvparser.parse(tlv)
-
-		if '80' in tlv_parsed:
-			return int(tlv_parsed['80'], 16)
-		else:
-			return 0
-
-	# Get the file length from a response (select)
-	def __len(self, res, p2):
-		if p2 == 0x04:
-			return self.__get_len_from_tlv(res)
+	# Return the selection state of the current channel, when it is still
+	# valid, that is no other selection was made on the channel since
+	# (e.g. by the card library) and the card was not reset
+	def __get_sel_state(self):
+		channel = self.card.channel
+		state = self.sel_state.get(channel)
+		if state and state.seq != self.card.channel_select.get(channel):
+			del self.sel_state[channel]
+			return None
+		return state
+
+	# Return the selection state of the current channel (see
+	# __get_sel_state) and the absolute path of the current DF, None when
+	# unknown. Without a known state, the current DF is only known for an
+	# application selected by the card library.
+	def __get_df_path(self):
+		state = self.__get_sel_state()
+		if state:
+			return state, state.path
+		adf = self.card.channel_ADF.get(self.card.channel)
+		return None, (bytes(adf),) if adf else None
+
+	# Return the absolute path of the file that a FID refers to, when it
+	# follows from the current DF (see also ETSI TS 102 221, chapter
+	# 8.4.1): the MF, the current application, the parent DF, a child of
+	# the MF, or a file below the current DF that was seen before. is_df
+	# tells what the FID was found to be, once the card was asked.
+	def __get_path(self, df_path, fid, is_df = None):
+		if fid == b'\x3f\x00':
+			return (fid,)
+		if fid == b'\x7f\xff':
+			adf = self.card.channel_ADF.get(self.card.channel)
+			return (bytes(adf),) if adf else None
+		if df_path is None:
+			return None
+		if df_path + (fid,) in self.card.fcp_cache:
+			return df_path + (fid,)
+		if len(df_path) > 1 and df_path[-2] == fid:
+			return df_path[:-1]
+		# An EF is always a child of the current DF, a DF may also be a
+		# child of the parent DF, unless the current DF is the MF
+		if is_df == False or df_path == (b'\x3f\x00',):
+			return df_path + (fid,)
+		return None
+
+	# Send a SELECT command and get the FCP of the selected file. When
+	# the FCP is in the cache (see ISO7816.fcp_cache), it is not
+	# requested again. Returns the response and the file_info, which is
+	# None on failure.
+	def __select_file(self, p1, data, path):
+		res = Card_res_apdu()
+		info = self.card.fcp_cache.get(path) if path and self.usim else None
+		if info is not None:
+			res.from_mich(self.card.SELECT_FILE(P1 = p1, P2 = 0x0C, Data = data))
+			if res.sw == [0x90, 0x00]:
+				res.apdu = memoryview(info.fcp)
+				if info.size is None:
+					decode_FCP(info.fcp, info)
+				return res, info
+			# The file has changed or disappeared
+			self.card.fcp_cache.invalidate(path)
+
+		res.from_mich(self.card.SELECT_FILE(P1 = p1, P2 = 0x04, Data = data))
+
+		# Over T=0 the FCP has to be fetched with GET RESPONSE, over T=1
+		# it is returned along with the SELECT command
+		if res.sw[0] == 0x61:
+			res.from_mich(self.card.GET_RESPONSE(res.sw[1]))
+
+		# Stop here, on failure, the selection on the card is unknown
+		if res.sw != [0x90, 0x00] or len(res.apdu) == 0:
+			self.sel_state.pop(self.card.channel, None)
+			return res, None
+
+		return res, decode_FCP(res.apdu)
+
+	# Return the selection of a file as (fid, response, file_info), as if
+	# it was selected, from the FCP cache, or None if it is not cached
+	def __get_cached_sel(self, path):
+		info = self.card.fcp_cache.get(path)
+		if info is None or info.size is None:
+			return None
+		res = Card_res_apdu()
+		res.apdu = memoryview(info.fcp)
+		res.sw = [0x90, 0x00]
+		return (path[-1], res, info)
+
+	# Remember the selection made on the current channel
+	def __set_sel_state(self, df_path, df, cur):
+		channel = self.card.channel
+		self.sel_state[channel] = \
+			Card_sel_state(self.card.channel_select.get(channel), df_path, df, cur)
+
+	# Return the absolute path of the current EF on the current channel,
+	# None when it is not known or the current file is a DF
+	def __get_ef_path(self):
+		state, df_path = self.__get_df_path()
+		if not state or not df_path or not state.cur or state.cur[2].df:
+			return None
+		return df_path + (state.cur[0],)
+
+	# Make the MF the current DF of the basic channel. The SELECT command
+	# is deferred until a file is accessed relative to the current DF. It
+	# is not sent at all when a file is selected by its path from the MF
+	# first, or when the selection on the basic channel is changed
+	# otherwise (e.g. by the card library). An application that is
+	# selected on the basic channel (without logical channels, see
+	# UICC.select_aid_channel) is left right away, otherwise the card
+	# library would take it as still selected.
+	def select_mf(self):
+		if self.usim:
+			self.card.set_channel(0)
+		if self.card.channel_ADF.get(0):
+			return self.select(GSM_SIM_MF)
+		self.mf_deferred = True
+		self.mf_deferred_seq = self.card.channel_select.get(0)
+
+	# Carry out a deferred selection of the MF (see select_mf), before a
+	# file is accessed relative to the current DF of the basic channel
+	def __select_deferred_mf(self):
+		if not self.mf_deferred or self.card.channel != 0:
+			return
+		self.mf_deferred = False
+		if self.card.channel_select.get(0) == self.mf_deferred_seq:
+			self.select(GSM_SIM_MF)
+
+	# Check EF.ATR for extended length support, in case the ATR does not
+	# tell. Extended length is only of use over T=1 and for transfers
+	# that do not fit into a short APDU, so EF.ATR is read before the
+	# first such transfer only. It is read on the basic channel, the
+	# current file is selected again afterwards.
+	def __check_capabilities(self, length):
+		if not self.usim or self.capabilities_checked or length <= 255 \
+		   or self.card.protocol != 1:
+			return
+		if self.card.capabilities is not None:
+			self.capabilities_checked = True
+			return
+		path = self.__get_ef_path() or self.__get_df_path()[1]
+		if path is None:
+			return
+		self.capabilities_checked = True
+		channel = self.card.channel
+		self.card.set_channel(0)
+		self.card.get_capabilities()
+		self.card.set_channel(channel)
+		if channel != 0:
+			return
+		if path[0] == b'\x3f\x00':
+			self.select_path(path[1:])
 		else:
-			return int(res[-1][4:8], 16)
+			self.card.select_aid_channel(list(path[0]))
+			for fid in path[1:]:
+				self.select(fid)
+
+	# Keep the contents of the transparent EFs that are read or written,
+	# so that each file is read from the card only once. The contents
+	# are only valid as long as nobody else changes the files, so they
+	# are kept on request only (e.g. while the tasks of a tool are
+	# carried out) and dropped with keep_contents(False).
+	def keep_contents(self, keep = True):
+		if not keep:
+			self.contents = None
+		elif self.contents is None:
+			self.contents = {}
+
+	# Return the kept contents of the EF at path (see keep_contents) as if
+	# they were read with READ BINARY, None when they are not known
+	def __get_contents(self, path, length, offset, buf):
+		data = self.contents.get(path) if self.contents and path else None
+		if data is None or offset + length > len(data):
+			return None
+		if buf is None:
+			buf = bytearray(length)
+		buf = memoryview(buf)
+		buf[:length] = data[offset:offset + length]
+		res = Card_res_apdu()
+		res.apdu = buf[:length]
+		res.sw = [ 0x90, 0x00 ]
+		return res
 
-	# Select a file and retrieve its length
+	# Keep the data that was read from or written to the EF at path,
+	# starting at offset (see keep_contents)
+	def __put_contents(self, path, data, offset):
+		if self.contents is None or not path:
+			return
+		kept = self.contents.get(path, bytearray())
+		if offset <= len(kept):
+			kept[offset:offset + len(data)] = bytes(data)
+			self.contents[path] = kept
+
+	# Drop the kept contents after a write. The written EF may be linked
+	# to other EFs (e.g. SYSMO_ISIMSJA2_LINKS), so only its own contents
+	# (path) are still known afterwards.
+	def __drop_contents(self, path = None):
+		if self.contents:
+			kept = self.contents.get(path)
+			self.contents.clear()
+			if kept is not None:
+				self.contents[path] = kept
+
+	# Select a file and retrieve its length. The MF (and everything that
+	# is selected from there) is accessed through the basic logical
+	# channel, the applications keep their own channels (see
+	# UICC.select_aid_channel)
+	#
+	# Selecting the current file or the current DF does not change
+	# anything on the card (ETSI TS 102 221, chapter 8.4.1), so the
+	# response of the previous selection is returned without sending a
+	# SELECT command. Files that have been selected before are selected
+	# without requesting their FCP again, the FCP is taken from the cache
+	# (see ISO7816.fcp_cache).
 	def select(self, fid):
 		self.filelen = 0
-		p2 = 0x04
-		res = Card_res_apdu()
-		res.from_mich(self.card.SELECT_FILE(P2 = p2, Data = fid))
-
-		# Stop here, on failure
-		if res.sw[0] != 0x61:
+		fid = bytes(fid)
+		if fid == b'\x3f\x00':
+			if self.usim:
+				self.card.set_channel(0)
+			self.mf_deferred = False
+		else:
+			self.__select_deferred_mf()
+
+		state, df_path = self.__get_df_path()
+		if state:
+			for sel in (state.cur, state.df):
+				if sel and sel[0] == fid:
+					state.cur = sel
+					self.filelen = sel[2].size
+					return sel[1]
+
+		path = self.__get_path(df_path, fid)
+		res, info = self.__select_file(0x00, fid, path)
+		if info is None:
 			return res
+		if path is None:
+			path = self.__get_path(df_path, fid, info.df)
+		if path:
+			self.card.fcp_cache.put(path, info)
+		self.filelen = info.size
+
+		# Selecting an EF by FID keeps the current DF, an EF is only
+		# found as child of the current DF
+		sel = (fid, res, info)
+		if info.df:
+			self.__set_sel_state(path, sel, sel)
+		else:
+			self.__set_sel_state(df_path, state.df if state else None, sel)
+		return res
 
-		res.from_mich(self.card.GET_RESPONSE(res.sw[1]))
-		self.filelen = self.__len(res.apdu, p2)
+	# Select a file by its path from the MF (list of FIDs). The file is
+	# selected with a single SELECT command, unless the card does not
+	# support it (see ISO7816.select_path), then the FIDs are selected
+	# one after the other.
+	def select_path(self, path):
+		path = tuple(bytes(fid) for fid in path)
+		if not path:
+			return self.select(GSM_SIM_MF)
+		if self.usim:
+			self.card.set_channel(0)
+		abs_path = (b'\x3f\x00',) + path
+		self.mf_deferred = False
+
+		# When the file or its parent is the current DF, there is
+		# nothing to gain, select() knows what to do
+		state = self.__get_sel_state()
+		if state and state.path in (abs_path, abs_path[:-1]):
+			return self.select(path[-1])
+
+		if self.card.path_selection is not False:
+			self.filelen = 0
+			res, info = self.__select_file(0x08, b''.join(path), abs_path)
+			if info is not None:
+				self.card.path_selection = True
+				self.card.fcp_cache.put(abs_path, info)
+				self.filelen = info.size
+
+				# The last DF on the path becomes the current DF
+				sel = (path[-1], res, info)
+				if info.df:
+					self.__set_sel_state(abs_path, sel, sel)
+				else:
+					df = self.__get_cached_sel(abs_path[:-1])
+					self.__set_sel_state(abs_path[:-1], df, sel)
+				return res
+			if self.card.path_selection is not None \
+			or tuple(res.sw) not in self.card.PATH_SELECT_SW:
+				return res
+			self.card.path_selection = False
+
+		res = self.select(GSM_SIM_MF)
+		for fid in path:
+			res = self.select(fid)
+			if res.sw != [0x90, 0x00]:
+				break
 		return res
 
+	# Find the SFI of an EF in the current DF (df_path, see __get_df_path),
+	# from the FCP cache or the table of standard EFs, returns None when
+	# the EF has to be selected
+	def __get_sfi(self, df_path, fid):
+		if not self.usim or not df_path:
+			return None
+		info = self.card.fcp_cache.get(df_path + (fid,))
+		if info is not None and info.size is not None:
+			return info.sfi
+		parent = df_path[-1]
+		if len(parent) > 2:
+			parent = parent[0:7]
+		return GSM_SFI.get((parent, fid))
+
+	# Update the selection state after an EF was referenced by SFI, on
+	# success, the EF is the current file now, the current DF does not
+	# change in any case
+	def __set_sfi_state(self, state, df_path, fid, success):
+		cur = None
+		if success:
+			cur = self.__get_cached_sel(df_path + (fid,))
+		if cur:
+			self.filelen = cur[2].size
+		self.__set_sel_state(df_path, state.df if state else None, cur)
+
+	# Read a transparent EF in the current DF. The EF is referenced by its
+	# SFI when it is known, so that no SELECT is needed, otherwise it is
+	# selected first. Afterwards, the EF is the current file.
+	def read_binary_ef(self, fid, length, offset = 0, buf = None):
+		fid = bytes(fid)
+		self.__select_deferred_mf()
+		state, df_path = self.__get_df_path()
+		if state and state.cur and state.cur[0] == fid:
+			return self.read_binary(length, offset, buf)
+		sfi = self.__get_sfi(df_path, fid) if offset < 256 else None
+		if sfi is not None:
+			self.__check_capabilities(length)
+			self.filelen = 0
+			res = Card_res_apdu()
+			res.from_mich(self.card.read_binary(length, offset, buf, sfi))
+			self.__set_sfi_state(state, df_path, fid, res.sw == [0x90, 0x00])
+			if res.sw == [0x90, 0x00]:
+				self.__put_contents(df_path + (fid,), res.apdu, offset)
+				return res
+		self.select(fid)
+		return self.read_binary(length, offset, buf)
+
+	# Read a record of a record oriented EF in the current DF, see also
+	# read_binary_ef()
+	def read_record_ef(self, fid, length, rec_no = 0):
+		fid = bytes(fid)
+		self.__select_deferred_mf()
+		state, df_path = self.__get_df_path()
+		sfi = self.__get_sfi(df_path, fid)
+		if sfi is not None:
+			self.filelen = 0
+			res = Card_res_apdu()
+			res.from_mich(self.card.READ_RECORD(rec_no, (sfi << 3) | GSM_SIM_INS_READ_RECORD_ABS, length))
+			self.__set_sfi_state(state, df_path, fid, res.sw == [0x90, 0x00])
+			if res.sw == [0x90, 0x00]:
+				return res
+		self.select(fid)
+		return self.read_record(length, rec_no)
+
 	# Perform card holder verification
 	def verify_chv(self, chv, chv_no):
 		res = Card_res_apdu()
@@ -177,24 +507,48 @@ class Simcard():
 		res = self.card.VERIFY(P2 = chv_no)
 		return res[2][1] & 0x0F
 
-	# Perform file operation (Write)
-	def update_binary(self, data, offset = 0):
-		offs_high = (offset >> 8) & 0xFF
-		offs_low = offset & 0xFF
+	# Perform file operation (Write), data that does not fit into a
+	# single APDU is written in chunks. When the current file contents
+	# (old) are given, only the bytes that changed are written.
+	def update_binary(self, data, offset = 0, old = None):
+		self.__select_deferred_mf()
+		self.__check_capabilities(len(data))
+		path = self.__get_ef_path()
 		res = Card_res_apdu()
-		res.from_mich(self.card.UPDATE_BINARY(offs_high, offs_low, data))
+		mich = self.card.update_binary(data, offset, old)
+		if mich is not None:
+			res.from_mich(mich)
+		else:
+			# Nothing differs from old, no command was sent
+			res.apdu = memoryview(b'')
+			res.sw = [ 0x90, 0x00 ]
+		if res.sw == [0x90, 0x00]:
+			self.__drop_contents(path)
+			self.__put_contents(path, data, offset)
+		else:
+			self.__drop_contents()
 		return res
 
-	# Perform file operation (Read, byte oriented)
-	def read_binary(self, length, offset = 0):
-		offs_high = (offset >> 8) & 0xFF
-		offs_low = offset & 0xFF
+	# Perform file operation (Read, byte oriented), files that do not fit
+	# into a single APDU are read in chunks. The data is read into buf
+	# (bytearray), when given. The kept contents of the EF are returned
+	# instead, when they are known (see keep_contents).
+	def read_binary(self, length, offset = 0, buf = None):
+		self.__select_deferred_mf()
+		path = self.__get_ef_path() if self.contents is not None else None
+		res = self.__get_contents(path, length, offset, buf)
+		if res is not None:
+			return res
+		self.__check_capabilities(length)
 		res = Card_res_apdu()
-		res.from_mich(self.card.READ_BINARY(offs_high, offs_low, length))
+		res.from_mich(self.card.read_binary(length, offset, buf))
+		if res.sw == [0x90, 0x00]:
+			self.__put_contents(path, res.apdu, offset)
 		return res
 
 	# Perform file operation (Read, record oriented)
 	def read_record(self, length, rec_no = 0):
+		self.__select_deferred_mf()
 		res = Card_res_apdu()
 		res.from_mich(self.card.READ_RECORD(rec_no, GSM_SIM_INS_READ_RECORD_ABS, length))
 		return res
@@ -202,6 +556,8 @@ class Simcard():
 
 	# Perform file operation (Read, record oriented)
 	def update_record(self, data, rec_no = 0):
+		self.__select_deferred_mf()
 		res = Card_res_apdu()
 		res.from_mich(self.card.UPDATE_RECORD(rec_no, GSM_SIM_INS_UPDATE_RECORD_ABS, data))
+		self.__drop_contents()
 		return res
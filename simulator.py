@@ -0,0 +1,760 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Virtual card simulator for sysmocom SIM/USIM/ISIM cards
+
+(C) 2026 by sysmocom - s.f.m.c. GmbH
+All Rights Reserved
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# The simulator models the file system of a card as a tree of SimFile
+# objects and answers APDUs the same way a T=0 card would do (SW1=0x61
+# followed by GET RESPONSE to fetch the FCP of a selected file). When it is
+# set to T=1 (protocol = 1), case 4 commands that carry Le get their
+# response data returned directly, without GET RESPONSE. It can be
+# handed to the ISO7816 class as transport in place of a PC/SC reader, which
+# allows to run the tools (and to benchmark them) without a card.
+#
+# The following is modeled:
+#
+# - MF, DFs and ADFs (selected by FID, by AID, by path from MF and by path
+#   from the current DF, see ETSI TS 102 221, chapter 8.4.1)
+# - transparent and linear fixed EFs, including SFI access
+# - hard links (the same EF object may be referenced from multiple DFs)
+# - CHV verification with retry counters (ADM1 is needed to read the
+#   proprietary files and to update any file)
+# - INTERNAL AUTHENTICATE (the XOR test algorithm from 3GPP TS 34.108,
+#   chapter 8.1.2 is used, regardless of what is configured on the card)
+# - extended length APDUs, if the card capabilities in the ATR indicate
+#   them
+# - logical channels (MANAGE CHANNEL, channel number coded in CLA)
+
+import os
+import sys
+import json
+import getopt
+from card.transport import *
+from card.utils import ATR_card_capabilities
+from utils import *
+
+SIM_MF = 0
+SIM_DF = 1
+SIM_ADF = 2
+SIM_EF_TRANSPARENT = 3
+SIM_EF_LINEAR_FIXED = 4
+
+# CHV references
+SIM_CHV_PIN1 = 0x01
+SIM_CHV_ADM1 = 0x0A
+
+# Maximum number of CHV retries
+SIM_CHV_MAX_RETRIES = 3
+
+# Number of logical channels, including the basic channel
+SIM_MAX_CHANNELS = 4
+
+# Application identifiers
+SIM_AID_USIM = [0xA0, 0x00, 0x00, 0x00, 0x87, 0x10, 0x02, 0xFF, 0xFF, 0xFF, 0xFF, 0x89, 0x07, 0x09, 0x00, 0x00]
+SIM_AID_ISIM = [0xA0, 0x00, 0x00, 0x00, 0x87, 0x10, 0x04, 0xFF, 0xFF, 0xFF, 0xFF, 0x89, 0x07, 0x09, 0x00, 0x00]
+
+# A file (MF, DF, ADF or EF) in the simulated file system
+class SimFile:
+
+	def __init__(self, fid, name, ftype, data = None, rec_len = 0, sfi = None, aid = None, adm_read = False):
+		self.fid = fid
+		self.name = name
+		self.ftype = ftype
+		self.rec_len = rec_len
+		self.sfi = sfi
+		self.aid = aid
+		self.adm_read = adm_read
+		self.parent = None
+		self.children = {}
+		if data is None:
+			self.data = bytearray()
+		else:
+			self.data = bytearray(data)
+
+	def is_df(self):
+		return self.ftype in (SIM_MF, SIM_DF, SIM_ADF)
+
+	# Add a child file to this DF. The same EF object may be added to
+	# multiple DFs in order to model a hard link.
+	def add(self, child):
+		self.children[tuple(child.fid)] = child
+		if child.parent is None:
+			child.parent = self
+		return child
+
+	# Reference an existing file under a different FID (hard link)
+	def link(self, fid, child):
+		self.children[tuple(fid)] = child
+		return child
+
+	# Lookup a child by its SFI
+	def child_by_sfi(self, sfi):
+		for child in self.children.values():
+			if child.sfi == sfi:
+				return child
+		return None
+
+	def num_records(self):
+		if self.ftype != SIM_EF_LINEAR_FIXED or self.rec_len == 0:
+			return 0
+		return len(self.data) // self.rec_len
+
+	# Generate the FCP template (see also ETSI TS 102 221,
+	# chapter 11.1.1.3), fid is the FID the file was selected by, which
+	# differs from its own FID when it is selected via a hard link
+	def fcp(self, fid = None):
+		if self.is_df():
+			tlv = [0x82, 0x02, 0x78, 0x21]
+		elif self.ftype == SIM_EF_LINEAR_FIXED:
+			tlv = [0x82, 0x05, 0x42, 0x21, 0x00, self.rec_len, self.num_records()]
+		else:
+			tlv = [0x82, 0x02, 0x41, 0x21]
+		tlv += [0x83, 0x02] + list(fid or self.fid)
+		if self.aid:
+			tlv += [0x84, len(self.aid)] + list(self.aid)
+		tlv += [0x8A, 0x01, 0x05]
+		if not self.is_df():
+			tlv += [0x80, 0x02, (len(self.data) >> 8) & 0xFF, len(self.data) & 0xFF]
+			if self.sfi is not None:
+				tlv += [0x88, 0x01, self.sfi << 3]
+		return [0x62, len(tlv)] + tlv
+
+
+# Selection state of a logical channel
+class SimChannel:
+
+	def __init__(self, mf):
+		self.df = mf
+		self.ef = None
+		self.adf = None
+
+
+# A virtual card, which is accessed through the transport interface of the
+# card library, so it can be passed to the ISO7816 class as transport.
+class Simulator(Transport):
+
+	def __init__(self, atr, mf, pins = None, reader = "sysmocom card simulator", protocol = 0):
+		self.atr = bytes(atr)
+		self.mf = mf
+		self.reader = reader
+		self.protocol = protocol
+		caps = ATR_card_capabilities(self.atr)
+		self.extended_length = bool(caps and len(caps) >= 3 and caps[2] & 0x40)
+		self.adfs = []
+		self.pins = {}
+		self.retries = {}
+		self.apdu_count = 0
+		self.statefile = None
+		if pins:
+			for ref in pins:
+				self.set_pin(ref, pins[ref])
+		self.reset()
+		self.ins_handlers = {
+			0xA4 : self.__select,
+			0xC0 : self.__get_response,
+			0xB0 : self.__read_binary,
+			0xD6 : self.__update_binary,
+			0xB2 : self.__read_record,
+			0xDC : self.__update_record,
+			0x20 : self.__verify,
+			0x88 : self.__authenticate,
+			0xF2 : self.__status,
+			0x70 : self.__manage_channel,
+		}
+
+	# Add an application (ADF) to the card
+	def add_adf(self, adf):
+		adf.parent = self.mf
+		self.adfs.append(adf)
+		return adf
+
+	# Set a CHV (PIN, ADM) value, the value is padded with 0xFF
+	def set_pin(self, ref, value):
+		value = list(value)
+		self.pins[ref] = value + [0xFF] * (8 - len(value))
+		self.retries[ref] = SIM_CHV_MAX_RETRIES
+
+	# Iterate over all files of the card, yields the path (FIDs starting
+	# at the MF or at the ADF) and the file object
+	def files(self):
+		def walk(f, path):
+			yield path, f
+			for fid, child in f.children.items():
+				yield from walk(child, path + "/%02X%02X" % fid)
+		yield from walk(self.mf, "3F00")
+		for adf in self.adfs:
+			yield from walk(adf, "ADF" + "".join("%02X" % b for b in adf.aid))
+
+	# Save the contents of all files and the retry counters to a file
+	def save(self, filename):
+		state = {}
+		state["retries"] = dict((str(ref), self.retries[ref]) for ref in self.retries)
+		state["files"] = dict((path, f.data.hex()) for path, f in self.files() if not f.is_df())
+		with open(filename, "w") as statefile:
+			json.dump(state, statefile, indent = 1, sort_keys = True)
+
+	# Load a state that has been saved with save(), from then on, the state
+	# is saved to the same file automatically whenever it changes.
+	def load(self, filename):
+		self.statefile = filename
+		if not os.path.exists(filename):
+			self.save(filename)
+			return
+		with open(filename) as statefile:
+			state = json.load(statefile)
+		for ref in state["retries"]:
+			self.retries[int(ref)] = state["retries"][ref]
+		for path, f in self.files():
+			if path in state["files"]:
+				f.data = bytearray.fromhex(state["files"][path])
+
+	# Reset the card state (cold reset), this clears the security status
+	# and the file selection.
+	def reset(self):
+		self.verified = set()
+		self.channels = {0: SimChannel(self.mf)}
+		self.response = []
+		return self.atr
+
+	def connect(self):
+		self.reset()
+
+	# Process a command APDU (bytes), returns the response data (bytes) and
+	# the status word
+	def transmit(self, apdu):
+		self.apdu_count += 1
+		data, sw1, sw2 = self.__process(list(apdu))
+		if self.statefile and apdu[1] in (0xD6, 0xDC, 0x20):
+			self.save(self.statefile)
+		return bytes(data), (sw1, sw2)
+
+	def __process(self, apdu):
+		if len(apdu) < 4:
+			return [], 0x67, 0x00
+
+		cla, ins, p1, p2 = apdu[0:4]
+		if cla & 0xB0 not in (0x00, 0x80):
+			return [], 0x6E, 0x00
+
+		if len(apdu) >= 7 and apdu[4] == 0x00 and self.extended_length:
+			return self.__process_extended(apdu)
+		elif len(apdu) > 5:
+			data = list(apdu[5:5 + apdu[4]])
+			if len(data) != apdu[4] or len(apdu) > 6 + len(data):
+				return [], 0x67, 0x00
+			# Case 4, the reader strips Le when T=0 is used
+			le = None
+			if len(apdu) == 6 + len(data) and self.protocol == 1:
+				le = apdu[-1] or 0x100
+		elif len(apdu) == 5:
+			data = []
+			le = apdu[4] or 0x100
+		else:
+			data = []
+			le = None
+
+		return self.__dispatch(cla, ins, p1, p2, data, le)
+
+	# Extended length APDUs: Lc is 0x00 followed by 2 bytes, Le has 2 bytes
+	# (or 0x00 followed by 2 bytes, when there is no Lc)
+	def __process_extended(self, apdu):
+		cla, ins, p1, p2 = apdu[0:4]
+		if len(apdu) == 7:
+			data = []
+			le = (apdu[5] << 8 | apdu[6]) or 0x10000
+		else:
+			lc = apdu[5] << 8 | apdu[6]
+			data = list(apdu[7:7 + lc])
+			if lc == 0 or len(data) != lc or len(apdu) not in (7 + lc, 9 + lc):
+				return [], 0x67, 0x00
+			le = None
+			if len(apdu) == 9 + lc:
+				le = (apdu[-2] << 8 | apdu[-1]) or 0x10000
+		return self.__dispatch(cla, ins, p1, p2, data, le)
+
+	def __dispatch(self, cla, ins, p1, p2, data, le):
+		handler = self.ins_handlers.get(ins)
+		if handler is None:
+			return [], 0x6D, 0x00
+
+		# Logical channel number (ISO 7816-4, 5.4.1)
+		if cla & 0x40:
+			chan = self.channels.get(4 + (cla & 0x0F))
+		else:
+			chan = self.channels.get(cla & 0x03)
+		if chan is None:
+			return [], 0x68, 0x81
+
+		# Pending response data is only available to the command that
+		# immediately follows
+		response = self.response
+		self.response = []
+		if ins == 0xC0:
+			return handler(chan, response, le)
+		data, sw1, sw2 = handler(chan, p1, p2, data, le)
+
+		# Over T=1, the response data of a case 4 command is returned
+		# directly
+		if sw1 == 0x61 and not data and le is not None:
+			response = self.response
+			self.response = []
+			return self.__get_response(chan, response, min(le, len(response)))
+		return data, sw1, sw2
+
+	# Respond with data that the terminal has to fetch via GET RESPONSE
+	def __respond(self, data):
+		if not data:
+			return [], 0x90, 0x00
+		self.response = data
+		return [], 0x61, len(data) & 0xFF
+
+	# Resolve a file identifier relative to the current DF (see also
+	# ETSI TS 102 221, chapter 8.4.1)
+	def __resolve_fid(self, chan, fid):
+		fid = tuple(fid)
+		if fid == (0x3F, 0x00):
+			return self.mf
+		if fid == (0x7F, 0xFF):
+			return chan.adf
+		df = chan.df
+		if tuple(df.fid) == fid:
+			return df
+		if fid in df.children:
+			return df.children[fid]
+		parent = df.parent
+		if parent is not None:
+			if tuple(parent.fid) == fid:
+				return parent
+			if fid in parent.children:
+				return parent.children[fid]
+		return None
+
+	# Resolve a path (list of FIDs) starting at a given DF, returns the
+	# last DF on the path and the selected file
+	def __resolve_path(self, chan, df, path):
+		f = df
+		for i in range(0, len(path), 2):
+			if f is None or not f.is_df():
+				return None, None
+			df = f
+			fid = tuple(path[i:i+2])
+			if fid == (0x7F, 0xFF) and i == 0:
+				f = chan.adf
+			else:
+				f = f.children.get(fid)
+		return df, f
+
+	def __select(self, chan, p1, p2, data, le):
+		if p1 == 0x00:
+			if len(data) != 2:
+				return [], 0x67, 0x00
+			f = self.__resolve_fid(chan, data)
+		elif p1 == 0x04:
+			f = None
+			for adf in self.adfs:
+				if len(data) > 0 and adf.aid[0:len(data)] == data:
+					f = adf
+					break
+		elif p1 == 0x08:
+			if len(data) % 2 or len(data) == 0:
+				return [], 0x67, 0x00
+			df, f = self.__resolve_path(chan, self.mf, data)
+		elif p1 == 0x09:
+			if len(data) % 2 or len(data) == 0:
+				return [], 0x67, 0x00
+			df, f = self.__resolve_path(chan, chan.df, data)
+		else:
+			return [], 0x6A, 0x86
+
+		if f is None:
+			return [], 0x6A, 0x82
+
+		if f.is_df():
+			chan.df = f
+			chan.ef = None
+			if f.ftype == SIM_ADF:
+				chan.adf = f
+			elif f.ftype == SIM_MF:
+				chan.adf = None
+		else:
+			# An EF selected by path belongs to the last DF on
+			# that path
+			if p1 == 0x08 or p1 == 0x09:
+				chan.df = df
+				if df.ftype == SIM_ADF:
+					chan.adf = df
+			chan.ef = f
+
+		if p2 & 0x0C == 0x0C:
+			return [], 0x90, 0x00
+		fid = None
+		if p1 != 0x04 and not f.is_df():
+			fid = list(data[-2:])
+		return self.__respond(f.fcp(fid))
+
+	def __get_response(self, chan, response, le):
+		if not response:
+			return [], 0x69, 0x85
+		if le is None or le > len(response):
+			return [], 0x6C, len(response) & 0xFF
+		self.response = response[le:]
+		if self.response:
+			return response[:le], 0x61, len(self.response) & 0xFF
+		return response[:le], 0x90, 0x00
+
+	# Open (P1=0x00) or close (P1=0x80) a logical channel, a channel that
+	# is opened from the basic channel starts with the MF selected,
+	# otherwise it inherits the selection of the channel it is opened from
+	def __manage_channel(self, chan, p1, p2, data, le):
+		if p1 == 0x00:
+			if p2 == 0x00:
+				free = [n for n in range(1, SIM_MAX_CHANNELS) if n not in self.channels]
+				if not free:
+					return [], 0x6A, 0x81
+				p2 = free[0]
+			elif p2 in self.channels or p2 >= SIM_MAX_CHANNELS:
+				return [], 0x6A, 0x86
+			new = SimChannel(self.mf)
+			if chan is not self.channels[0]:
+				new.df, new.ef, new.adf = chan.df, chan.ef, chan.adf
+			self.channels[p2] = new
+			return [p2], 0x90, 0x00
+		elif p1 == 0x80:
+			if p2 == 0x00 or p2 not in self.channels:
+				return [], 0x6A, 0x86
+			del self.channels[p2]
+			return [], 0x90, 0x00
+		return [], 0x6A, 0x86
+
+	def __status(self, chan, p1, p2, data, le):
+		if p2 & 0x0C == 0x0C:
+			return [], 0x90, 0x00
+		return self.__respond(chan.df.fcp())
+
+	# Get the EF an APDU refers to, either via SFI or the current EF,
+	# returns None when no suitable EF is available.
+	def __target_ef(self, chan, sfi):
+		if sfi:
+			f = chan.df.child_by_sfi(sfi)
+			if f is not None:
+				chan.ef = f
+			return f
+		return chan.ef
+
+	def __access(self, f, update):
+		if (update or f.adm_read) and SIM_CHV_ADM1 not in self.verified:
+			return False
+		return True
+
+	def __binary_target(self, chan, p1, p2):
+		if p1 & 0x80:
+			f = self.__target_ef(chan, p1 & 0x1F)
+			offset = p2
+		else:
+			f = chan.ef
+			offset = (p1 << 8) | p2
+		if f is None:
+			return None, offset, (0x69, 0x86)
+		if f.ftype != SIM_EF_TRANSPARENT:
+			return None, offset, (0x69, 0x81)
+		return f, offset, None
+
+	def __read_binary(self, chan, p1, p2, data, le):
+		f, offset, error = self.__binary_target(chan, p1, p2)
+		if error:
+			return [], error[0], error[1]
+		if not self.__access(f, False):
+			return [], 0x69, 0x82
+		if offset >= len(f.data):
+			return [], 0x6B, 0x00
+		if le is None or offset + le > len(f.data):
+			return [], 0x6C, (len(f.data) - offset) & 0xFF
+		return list(f.data[offset:offset + le]), 0x90, 0x00
+
+	def __update_binary(self, chan, p1, p2, data, le):
+		f, offset, error = self.__binary_target(chan, p1, p2)
+		if error:
+			return [], error[0], error[1]
+		if not self.__access(f, True):
+			return [], 0x69, 0x82
+		if offset >= len(f.data):
+			return [], 0x6B, 0x00
+		if offset + len(data) > len(f.data):
+			return [], 0x67, 0x00
+		f.data[offset:offset + len(data)] = bytes(data)
+		return [], 0x90, 0x00
+
+	def __record_target(self, chan, p1, p2):
+		if p2 & 0x07 != 0x04:
+			return None, 0, (0x6A, 0x86)
+		f = self.__target_ef(chan, p2 >> 3)
+		if f is None:
+			return None, 0, (0x69, 0x86)
+		if f.ftype != SIM_EF_LINEAR_FIXED:
+			return None, 0, (0x69, 0x81)
+		if p1 < 1 or p1 > f.num_records():
+			return None, 0, (0x6A, 0x83)
+		return f, (p1 - 1) * f.rec_len, None
+
+	def __read_record(self, chan, p1, p2, data, le):
+		f, offset, error = self.__record_target(chan, p1, p2)
+		if error:
+			return [], error[0], error[1]
+		if not self.__access(f, False):
+			return [], 0x69, 0x82
+		if le != f.rec_len:
+			return [], 0x6C, f.rec_len
+		return list(f.data[offset:offset + f.rec_len]), 0x90, 0x00
+
+	def __update_record(self, chan, p1, p2, data, le):
+		f, offset, error = self.__record_target(chan, p1, p2)
+		if error:
+			return [], error[0], error[1]
+		if not self.__access(f, True):
+			return [], 0x69, 0x82
+		if len(data) != f.rec_len:
+			return [], 0x67, 0x00
+		f.data[offset:offset + f.rec_len] = bytes(data)
+		return [], 0x90, 0x00
+
+	def __verify(self, chan, p1, p2, data, le):
+		if p2 not in self.pins:
+			return [], 0x6A, 0x88
+		if self.retries[p2] == 0:
+			return [], 0x69, 0x83
+
+		# Without data, only the number of remaining attempts is
+		# reported
+		if not data:
+			return [], 0x63, 0xC0 | self.retries[p2]
+
+		if data == self.pins[p2]:
+			self.retries[p2] = SIM_CHV_MAX_RETRIES
+			self.verified.add(p2)
+			return [], 0x90, 0x00
+
+		self.retries[p2] -= 1
+		self.verified.discard(p2)
+		if self.retries[p2] == 0:
+			return [], 0x69, 0x83
+		return [], 0x63, 0xC0 | self.retries[p2]
+
+	# Run the XOR test algorithm (3GPP TS 34.108, chapter 8.1.2), the AUTN
+	# is not verified.
+	def __authenticate(self, chan, p1, p2, data, le):
+		adf = chan.adf
+		if adf is None or (0xAF, 0x20) not in adf.children:
+			return [], 0x69, 0x85
+		ki = list(adf.children[(0xAF, 0x20)].data[1:17])
+
+		if len(data) < 17 or data[0] != 16:
+			return [], 0x67, 0x00
+		rand = data[1:17]
+		xdout = [k ^ r for k, r in zip(ki, rand)]
+
+		if p2 == 0x80:
+			sres = xdout[0:4]
+			kc = xdout[4:12]
+			return self.__respond([len(sres)] + sres + [len(kc)] + kc)
+		elif p2 == 0x81:
+			res = xdout[0:8]
+			ck = xdout[1:16] + xdout[0:1]
+			ik = xdout[2:16] + xdout[0:2]
+			return self.__respond([0xDB, len(res)] + res + [len(ck)] + ck + [len(ik)] + ik)
+		return [], 0x6A, 0x86
+
+
+# Encode an IMSI (string of digits) as it is stored in EF.IMSI (see also
+# Sysmo_usim.write_imsi)
+def sim_encode_imsi(imsi):
+	imsi = asciihex_to_list(pad_asciihex(imsi, True, '9'))
+	return [len(imsi)] + swap_nibbles(imsi)
+
+
+# Encode an ICCID (string of digits) as it is stored in EF.ICCID
+def sim_encode_iccid(iccid):
+	return swap_nibbles(asciihex_to_list(pad_asciihex(iccid)))
+
+
+# Encode a record for EF.DIR that references an application
+def sim_encode_dir_record(aid, label, rec_len):
+	rec = [0x4F, len(aid)] + aid + [0x50, len(label)] + list(label.encode('ascii'))
+	rec = [0x61, len(rec)] + rec
+	return rec + [0xFF] * (rec_len - len(rec))
+
+
+# Create the file system parts that are common for all models
+def sim_common_fs(iccid, imsi, isim):
+	mf = SimFile([0x3F, 0x00], "MF", SIM_MF)
+
+	ef_dir = [sim_encode_dir_record(SIM_AID_USIM, "USim1", 0x26)]
+	if isim:
+		ef_dir.append(sim_encode_dir_record(SIM_AID_ISIM, "ISim1", 0x26))
+	ef_dir.append([0xFF] * 0x26)
+	mf.add(SimFile([0x2F, 0x00], "EF_DIR", SIM_EF_LINEAR_FIXED, sum(ef_dir, []), rec_len = 0x26, sfi = 0x1E))
+	mf.add(SimFile([0x2F, 0xE2], "EF_ICCID", SIM_EF_TRANSPARENT, sim_encode_iccid(iccid), sfi = 0x02))
+
+	ef_imsi = SimFile([0x6F, 0x07], "EF_IMSI", SIM_EF_TRANSPARENT, sim_encode_imsi(imsi), sfi = 0x07)
+	df_gsm = mf.add(SimFile([0x7F, 0x20], "DF_GSM", SIM_DF))
+	df_gsm.add(ef_imsi)
+	df_gsm.add(SimFile([0x6F, 0xAD], "EF_AD", SIM_EF_TRANSPARENT, [0x00, 0x00, 0x00, 0x02]))
+
+	adf_usim = SimFile([0x7F, 0xF0], "ADF_USIM", SIM_ADF, aid = SIM_AID_USIM)
+	adf_usim.add(ef_imsi)
+	adf_usim.add(SimFile([0x6F, 0xAD], "EF_AD", SIM_EF_TRANSPARENT, [0x00, 0x00, 0x00, 0x02], sfi = 0x03))
+
+	return mf, adf_usim
+
+
+# Create a simulated sysmoUSIM-SJS1
+def sim_sysmo_usim_sjs1(adm1 = "55538407", iccid = "8988211320300000028",
+			imsi = "262423203000002", ki = "94c7f52c8c7337fad1af3a73b17b56ac"):
+	mf, adf_usim = sim_common_fs(iccid, imsi, False)
+	df_gsm = mf.children[(0x7F, 0x20)]
+
+	df_gsm.add(SimFile([0x00, 0xFF], "EF_KI", SIM_EF_TRANSPARENT, bytes.fromhex(ki), adm_read = True))
+	ef_opc = SimFile([0x00, 0xF7], "EF_OPC", SIM_EF_TRANSPARENT, [0x01] + [0x00] * 16, adm_read = True)
+	df_gsm.add(ef_opc)
+
+	df_auth = mf.add(SimFile([0x7F, 0xCC], "DF_AUTH", SIM_DF))
+	df_auth.add(SimFile([0x6F, 0x00], "EF_AUTH", SIM_EF_TRANSPARENT, [0x01, 0x01], adm_read = True))
+	df_auth.add(SimFile([0x6F, 0x01], "EF_MLNGC", SIM_EF_TRANSPARENT,
+			    [0x00] * 16 + [0x00] * 15 + [0x01] + [0x00] * 15 + [0x02] +
+			    [0x00] * 15 + [0x04] + [0x00] * 15 + [0x08] +
+			    [0x40, 0x00, 0x20, 0x40, 0x60], adm_read = True))
+
+	adf_usim.add(ef_opc)
+	adf_usim.add(SimFile([0x00, 0xFB], "EF_SQNC", SIM_EF_TRANSPARENT,
+			     [0x55, 0x00, 0x00] + [0x00, 0x02, 0x00, 0x00, 0x00, 0x00] * 2, adm_read = True))
+	adf_usim.add(SimFile([0x00, 0xFA], "EF_SQNA", SIM_EF_TRANSPARENT, [0x00] * 6 * 32, adm_read = True))
+	adf_usim.add(SimFile([0x00, 0xFE], "EF_AC", SIM_EF_TRANSPARENT, [0xFF] * 4, adm_read = True))
+
+	sim = Simulator([0x3B, 0x9F, 0x96, 0x80, 0x1F, 0xC7, 0x80, 0x31, 0xA0, 0x73, 0xBE, 0x21,
+			 0x13, 0x67, 0x43, 0x20, 0x07, 0x18, 0x00, 0x00, 0x01, 0xA5],
+			mf, {SIM_CHV_ADM1 : list(adm1.encode('ascii'))})
+	sim.add_adf(adf_usim)
+	return sim
+
+
+# Create a simulated sysmoISIM-SJA2 (or sysmoISIM-SJA5, which has the same
+# file system layout but larger key files to fit TUAK keys)
+def sim_sysmo_isim_sja2(adm1 = "67225880", iccid = "8988211000000467343",
+			imsi = "901700000046734", ki = "D7882EAE7CD14F06108C55F8E5CFFE93",
+			atr = None, key_file_len = 33):
+	mf, adf_usim = sim_common_fs(iccid, imsi, True)
+	adf_isim = SimFile([0x7F, 0xF1], "ADF_ISIM", SIM_ADF, aid = SIM_AID_ISIM)
+
+	def auth_key(header):
+		content = [header] + list(bytes.fromhex(ki)) + [0x00] * 16
+		return content + [0x00] * (key_file_len - len(content))
+
+	# EF_SIM_AUTH_KEY in DF_SYSTEM is linked to EF_USIM_AUTH_KEY_2G and
+	# EF_ISIM_AUTH_KEY_2G
+	ef_sim_auth_key = SimFile([0x6F, 0x20], "EF_SIM_AUTH_KEY", SIM_EF_TRANSPARENT,
+				  auth_key(0x01), adm_read = True)
+	df_system = mf.add(SimFile([0xA5, 0x15], "DF_SYSTEM", SIM_DF))
+	df_system.add(ef_sim_auth_key)
+
+	# EF_MILENAGE_CFG is linked between ADF_USIM and ADF_ISIM
+	ef_milenage_cfg = SimFile([0xAF, 0x21], "EF_MILENAGE_CFG", SIM_EF_TRANSPARENT,
+				  [0x40, 0x00, 0x20, 0x40, 0x60] + [0x00] * 16 +
+				  [0x00] * 15 + [0x01] + [0x00] * 15 + [0x02] +
+				  [0x00] * 15 + [0x04] + [0x00] * 15 + [0x08], adm_read = True)
+
+	sqn = [0xD5, 0x03] + [0x00, 0x02, 0x00, 0x00, 0x00, 0x00] * 2 + [0x00] * 6 * 32
+
+	for adf, name in ((adf_usim, "USIM"), (adf_isim, "ISIM")):
+		adf.add(SimFile([0xAF, 0x20], "EF_%s_AUTH_KEY" % name, SIM_EF_TRANSPARENT,
+				auth_key(0x01), adm_read = True))
+		adf.add(ef_milenage_cfg)
+		adf.link([0xAF, 0x22], ef_sim_auth_key)
+		adf.add(SimFile([0xAF, 0x30], "EF_%s_SQN" % name, SIM_EF_TRANSPARENT, sqn, adm_read = True))
+	adf_usim.add(SimFile([0xAF, 0x23], "EF_USIM_AUTH_KEY_GBA", SIM_EF_TRANSPARENT,
+			     auth_key(0x01), adm_read = True))
+
+	if atr is None:
+		atr = "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 4C 75 30 34 05 4B A9"
+	sim = Simulator(bytes.fromhex(atr.replace(" ", "")), mf,
+			{SIM_CHV_ADM1 : list(adm1.encode('ascii'))})
+	sim.add_adf(adf_usim)
+	sim.add_adf(adf_isim)
+	return sim
+
+
+# Create a simulated sysmoISIM-SJA5
+def sim_sysmo_isim_sja5(adm1 = "11111111", iccid = "8988211000000467343",
+			imsi = "901700000046734", ki = "D7882EAE7CD14F06108C55F8E5CFFE93"):
+	return sim_sysmo_isim_sja2(adm1, iccid, imsi, ki,
+				   atr = "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 35 75 30 35 02 59 C4",
+				   key_file_len = 67)
+
+
+# Simulated card models
+SIM_MODELS = {
+	"sjs1" : sim_sysmo_usim_sjs1,
+	"sja2" : sim_sysmo_isim_sja2,
+	"sja5" : sim_sysmo_isim_sja5,
+}
+
+
+# Create a simulated card by its model name, optionally the card state is
+# kept in a file (so that it persists between multiple program runs)
+def sim_create(model, statefile = None, protocol = 0):
+	if model not in SIM_MODELS:
+		raise ValueError("unknown card model %s, valid models are: %s" % (model, ", ".join(SIM_MODELS)))
+	sim = SIM_MODELS[model]()
+	sim.protocol = protocol
+	if statefile:
+		sim.load(statefile)
+	return sim
+
+
+# Serve a simulated card to RemoteTransport clients
+def main(argv):
+	try:
+		opts, args = getopt.getopt(argv, "hp:t:")
+	except getopt.GetoptError:
+		args = []
+		opts = [("-h", "")]
+
+	port = REMOTE_DEFAULT_PORT
+	protocol = 0
+	for opt, arg in opts:
+		if opt == "-p":
+			port = int(arg)
+		elif opt == "-t":
+			protocol = int(arg)
+		else:
+			args = []
+
+	if len(args) < 1 or len(args) > 2:
+		print("usage: simulator.py [-p PORT] [-t PROTOCOL] MODEL [STATEFILE]")
+		print("   MODEL: %s" % ", ".join(SIM_MODELS))
+		print("   PROTOCOL: 0 (T=0, default) or 1 (T=1)")
+		sys.exit(1)
+
+	sim = sim_create(*args, protocol = protocol)
+	print("Serving simulated %s card (T=%u) on port %u..." % (args[0], protocol, port))
+	serve_transport(sim, "localhost", port)
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -55,11 +55,16 @@ class Application(Common):
 		print("   For Option -T, the following algorithms are valid:")
 		print('\n'.join(['   %d %s' % entry for entry in sysmo_isimsja2_algorithms]))
 		print("")
+		print("   Changes to the proprietary files (options -L, -K, -T, -O, -C and -S)")
+		print("   are written together, after all options are processed. When one of")
+		print("   the options fails, none of these changes are written (all or")
+		print("   nothing), the files whose changes were dropped are listed.")
+		print("")
 
 
 	# Automatically executed by superclass before _execute() is called
 	def _init(self):
-		self.sim = Sysmo_isim_sja2()
+		self.sim = Sysmo_isim_sja2(self.transport)
 
 
 	# Automatically executed by superclass
@@ -67,10 +67,15 @@ class Application(Common):
 		print("   C = CK and IK size in bits: 128 or 256")
 		print("   K = Number of Keccak iterations: 1-255")
 		print("")
+		print("   Changes to the proprietary files (options -L, -K, -T, -O, -C, -S and -W)")
+		print("   are written together, after all options are processed. When one of")
+		print("   the options fails, none of these changes are written (all or")
+		print("   nothing), the files whose changes were dropped are listed.")
+		print("")
 
 	# Automatically executed by superclass before _execute() is called
 	def _init(self):
-		self.sim = Sysmo_isim_sja5()
+		self.sim = Sysmo_isim_sja5(self.transport)
 
 
 	# Automatically executed by superclass
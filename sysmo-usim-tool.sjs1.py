@@ -73,7 +73,7 @@ class Application(Common):
 
 	# Automatically executed by superclass before _execute() is called
 	def _init(self):
-		self.sim = Sysmo_usim_sjs1()
+		self.sim = Sysmo_usim_sjs1(self.transport)
 
 
 	# Automatically executed by superclass
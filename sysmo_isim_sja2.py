@@ -51,6 +51,8 @@ import math
 #      +--[EF_ISIM_AUTH_KEY_2G 0xAF22] (link to DF_SYSTEM/EF_SIM_AUTH_KEY)
 #
 # Note: EF_MILENAGE_CFG and EF_USIM_SQN not yet listed here.
+#
+# EF_MILENAGE_CFG 0xAF21 is linked between ADF_USIM and ADF_ISIM.
 
 # Propritary files
 SYSMO_ISIMSJA2_DF_SYSTEM = [0xA5, 0x15]
@@ -64,6 +66,18 @@ SYSMO_ISIMSJA2_EF_GBA_SK = [0xAF, 0x31] # ADF.USIM
 SYSMO_ISIMSJA2_EF_GBA_REC_LIST = [0xAF, 0x32] # ADF.USIM
 SYSMO_ISIMSJA2_EF_GBA_INT_KEY = [0xAF, 0x32] # ADF.USIM
 
+# Hard links (see file tree above), each group lists the locations of the
+# same file as (DF, FID tuple), where DF is DF_SYSTEM, ADF_USIM or ADF_ISIM. Once
+# the links are verified on the card (see Sysmo_isim_sja2.verify_links),
+# reads and writes go to the first location of a group only.
+SYSMO_ISIMSJA2_LINKS = [
+	[("ADF_USIM", tuple(SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY_2G)),
+	 ("ADF_ISIM", tuple(SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY_2G)),
+	 ("DF_SYSTEM", tuple(SYSMO_ISIMSJA2_EF_SIM_AUTH_KEY))],
+	[("ADF_USIM", tuple(SYSMO_ISIMSJA2_EF_MILENAGE_CFG)),
+	 ("ADF_ISIM", tuple(SYSMO_ISIMSJA2_EF_MILENAGE_CFG))],
+]
+
 # Authentication algorithms
 SYSMO_ISIMSJA2_ALGO_COMP12V1 = 0x01
 SYSMO_ISIMSJA2_ALGO_COMP12V2 = 0x02
@@ -138,19 +152,13 @@ sysmo_isimsja5_top_topc = [
 	(False, 'TOP'),
 	]
 
-class SYSMO_ISIMSJAX_ALGO_PARS_MILENAGE:
-	use_opc = False
-	sres_dev_func = 1
-	four_byte_res = 0 #sysmo-usim-sja5 only
-
-	def __init__(self, content = None):
-		if content == None:
-			return
-		header = content[0]
-		self.use_opc = bool((header >> 4) & 1)
-		if (header >> 5) & 1:
-			self.sres_dev_func = 2
-		self.four_byte_res = bool((header >> 6) & 1)
+class SYSMO_ISIMSJAX_ALGO_PARS_MILENAGE(FileStruct):
+	schema = FileSchema(
+		Field(None, "B", bits = (
+			Bits("use_opc", 4),
+			Bits("sres_dev_func", 5, kind = int, default = 1, offset = 1),
+			Bits("four_byte_res", 6)))) #sysmo-usim-sja5 only
+	__slots__ = schema.names
 
 	def __str__(self) -> str:
 		dump = ""
@@ -167,22 +175,14 @@ class SYSMO_ISIMSJAX_ALGO_PARS_MILENAGE:
 		return dump
 
 	def encode(self) -> int:
-		out = 0x00
-		if self.use_opc == True:
-			out |= 1 << 4
-		out |= ((self.sres_dev_func-1) & 1) << 5
-		out |= ((self.four_byte_res) & 1) << 6
-		return out
+		return super().encode()[0]
 
 
-class SYSMO_ISIMSJAX_ALGO_PARS_SHA1AKA:
-	four_byte_res = 0 #sysmo-usim-sja5 only
-
-	def __init__(self, content = None):
-		if content == None:
-			return
-		header = content[0]
-		self.four_byte_res = bool((header >> 6) & 1)
+class SYSMO_ISIMSJAX_ALGO_PARS_SHA1AKA(FileStruct):
+	schema = FileSchema(
+		Field(None, "B", bits = (
+			Bits("four_byte_res", 6),))) #sysmo-usim-sja5 only
+	__slots__ = schema.names
 
 	def __str__(self) -> str:
 		dump = ""
@@ -194,24 +194,16 @@ class SYSMO_ISIMSJAX_ALGO_PARS_SHA1AKA:
 		return dump
 
 	def encode(self) -> int:
-		out = 0x00
-		out |= ((self.four_byte_res) & 1) << 6
-		return out
-
+		return super().encode()[0]
 
-class SYSMO_ISIMSJAX_ALGO_PARS_XOR:
-	sres_dev_func = 1
-	four_byte_res = 0
-	sixteen_byte_res = 0 #Return 16 byte RES (ignores full_res)
 
-	def __init__(self, content = None):
-		if content == None:
-			return
-		header = content[0]
-		if (header >> 5) & 1:
-			self.sres_dev_func = 2
-		self.four_byte_res = bool((header >> 6) & 1)
-		self.sixteen_byte_res = bool((header >> 7) & 1)
+class SYSMO_ISIMSJAX_ALGO_PARS_XOR(FileStruct):
+	schema = FileSchema(
+		Field(None, "B", bits = (
+			Bits("sres_dev_func", 5, kind = int, default = 1, offset = 1),
+			Bits("four_byte_res", 6),
+			Bits("sixteen_byte_res", 7)))) #Return 16 byte RES (ignores full_res)
+	__slots__ = schema.names
 
 	def __str__(self) -> str:
 		dump = ""
@@ -226,26 +218,16 @@ class SYSMO_ISIMSJAX_ALGO_PARS_XOR:
 		return dump
 
 	def encode(self) -> int:
-		out = 0x00
-		out |= ((self.sres_dev_func-1) & 1) << 5
-		out |= ((self.four_byte_res) & 1) << 6
-		out |= ((self.sixteen_byte_res) & 1) << 7
-		return out
-
+		return super().encode()[0]
 
-class SYSMO_ISIMSJA5_ALGO_PARS_TUAK:
-	use_topc = False
-	sres_dev_func = 1
-	use_256_bit_key = False
 
-	def __init__(self, content = None):
-		if content == None:
-			return
-		header = content[0]
-		self.use_topc = bool((header >> 4) & 1)
-		if (header >> 5) & 1:
-			self.sres_dev_func = 2
-		self.use_256_bit_key = bool((header >> 6) & 1)
+class SYSMO_ISIMSJA5_ALGO_PARS_TUAK(FileStruct):
+	schema = FileSchema(
+		Field(None, "B", bits = (
+			Bits("use_topc", 4),
+			Bits("sres_dev_func", 5, kind = int, default = 1, offset = 1),
+			Bits("use_256_bit_key", 6))))
+	__slots__ = schema.names
 
 	def __str__(self) -> str:
 		dump = ""
@@ -261,39 +243,38 @@ class SYSMO_ISIMSJA5_ALGO_PARS_TUAK:
 			dump += pfx + "128 bit key length\n"
 		return dump
 
-
 	def encode(self) -> int:
-		out = 0x00
-		if self.use_topc == True:
-			out |= 1 << 4
-		out |= ((self.sres_dev_func-1) & 1) << 5
-		out |= ((self.use_256_bit_key) & 1) << 6
-		return out
+		return super().encode()[0]
+
 
+# Parameters (in the header byte of the key files) of each algorithm, the
+# other algorithms have no parameters
+sysmo_isimsjax_algo_pars = {
+	SYSMO_ISIMSJA2_ALGO_MILENAGE: SYSMO_ISIMSJAX_ALGO_PARS_MILENAGE,
+	SYSMO_ISIMSJA2_ALGO_SHA1AKA: SYSMO_ISIMSJAX_ALGO_PARS_SHA1AKA,
+	SYSMO_ISIMSJA2_ALGO_XOR: SYSMO_ISIMSJAX_ALGO_PARS_XOR,
+	SYSMO_ISIMSJA5_ALGO_TUAK: SYSMO_ISIMSJA5_ALGO_PARS_TUAK,
+}
 
-class SYSMO_ISIMSJAX_FILE_EF_XSIM_AUTH_KEY:
+
+class SYSMO_ISIMSJAX_FILE_EF_XSIM_AUTH_KEY(FileStruct):
 	"""
 	Superclass model that generates and parses the header byte of
 	SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY, SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY_2G
 	and SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY_GBA.
 	"""
-
-	algo = SYSMO_ISIMSJA2_ALGO_COMP12V1
-	algo_pars = None
+	schema = FileSchema(
+		Field(None, "B", bits = (
+			Bits("algo", 0, 4, int, SYSMO_ISIMSJA2_ALGO_COMP12V1),)))
+	__slots__ = schema.names + ("algo_pars",)
 
 	def __init__(self, content = None):
+		super().__init__(content)
+		self.algo_pars = None
 		if content == None:
 			return
-		header = content[0]
-		self.algo = header & 0x0F
-		if self.algo == SYSMO_ISIMSJA2_ALGO_MILENAGE:
-			self.algo_pars = SYSMO_ISIMSJAX_ALGO_PARS_MILENAGE(content)
-		elif self.algo == SYSMO_ISIMSJA2_ALGO_SHA1AKA:
-			self.algo_pars = SYSMO_ISIMSJAX_ALGO_PARS_SHA1AKA(content)
-		elif self.algo == SYSMO_ISIMSJA2_ALGO_XOR:
-			self.algo_pars = SYSMO_ISIMSJAX_ALGO_PARS_XOR(content)
-		elif self.algo == SYSMO_ISIMSJA5_ALGO_TUAK:
-			self.algo_pars = SYSMO_ISIMSJA5_ALGO_PARS_TUAK(content)
+		if self.algo in sysmo_isimsjax_algo_pars:
+			self.algo_pars = sysmo_isimsjax_algo_pars[self.algo](content)
 
 	def __str__(self) -> str:
 		dump = ""
@@ -306,20 +287,16 @@ class SYSMO_ISIMSJAX_FILE_EF_XSIM_AUTH_KEY:
 		return dump
 
 	def encode(self):
-		out = [0x00]
-		out[0] = self.algo & 0x0F
+		out = super().encode()
 		if self.algo_pars:
 			out[0] |= self.algo_pars.encode()
 		return out
 
-class SYSMO_ISIMSJAX_ALGO_KEY_COMP128:
-
-	ki = [0x00] * 16
-
-	def __init__(self, content = None):
-		if content == None:
-			return
-		self.ki = content[1:17]
+class SYSMO_ISIMSJAX_ALGO_KEY_COMP128(FileStruct):
+	schema = FileSchema(
+		Field("ki", "16s", [0x00] * 16))
+	__slots__ = schema.names
+	offset = 1
 
 	def __str__(self) -> str:
 		dump = ""
@@ -327,30 +304,22 @@ class SYSMO_ISIMSJAX_ALGO_KEY_COMP128:
 		dump += pfx + "Ki: " + hexdump(self.ki)
 		return dump
 
-	def encode(self) -> list:
-		return self.ki
-
 
 #XOR has the same key length COMP128 (16 byte, no extra data)
 class SYSMO_ISIMSJAX_ALGO_KEY_XOR(SYSMO_ISIMSJAX_ALGO_KEY_COMP128):
-	pass
+	__slots__ = ()
 
 
 #SHA1AKA has the same key length COMP128 (16 byte, no extra data)
 class SYSMO_ISIMSJAX_ALGO_KEY_SHA1AKA(SYSMO_ISIMSJAX_ALGO_KEY_COMP128):
-	pass
+	__slots__ = ()
 
 
 #Milenage adds a 16 byte OP/c
 class SYSMO_ISIMSJAX_ALGO_KEY_MILENAGE(SYSMO_ISIMSJAX_ALGO_KEY_COMP128):
-
-	opc = [0x00] * 16
-
-	def __init__(self, content = None):
-		if content == None:
-			return
-		super().__init__(content)
-		self.opc = content[17:33]
+	schema = SYSMO_ISIMSJAX_ALGO_KEY_COMP128.schema.extend(
+		Field("opc", "16s", [0x00] * 16))
+	__slots__ = ("opc",)
 
 	def __str__(self) -> str:
 		dump = ""
@@ -360,28 +329,18 @@ class SYSMO_ISIMSJAX_ALGO_KEY_MILENAGE(SYSMO_ISIMSJAX_ALGO_KEY_COMP128):
 		dump += pfx + "OPc: " + hexdump(self.opc)
 		return dump
 
-	def encode(self) -> list:
-		return super().encode() + self.opc
-
-
-class SYSMO_ISIMSJAX_ALGO_KEY_TUAK:
 
-	res_size = 0 #3 bit value
-	mac_size = 0 #3 bit value
-	ckik_size = 0 #1 bit value
-	num_keccak = 0 #1 byte value
-	topc = [0x00] * 32
-	key = [0x00] * 32
-
-	def __init__(self, content = None):
-		if content == None:
-			return
-		self.res_size = int(content[1] & 7)
-		self.mac_size = int((content[1] >> 3) & 7)
-		self.ckik_size = bool((content[1] >> 6) & 1)
-		self.num_keccak =  content[2]
-		self.topc = content[3:35]
-		self.key = content[35:67]
+class SYSMO_ISIMSJAX_ALGO_KEY_TUAK(FileStruct):
+	schema = FileSchema(
+		Field(None, "B", bits = (
+			Bits("res_size", 0, 3, int, 0),
+			Bits("mac_size", 3, 3, int, 0),
+			Bits("ckik_size", 6, 1, bool, False))),
+		Field("num_keccak", "B", 0),
+		Field("topc", "32s", [0x00] * 32),
+		Field("key", "32s", [0x00] * 32))
+	__slots__ = schema.names
+	offset = 1
 
 	def __str__(self) -> str:
 		dump = ""
@@ -397,39 +356,33 @@ class SYSMO_ISIMSJAX_ALGO_KEY_TUAK:
 		dump += pfx + "Key: " + hexdump(self.key)
 		return dump
 
-	def encode(self) -> list:
-		param_byte = self.res_size & 7
-		param_byte |= (self.res_size & 7) << 3
-		param_byte |= (self.ckik_size & 1) << 6
-		out = [param_byte]
-		out += [self.num_keccak]
-		out += self.topc
-		out += self.key
-		return out
 
+# Key layout of each algorithm
+sysmo_isimsjax_algo_keys = {
+	SYSMO_ISIMSJA2_ALGO_COMP12V1: SYSMO_ISIMSJAX_ALGO_KEY_COMP128,
+	SYSMO_ISIMSJA2_ALGO_COMP12V2: SYSMO_ISIMSJAX_ALGO_KEY_COMP128,
+	SYSMO_ISIMSJA2_ALGO_COMP12V3: SYSMO_ISIMSJAX_ALGO_KEY_COMP128,
+	SYSMO_ISIMSJA2_ALGO_MILENAGE: SYSMO_ISIMSJAX_ALGO_KEY_MILENAGE,
+	SYSMO_ISIMSJA2_ALGO_SHA1AKA: SYSMO_ISIMSJAX_ALGO_KEY_SHA1AKA,
+	SYSMO_ISIMSJA2_ALGO_XOR: SYSMO_ISIMSJAX_ALGO_KEY_XOR,
+	SYSMO_ISIMSJA5_ALGO_XOR_2G: SYSMO_ISIMSJAX_ALGO_KEY_XOR,
+	SYSMO_ISIMSJA5_ALGO_TUAK: SYSMO_ISIMSJAX_ALGO_KEY_TUAK,
+}
 
-class SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(SYSMO_ISIMSJAX_FILE_EF_XSIM_AUTH_KEY):
 
-	algo_key = None
+class SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(SYSMO_ISIMSJAX_FILE_EF_XSIM_AUTH_KEY):
+	__slots__ = ("algo_key",)
 
 	def __init__(self, content = None):
 		# The superclass constructor must ensure that a valid algo and
 		# algo parameters are set since we need this information to pick
 		# the key configuration below.
 		super().__init__(content)
-		if self.algo == SYSMO_ISIMSJA2_ALGO_COMP12V1 or \
-		   self.algo == SYSMO_ISIMSJA2_ALGO_COMP12V2 or \
-		   self.algo == SYSMO_ISIMSJA2_ALGO_COMP12V3:
-			self.algo_key = SYSMO_ISIMSJAX_ALGO_KEY_COMP128(content)
-		elif self.algo == SYSMO_ISIMSJA2_ALGO_MILENAGE:
-			self.algo_key = SYSMO_ISIMSJAX_ALGO_KEY_MILENAGE(content)
-		elif self.algo == SYSMO_ISIMSJA2_ALGO_SHA1AKA:
-			self.algo_key = SYSMO_ISIMSJAX_ALGO_KEY_SHA1AKA(content)
-		elif self.algo == SYSMO_ISIMSJA2_ALGO_XOR or \
-		     self.algo == SYSMO_ISIMSJA5_ALGO_XOR_2G:
-			self.algo_key = SYSMO_ISIMSJAX_ALGO_KEY_XOR(content)
-		elif self.algo == SYSMO_ISIMSJA5_ALGO_TUAK:
-			self.algo_key = SYSMO_ISIMSJAX_ALGO_KEY_TUAK(content)
+		self.algo_key = None
+		if content == None:
+			return
+		if self.algo in sysmo_isimsjax_algo_keys:
+			self.algo_key = sysmo_isimsjax_algo_keys[self.algo](content)
 
 	def __str__(self) -> str:
 		dump = ""
@@ -449,98 +402,63 @@ class SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(SYSMO_ISIMSJAX_FILE_EF_XSIM_AUTH_KEY)
 # EF_USIM_AUTH_KEY_2G, EF_SIM_AUTH_KEY and EF_USIM_AUTH_KEY_GBA have the same layout as
 # EF_USIM_AUTH_KEY, so there is nothing to specialize other than the class name
 class SYSMO_ISIMSJA2_FILE_EF_SIM_AUTH_KEY(SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY):
-	pass
+	__slots__ = ()
 
 
 class SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY_2G(SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY):
-	pass
+	__slots__ = ()
 
 
 class SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY_GBA(SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY):
-	pass
-
-
-class SYSMO_ISIMSJA2_FILE_EF_MILENAGE_CFG:
-	R1 = 0x40
-	R2 = 0x00
-	R3 = 0x20
-	R4 = 0x40
-	R5 = 0x60
-	C1 = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]
-	C2 = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01]
-	C3 = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x02]
-	C4 = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x04]
-	C5 = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x08]
+	__slots__ = ()
+
+
+class SYSMO_ISIMSJA2_FILE_EF_MILENAGE_CFG(FileStruct):
+	schema = FileSchema(
+		Field("R1", "B", 0x40),
+		Field("R2", "B", 0x00),
+		Field("R3", "B", 0x20),
+		Field("R4", "B", 0x40),
+		Field("R5", "B", 0x60),
+		Field("C1", "16s", [0x00] * 16),
+		Field("C2", "16s", [0x00] * 15 + [0x01]),
+		Field("C3", "16s", [0x00] * 15 + [0x02]),
+		Field("C4", "16s", [0x00] * 15 + [0x04]),
+		Field("C5", "16s", [0x00] * 15 + [0x08]))
+	__slots__ = schema.names
 
 	def __init__(self, content = None):
-		if content == None:
-			return
-		if len(content) != 85:
-			return
-		self.R1 = content[0]
-		self.R2 = content[1]
-		self.R3 = content[2]
-		self.R4 = content[3]
-		self.R5 = content[4]
-		self.C1 = content[5:5+16]
-		self.C2 = content[21:37]
-		self.C3 = content[37:53]
-		self.C4 = content[53:69]
-		self.C5 = content[69:85]
-
-	def __str__(self) -> str:
-		dump = "   R1: " + str(hex(self.R1)) + "\n"
-		dump += "   R2: " + str(hex(self.R2)) + "\n"
-		dump += "   R3: " + str(hex(self.R3)) + "\n"
-		dump += "   R4: " + str(hex(self.R4)) + "\n"
-		dump += "   R5: " + str(hex(self.R5)) + "\n"
-		dump += "   C1: " + hexdump(self.C1) + "\n"
-		dump += "   C2: " + hexdump(self.C2) + "\n"
-		dump += "   C3: " + hexdump(self.C3) + "\n"
-		dump += "   C4: " + hexdump(self.C4) + "\n"
-		dump += "   C5: " + hexdump(self.C5)
-		return dump
-
-	def encode(self) -> list:
-		out = [self.R1, self.R2, self.R3, self.R4, self.R5]
-		out += self.C1 + self.C2 + self.C3 + self.C4 + self.C5
-		return out
-
-
-class SYSMO_ISIMSJAX_FILE_EF_USIM_SQN:
-
-	# Flag1:
-	ind_size_bits = 5 # specify file length by 2^ind_len
-	sqn_check_enabled = True # perform SQN checks below
-	sqn_age_limit_enabled = False # perform age limit check: (SQNms-SQN) <= AGE_LIMIT)
-	sqn_max_delta_enabled = True # perform delta max check: (SWN-SQNms) <= DELTA MAX)
-	sqn_check_skip_first = True # accept any SQN on the first authentication
+		if content != None and len(content) != self.schema.size:
+			content = None
+		super().__init__(content)
 
-	# Flag2:
-	conceal_autn = True # Conceal the value of AUTN
-	conceal_auts = True # Conceal the value of AUTS
-	no_amf_clear = False # Do not clear AMF when computing MAC-S
 
-	# Data:
-	max_delta = 2**28 << ind_size_bits
-	age_limit = 2**28 << ind_size_bits
-	freshness_data = [0x00] * (6*2**ind_size_bits) # initialize to zero
+class SYSMO_ISIMSJAX_FILE_EF_USIM_SQN(FileStruct):
+	schema = FileSchema(
+		# Flag1:
+		Field(None, "B", bits = (
+			Bits("ind_size_bits", 0, 4, int, 5), # specify file length by 2^ind_len
+			Bits("sqn_check_enabled", 4, default = True), # perform SQN checks below
+			Bits("sqn_age_limit_enabled", 5, default = False), # perform age limit check: (SQNms-SQN) <= AGE_LIMIT)
+			Bits("sqn_max_delta_enabled", 6, default = True), # perform delta max check: (SWN-SQNms) <= DELTA MAX)
+			Bits("sqn_check_skip_first", 7, default = True))), # accept any SQN on the first authentication
+		# Flag2:
+		Field(None, "B", bits = (
+			Bits("conceal_autn", 0, default = True), # Conceal the value of AUTN
+			Bits("conceal_auts", 1, default = True), # Conceal the value of AUTS
+			Bits("no_amf_clear", 2, default = False))), # Do not clear AMF when computing MAC-S
+		# Data:
+		Field("max_delta", "6s", 2**28 << 5, int),
+		Field("age_limit", "6s", 2**28 << 5, int))
+	__slots__ = schema.names + ("freshness_data",)
 
 	def __init__(self, content = None):
+		super().__init__()
+		self.reset() # initialize to zero
 		if content == None:
 			return
 
-		# Check if we have at least the header
-		if len(content) <= 2:
-			raise ValueError("unexpected length of %u bytes", len(content))
-
-		flag1 = content[0]
-		self.ind_size_bits = flag1 & 0xf
+		self.schema.decode(self, content)
 
 		# The parameter ind_size_bits is not user configurable,
 		# its a fixed configuration that is specific to the
@@ -548,29 +466,16 @@ class SYSMO_ISIMSJAX_FILE_EF_USIM_SQN:
 		# file length (length of the freshness data). If we find
 		# an ind_size_bits that is intconstant to the file length,
 		# we automatically set the value to the correct length
-		ind_size_bits_calculated = int(math.log((len(content) - 14) / 6, 2))
+		if len(content) <= self.schema.size:
+			raise ValueError("unexpected length of %u bytes" % len(content))
+		ind_size_bits_calculated = int(math.log((len(content) - self.schema.size) / 6, 2))
 		if ind_size_bits_calculated != self.ind_size_bits:
 			print("   Warning: SQN Parameter ind_size_bits is set to " + str(self.ind_size_bits) + ", resetting it to " + str(ind_size_bits_calculated) + "!")
 			self.ind_size_bits = ind_size_bits_calculated
 
-		self.reset() #ensure freshness data is correctly reset
-		self.sqn_check_enabled = bool((flag1 >> 4) & 1)
-		self.sqn_age_limit_enabled = bool((flag1 >> 5) & 1)
-		self.sqn_max_delta_enabled = bool((flag1 >> 6) & 1)
-		self.sqn_check_skip_first = bool((flag1 >> 7) & 1)
-
-		flag2 = content[1]
-		self.conceal_autn = bool(flag2 & 1)
-		self.conceal_auts = bool((flag2 >> 1) & 1)
-		self.no_amf_clear = bool((flag2 >> 2) & 1)
-
-		# Check if the data body is complete
-		if len(content) < 14+(6*2**self.ind_size_bits):
-			raise ValueError("unexpected length of %u bytes" % len(content))
-
-		self.max_delta = list_to_int(content[2:8])
-		self.age_limit = list_to_int(content[8:14])
-		self.freshness_data = content[15:(6*2**self.ind_size_bits)]
+		# The freshness data follows the header
+		start = self.schema.size
+		self.freshness_data = list(content[start:start + 6*2**self.ind_size_bits])
 
 	def __str__(self) -> str:
 		pfx = "   "
@@ -610,82 +515,121 @@ class SYSMO_ISIMSJAX_FILE_EF_USIM_SQN:
 		return dump
 
 	def encode(self) -> list:
-		out = [0x00, 0x00]
-
-		# Flag1:
-		out[0] = self.ind_size_bits & 0x0f
-		if self.sqn_check_enabled:
-			out[0] |= 1 << 4
-		if self.sqn_age_limit_enabled:
-			out[0] |= 1 << 5
-		if self.sqn_max_delta_enabled:
-			out[0] |= 1 << 6
-		if self.sqn_check_skip_first:
-			out[0] |= 1 << 7
-
-		# Flag2:
-		if self.conceal_autn:
-			out[1] |= 1 << 0
-		if self.conceal_auts:
-			out[1] |= 1 << 1
-		if self.no_amf_clear:
-			out[1] |= 1 << 2
-
-		# Data:
-		out += int_to_list(self.max_delta, 6)
-		out += int_to_list(self.age_limit, 6)
-		out += self.freshness_data
+		out = super().encode()
+		out.extend(self.freshness_data)
 		return out
 
 	def reset(self):
 		self.freshness_data = [0x00] * (6*2**self.ind_size_bits)
 
 
-class Sysmo_isim_sja2(Sysmo_usim):
-	algorithms = sysmo_isimsja2_algorithms
+# Proprietary files: location (see SYSMO_ISIMSJA2_LINKS), name and class to
+# decode the contents, in the order dump() shows them
+SYSMO_ISIMSJA2_FILES = [
+	(("DF_SYSTEM", tuple(SYSMO_ISIMSJA2_EF_SIM_AUTH_KEY)), "DF_SYSTEM/EF_SIM_AUTH_KEY",
+	 SYSMO_ISIMSJA2_FILE_EF_SIM_AUTH_KEY),
+	(("ADF_USIM", tuple(SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY_2G)), "ADF_USIM/EF_USIM_AUTH_KEY_2G",
+	 SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY_2G),
+	(("ADF_ISIM", tuple(SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY_2G)), "ADF_ISIM/EF_ISIM_AUTH_KEY_2G",
+	 SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY_2G),
+	(("ADF_USIM", tuple(SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY)), "ADF_USIM/EF_USIM_AUTH_KEY",
+	 SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY),
+	(("ADF_ISIM", tuple(SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY)), "ADF_ISIM/EF_ISIM_AUTH_KEY",
+	 SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY),
+	(("ADF_USIM", tuple(SYSMO_ISIMSJA2_EF_MILENAGE_CFG)), "ADF_USIM/EF_MILENAGE_CFG",
+	 SYSMO_ISIMSJA2_FILE_EF_MILENAGE_CFG),
+	(("ADF_ISIM", tuple(SYSMO_ISIMSJA2_EF_MILENAGE_CFG)), "ADF_ISIM/EF_MILENAGE_CFG",
+	 SYSMO_ISIMSJA2_FILE_EF_MILENAGE_CFG),
+	(("ADF_USIM", tuple(SYSMO_ISIMSJA2_EF_USIM_SQN)), "ADF_USIM/EF_USIM_SQN",
+	 SYSMO_ISIMSJAX_FILE_EF_USIM_SQN),
+	(("ADF_ISIM", tuple(SYSMO_ISIMSJA2_EF_USIM_SQN)), "ADF_ISIM/EF_ISIM_SQN",
+	 SYSMO_ISIMSJAX_FILE_EF_USIM_SQN),
+]
 
-	def __init__(self):
-		card_detected = False
+SYSMO_ISIMSJA2_FILE_NAMES = dict((loc, name) for loc, name, file_class in SYSMO_ISIMSJA2_FILES)
 
-		# Try card model #1
-		try:
-			atr = "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 4C 75 30 34 05 4B A9"
-			print("Trying to find card with ATR: " + atr)
-			Sysmo_usim.__init__(self, atr)
-			card_detected = True
-		except:
-			print(" * Card not detected!")
 
-		if card_detected == True:
-			return
+class CardSession():
+	"""
+	Contents of the proprietary files of a card (see SYSMO_ISIMSJA2_FILES),
+	each file is read on first access, changes are kept in memory until
+	flush() writes them. Linked locations (see SYSMO_ISIMSJA2_LINKS) share
+	the same contents.
+	"""
 
-		# Try card model #2
-		try:
-			atr = "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 4C 75 31 33 02 51 B2"
-			print("Trying to find card with ATR: " + atr)
-			Sysmo_usim.__init__(self, atr)
-			card_detected = True
-		except:
-			print(" * Card not detected!")
+	def __init__(self, tool):
+		self.tool = tool
+		# location -> [contents on the card, current contents, changed]
+		self.files = {}
+
+	def __entry(self, loc):
+		loc = self.tool._canonical(loc)
+		entry = self.files.get(loc)
+		if entry is None:
+			self.tool._select_location(loc)
+			res = self.tool._read_binary(self.tool.sim.filelen)
+			entry = [bytes(res.apdu), bytearray(res.apdu), False]
+			self.files[loc] = entry
+		return entry
+
+	def read(self, loc):
+		"""
+		Current contents of the file at loc, must not be modified
+		"""
+		return self.__entry(loc)[1]
 
-		if card_detected == True:
-			return
+	def write(self, loc, data):
+		"""
+		Change the first len(data) bytes of the file at loc
+		"""
+		entry = self.__entry(loc)
+		entry[1][:len(data)] = data
+		entry[2] = True
+
+	def changed(self):
+		"""
+		Names of the files whose contents were changed, but not written
+		"""
+		return [SYSMO_ISIMSJA2_FILE_NAMES.get(loc, str(loc))
+			for loc, entry in self.files.items() if entry[1] != entry[0]]
 
-		# Try card model #3 (sysmoTSIM)
-		try:
-			atr = "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 4C 52 75 31 04 51 D5"
-			print("Trying to find card with ATR: " + atr)
-			Sysmo_usim.__init__(self, atr)
-			card_detected = True
-		except:
-			print(" * Card not detected!")
+	def flush(self):
+		"""
+		Write the changed files to the card, in the order in which they
+		were read, only the bytes that differ are written. Returns False
+		when the card rejects a write, the files from that one on are
+		left unwritten.
+		"""
+		for loc, entry in self.files.items():
+			image, content, changed = entry
+			if not changed:
+				continue
+			name = SYSMO_ISIMSJA2_FILE_NAMES.get(loc, str(loc))
+			if content != image:
+				self.tool._select_location(loc)
+				res = self.tool._update_binary(content, name, image)
+				if res.sw != [0x90, 0x00]:
+					print("   Error: could not write %s (sw=%02x%02x) -- abort!\n" % (name, res.sw[0], res.sw[1]))
+					return False
+				if not self.tool.skip_unchanged:
+					print("   %s: written" % name)
+			elif self.tool.skip_unchanged:
+				self.tool._report_update(name, False)
+			else:
+				print("   %s: unchanged" % name)
+			entry[0] = bytes(content)
+			entry[2] = False
+		return True
 
-		if card_detected == True:
-			return
 
-		# Exit when we are not able to detect the card
-		if card_detected != True:
-			sys.exit(1)
+class Sysmo_isim_sja2(Sysmo_usim):
+	algorithms = sysmo_isimsja2_algorithms
+	models = ("sysmoISIM-SJA2", "sysmoTSIM")
+	links = SYSMO_ISIMSJA2_LINKS
+
+	# Verified links, location -> first location of its group, None as
+	# long as the links are not verified (see verify_links)
+	linked = None
 
 	def show_milenage_params(self):
 		"""
@@ -695,10 +639,7 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		self._init()
 
 		print(" * Reading...")
-		self.sim.card.SELECT_ADF_USIM()
-		self.sim.select(SYSMO_ISIMSJA2_EF_MILENAGE_CFG)
-		res = self._read_binary(85)
-		ef = SYSMO_ISIMSJA2_FILE_EF_MILENAGE_CFG(res.apdu)
+		ef = SYSMO_ISIMSJA2_FILE_EF_MILENAGE_CFG(self.__read_file(("ADF_USIM", tuple(SYSMO_ISIMSJA2_EF_MILENAGE_CFG))))
 
 		print(" * Current Milenage Parameters:")
 		print(str(ef))
@@ -711,8 +652,7 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		print("Programming Milenage parameters...")
 
 		if (len(params) < 85):
-			print("Error: Short milenage parameters!")
-			return
+			raise ValueError("Short milenage parameters!")
 		params_swapped = params[80:85] + params[0:80]
 
 		self._init()
@@ -723,36 +663,169 @@ class Sysmo_isim_sja2(Sysmo_usim):
 
 		print(" * Programming...")
 		# Note: The milenage configuration file in ADF_USIM and
-		# ADF_ISIM are linked, however we write to both locations,
-		# just to be sure.
-		self.sim.card.SELECT_ADF_USIM()
-		self.sim.select(SYSMO_ISIMSJA2_EF_MILENAGE_CFG)
-		self.sim.update_binary(ef_milenage_cfg.encode())
-		if self.sim.has_isim:
-			self.sim.card.SELECT_ADF_ISIM()
-			self.sim.select(SYSMO_ISIMSJA2_EF_MILENAGE_CFG)
-			self.sim.update_binary(ef_milenage_cfg.encode())
+		# ADF_ISIM are linked, the file in ADF_ISIM is only written
+		# when the link could not be verified.
+		self.begin_staging()
+		self.__write_file(("ADF_USIM", tuple(SYSMO_ISIMSJA2_EF_MILENAGE_CFG)), ef_milenage_cfg.encode())
+		loc = ("ADF_ISIM", tuple(SYSMO_ISIMSJA2_EF_MILENAGE_CFG))
+		if self.sim.has_isim and self._canonical(loc) == loc:
+			self.__write_file(loc, ef_milenage_cfg.encode())
 		print("")
-
-	# Select DF_SYSTEM/EF_SIM_AUTH_KEY
-	def __select_ef_sim_auth_key(self):
-		self.sim.select(GSM_SIM_MF)
-		self.sim.select(SYSMO_ISIMSJA2_DF_SYSTEM)
-		self.sim.select(SYSMO_ISIMSJA2_EF_SIM_AUTH_KEY)
-
-	# Authentication keys exist in various different files, which are
-	# similar, this method simplifies the selection of those files
-	def __select_xsim_auth_key(self, isim = False, _2G = False):
-		self.sim.select(GSM_SIM_MF)
-		if isim:
+		self.flush_staged()
+
+	# Select a file by its location (see SYSMO_ISIMSJA2_LINKS)
+	def _select_location(self, loc):
+		df, fid = loc
+		if df == "DF_SYSTEM":
+			return self.sim.select_path([SYSMO_ISIMSJA2_DF_SYSTEM, fid])
+		elif df == "ADF_ISIM":
 			self.sim.card.SELECT_ADF_ISIM()
 		else:
 			self.sim.card.SELECT_ADF_USIM()
+		return self.sim.select(fid)
+
+	def verify_links(self):
+		"""
+		Verify the hard links of the model (see SYSMO_ISIMSJA2_LINKS) on
+		the card, without writing to it. A group is taken as linked when
+		all its locations are selectable and hold files of the same size
+		and contents, locations in ADF_ISIM are left out when there is no
+		ISIM. The check is done once per card, it can not tell a link from
+		a copy with the same contents, so the groups must only list files
+		that are documented as links.
+		"""
+		if self.linked is not None:
+			return self.linked
+		self.linked = {}
+		for group in self.links:
+			if not self.sim.has_isim:
+				group = [loc for loc in group if loc[0] != "ADF_ISIM"]
+			contents = set()
+			for loc in group:
+				res = self._select_location(loc)
+				if res.sw != [0x90, 0x00]:
+					break
+				res = self.sim.read_binary(self.sim.filelen)
+				if res.sw != [0x90, 0x00] or len(res.apdu) != self.sim.filelen:
+					break
+				contents.add(bytes(res.apdu))
+			else:
+				if len(contents) == 1:
+					for loc in group:
+						self.linked[loc] = group[0]
+		return self.linked
+
+	# Location of the file that is read or written instead of loc, the
+	# links are only verified for locations that may be redirected
+	def _canonical(self, loc):
+		if not any(loc in group[1:] for group in self.links):
+			return loc
+		return self.verify_links().get(loc, loc)
+
+	# Session that holds the file contents while changes are staged (see
+	# begin_staging), None otherwise
+	session = None
+	session_depth = 0
+
+	def begin_staging(self):
+		"""
+		Stage changes to the proprietary files. Until the matching call
+		of flush_staged(), each file is read from the card only once and
+		all show and write methods work on the contents in memory. Calls
+		may be nested, the changes are written by the outermost
+		flush_staged().
+		"""
+		if self.session is None:
+			self.session = CardSession(self)
+			super().begin_staging()
+		self.session_depth += 1
+
+	def flush_staged(self):
+		"""
+		Write the staged changes, each changed file is written once
+		"""
+		self.session_depth -= 1
+		if self.session_depth > 0:
+			return
+		# The session is kept until all files are written, so that the
+		# files that are not written are listed (see drop_staged)
+		session = self.session
+		report = any(entry[2] for entry in session.files.values())
+		if report:
+			print("Writing proprietary files...")
+		if not session.flush():
+			exit(1)
+		if report:
+			print("")
+		self.session = None
+		super().flush_staged()
 
+	def drop_staged(self):
+		"""
+		Drop the staged changes when a task failed, the files whose
+		changes are not written are listed
+		"""
+		session, self.session = self.session, None
+		self.session_depth = 0
+		if session is not None and session.changed():
+			print(" * The staged changes to the following files were not written:")
+			for name in session.changed():
+				print("   %s" % name)
+			print("")
+		super().drop_staged()
+
+	def __read_file(self, loc):
+		"""
+		Read the contents of a proprietary file, from the session when
+		changes are staged
+		"""
+		if self.session is not None:
+			return self.session.read(loc)
+		self._select_location(self._canonical(loc))
+		return self._read_binary(self.sim.filelen).apdu
+
+	def __outcome(self):
+		"""
+		How a change made by __write_file() is reported: staged by the
+		caller of the write method or programmed right away
+		"""
+		if self.session_depth > 1:
+			return "staged"
+		return "programmed"
+
+	def __write_file(self, loc, data):
+		"""
+		Write a proprietary file, the write methods must call
+		begin_staging() and flush_staged(). Unless the changes are
+		staged by the caller of the write method, the file is written
+		right away, while it is still selected.
+		"""
+		self.session.write(loc, data)
+		if self.session_depth == 1 and not self.session.flush():
+			exit(1)
+
+	# Location of an authentication key file
+	def __xsim_auth_key(self, isim = False, _2G = False):
 		if _2G:
-			self.sim.select(SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY_2G)
+			fid = SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY_2G
 		else:
-			self.sim.select(SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY)
+			fid = SYSMO_ISIMSJA2_EF_USIM_AUTH_KEY
+		return ("ADF_ISIM" if isim else "ADF_USIM", tuple(fid))
+
+	def __read_xsim_auth_key(self, isim = False, _2G = False):
+		"""
+		Read and decode an authentication key file
+		"""
+		return SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(self.__read_file(self.__xsim_auth_key(isim, _2G)))
+
+	def __write_xsim_auth_key(self, ef, isim = False, _2G = False):
+		"""
+		Write an authentication key file. The staged contents are decoded
+		again on the next read, so that a changed algorithm also changes
+		the layout of the key and parameters, just as if the file was
+		read from the card.
+		"""
+		self.__write_file(self.__xsim_auth_key(isim, _2G), ef.encode())
 
 	# In the SJA2 model the key material and the algorithm configuration
 	# is distributed over multiple files, which may also have redundant
@@ -764,71 +837,15 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		print("Reading propritary files...")
 		self._init()
 
-		# DF_SYSTEM/EF_SIM_AUTH_KEY:
-		self.__select_ef_sim_auth_key()
-		res = self._read_binary(self.sim.filelen)
-		print(" * DF_SYSTEM/EF_SIM_AUTH_KEY:")
-		print(SYSMO_ISIMSJA2_FILE_EF_SIM_AUTH_KEY(res.apdu))
-
-		# ADF_USIM/EF_USIM_AUTH_KEY_2G:
-		self.__select_xsim_auth_key(isim = False, _2G = True)
-		res = self._read_binary(self.sim.filelen)
-		print(" * ADF_USIM/EF_USIM_AUTH_KEY_2G:")
-		print(SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY_2G(res.apdu))
-
-		if self.sim.has_isim:
-			# ADF_ISIM/EF_ISIM_AUTH_KEY_2G:
-			self.__select_xsim_auth_key(isim = True, _2G = True)
-			res = self._read_binary(self.sim.filelen)
-			print(" * ADF_ISIM/EF_ISIM_AUTH_KEY_2G:")
-			print(SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY_2G(res.apdu))
-
-		# ADF_USIM/EF_USIM_AUTH_KEY:
-		self.__select_xsim_auth_key(isim = False, _2G = False)
-		res = self._read_binary(self.sim.filelen)
-		print(" * ADF_USIM/EF_USIM_AUTH_KEY:")
-		print(SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu))
-
-		if self.sim.has_isim:
-			# ADF_ISIM/EF_ISIM_AUTH_KEY:
-			self.__select_xsim_auth_key(isim = True, _2G = False)
-			res = self._read_binary(self.sim.filelen)
-			print(" * ADF_ISIM/EF_ISIM_AUTH_KEY:")
-			print(SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu))
-
-		# ADF_USIM/EF_MILENAGE_CFG:
-		self.sim.select(GSM_SIM_MF)
-		self.sim.card.SELECT_ADF_USIM()
-		self.sim.select(SYSMO_ISIMSJA2_EF_MILENAGE_CFG)
-		res = self._read_binary(self.sim.filelen)
-		print(" * ADF_USIM/EF_MILENAGE_CFG:")
-		print(SYSMO_ISIMSJA2_FILE_EF_MILENAGE_CFG(res.apdu))
-
-		if self.sim.has_isim:
-			# ADF_ISIM/EF_MILENAGE_CFG:
-			self.sim.select(GSM_SIM_MF)
-			self.sim.card.SELECT_ADF_ISIM()
-			self.sim.select(SYSMO_ISIMSJA2_EF_MILENAGE_CFG)
-			res = self._read_binary(self.sim.filelen)
-			print(" * ADF_ISIM/EF_MILENAGE_CFG:")
-			print(SYSMO_ISIMSJA2_FILE_EF_MILENAGE_CFG(res.apdu))
-
-		# ADF_USIM/EF_USIM_SQN:
-		self.sim.select(GSM_SIM_MF)
-		self.sim.card.SELECT_ADF_USIM()
-		self.sim.select(SYSMO_ISIMSJA2_EF_USIM_SQN)
-		res = self._read_binary(self.sim.filelen)
-		print(" * ADF_USIM/EF_USIM_SQN:")
-		print(SYSMO_ISIMSJAX_FILE_EF_USIM_SQN(res.apdu))
-
-		if self.sim.has_isim:
-			# ADF_USIM/EF_ISIM_SQN:
-			self.sim.select(GSM_SIM_MF)
-			self.sim.card.SELECT_ADF_ISIM()
-			self.sim.select(SYSMO_ISIMSJA2_EF_USIM_SQN)
-			res = self._read_binary(self.sim.filelen)
-			print(" * ADF_ISIM/EF_ISIM_SQN:")
-			print(SYSMO_ISIMSJAX_FILE_EF_USIM_SQN(res.apdu))
+		# Linked files are read only once (see verify_links)
+		self.begin_staging()
+		for loc, name, file_class in SYSMO_ISIMSJA2_FILES:
+			if loc[0] == "ADF_ISIM" and not self.sim.has_isim:
+				continue
+			content = self.__read_file(loc)
+			print(" * %s:" % name)
+			print(file_class(content))
+		self.flush_staged()
 
 	def __display_key(self, ef, gen:str):
 		"""
@@ -852,18 +869,12 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		self._init()
 
 		print(" * Reading...")
-		self.__select_xsim_auth_key(isim = False, _2G = True)
-		res = self._read_binary(self.sim.filelen)
-		ef_2g = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+		ef_2g = self.__read_xsim_auth_key(isim = False, _2G = True)
 
-		self.__select_xsim_auth_key(isim = False, _2G = False)
-		res = self._read_binary(self.sim.filelen)
-		ef_3g = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+		ef_3g = self.__read_xsim_auth_key(isim = False, _2G = False)
 
 		if self.sim.has_isim:
-			self.__select_xsim_auth_key(isim = True, _2G = False)
-			res = self._read_binary(self.sim.filelen)
-			ef_4g5g = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+			ef_4g5g = self.__read_xsim_auth_key(isim = True, _2G = False)
 		else:
 			ef_4g5g = None
 
@@ -875,23 +886,23 @@ class Sysmo_isim_sja2(Sysmo_usim):
 
 		print("")
 
-	def __program_key(self, key, gen:str):
+	def __program_key(self, key, isim:bool, _2G:bool, gen:str):
 		"""
-		Helper method to program key, EF must be selected first
+		Helper method to program key, reads and writes the file
+		selected by isim and _2G
 		"""
-		res = self._read_binary(self.sim.filelen)
-		ef = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+		ef = self.__read_xsim_auth_key(isim, _2G)
 		if ef.algo in sysmo_isimsjax_16_byte_key_algorithms:
 			ef.algo_key.ki = key
-			self.sim.update_binary(ef.encode())
-			print(" * %s: Key programmed." % gen)
+			self.__write_xsim_auth_key(ef, isim, _2G)
+			print(" * %s: Key %s." % (gen, self.__outcome()))
 		elif ef.algo is SYSMO_ISIMSJA5_ALGO_TUAK:
 			ef.algo_key.key = key
 			ef.algo_pars.use_256_bit_key = False
 			if len(key) > 16:
 				ef.algo_pars.use_256_bit_key = True
-			self.sim.update_binary(ef.encode())
-			print(" * %s: Key programmed." % gen)
+			self.__write_xsim_auth_key(ef, isim, _2G)
+			print(" * %s: Key %s." % (gen, self.__outcome()))
 		else:
 			print(" * %s: Key not applicable for selected algorithm." % gen)
 
@@ -904,15 +915,14 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		print(" * New Key setting:")
 		print("   Key: " + hexdump(key))
 		print(" * Programming...")
-		self.__select_xsim_auth_key(isim = False, _2G = True)
-		self.__program_key(key, "2g")
-		self.__select_xsim_auth_key(isim = False, _2G = False)
-		self.__program_key(key, "3g")
+		self.begin_staging()
+		self.__program_key(key, False, True, "2g")
+		self.__program_key(key, False, False, "3g")
 		if self.sim.has_isim:
-			self.__select_xsim_auth_key(isim = True, _2G = False)
-			self.__program_key(key, "4g5g")
+			self.__program_key(key, True, False, "4g5g")
 
 		print("")
+		self.flush_staged()
 
 	def show_auth_params(self):
 		"""
@@ -922,20 +932,14 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		self._init()
 
 		print(" * Reading...")
-		self.__select_xsim_auth_key(isim = False, _2G = True)
-		res = self._read_binary(self.sim.filelen)
-		ef = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY_2G(res.apdu)
+		ef = self.__read_xsim_auth_key(isim = False, _2G = True)
 		algo_2g = ef.algo
 
-		self.__select_xsim_auth_key(isim = False, _2G = False)
-		res = self._read_binary(self.sim.filelen)
-		ef = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+		ef = self.__read_xsim_auth_key(isim = False, _2G = False)
 		algo_3g = ef.algo
 
 		if self.sim.has_isim:
-			self.__select_xsim_auth_key(isim = True, _2G = False)
-			res = self._read_binary(self.sim.filelen)
-			ef = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+			ef = self.__read_xsim_auth_key(isim = True, _2G = False)
 			algo_4g5g = ef.algo
 		else:
 			algo_4g5g = algo_3g
@@ -946,6 +950,18 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		print("   4g5g: %d=%s" % (algo_3g, id_to_str(self.algorithms, algo_4g5g)))
 		print("")
 
+	def __algo_id(self, algo_str):
+		"""
+		Algorithm ID of a name or a number given on the commandline
+		"""
+		if algo_str.isdigit():
+			return int(algo_str)
+		algo = str_to_id(self.algorithms, algo_str, -1)
+		if algo < 0:
+			raise ValueError("Invalid algorithm \"%s\", valid algorithms are: %s" %
+					 (algo_str, ", ".join([name for nr, name in self.algorithms])))
+		return algo
+
 	def write_auth_params(self, algo_2g_str, algo_3g_str, algo_4g5g_str = None):
 		"""
 		Write new authentication parameters
@@ -953,21 +969,10 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		print("Programming Authentication parameters...")
 		self._init()
 
-		if algo_2g_str.isdigit():
-			algo_2g = int(algo_2g_str)
-		else:
-			algo_2g = str_to_id(self.algorithms, algo_2g_str)
-
-		if algo_3g_str.isdigit():
-			algo_3g = int(algo_3g_str)
-		else:
-			algo_3g = str_to_id(self.algorithms, algo_3g_str)
-
+		algo_2g = self.__algo_id(algo_2g_str)
+		algo_3g = self.__algo_id(algo_3g_str)
 		if algo_4g5g_str:
-			if algo_4g5g_str.isdigit():
-				algo_4g5g = int(algo_4g5g_str)
-			else:
-				algo_4g5g = str_to_id(self.algorithms, algo_4g5g_str)
+			algo_4g5g = self.__algo_id(algo_4g5g_str)
 		else:
 			algo_4g5g = algo_3g
 
@@ -977,27 +982,23 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		print("   4g5g: %d=%s" % (algo_4g5g, id_to_str(self.algorithms, algo_4g5g)))
 
 		print(" * Programming...")
+		self.begin_staging()
 
-		self.__select_xsim_auth_key(isim = False, _2G = True)
-		res = self._read_binary(self.sim.filelen)
-		ef = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+		ef = self.__read_xsim_auth_key(isim = False, _2G = True)
 		ef.algo = algo_2g
-		self.sim.update_binary(ef.encode())
+		self.__write_xsim_auth_key(ef, isim = False, _2G = True)
 
-		self.__select_xsim_auth_key(isim = False, _2G = False)
-		res = self._read_binary(self.sim.filelen)
-		ef = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+		ef = self.__read_xsim_auth_key(isim = False, _2G = False)
 		ef.algo = algo_3g
-		self.sim.update_binary(ef.encode())
+		self.__write_xsim_auth_key(ef, isim = False, _2G = False)
 
 		if self.sim.has_isim:
-			self.__select_xsim_auth_key(isim = True, _2G = False)
-			res = self._read_binary(self.sim.filelen)
-			ef = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+			ef = self.__read_xsim_auth_key(isim = True, _2G = False)
 			ef.algo = algo_4g5g
-			self.sim.update_binary(ef.encode())
+			self.__write_xsim_auth_key(ef, isim = True, _2G = False)
 
 		print("")
+		self.flush_staged()
 
 	def __display_opc(self, ef, gen:str):
 		"""
@@ -1020,18 +1021,12 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		self._init()
 
 		print(" * Reading...")
-		self.__select_xsim_auth_key(isim = False, _2G = True)
-		res = self._read_binary(self.sim.filelen)
-		ef_2g = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+		ef_2g = self.__read_xsim_auth_key(isim = False, _2G = True)
 
-		self.__select_xsim_auth_key(isim = False, _2G = False)
-		res = self._read_binary(self.sim.filelen)
-		ef_3g = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+		ef_3g = self.__read_xsim_auth_key(isim = False, _2G = False)
 
 		if self.sim.has_isim:
-			self.__select_xsim_auth_key(isim = True, _2G = False)
-			res = self._read_binary(self.sim.filelen)
-			ef_4g5g = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+			ef_4g5g = self.__read_xsim_auth_key(isim = True, _2G = False)
 		else:
 			ef_4g5g = None
 
@@ -1043,22 +1038,22 @@ class Sysmo_isim_sja2(Sysmo_usim):
 
 		print("")
 
-	def __program_opc(self, select:bool, op, gen:str):
+	def __program_opc(self, select:bool, op, isim:bool, _2G:bool, gen:str):
 		"""
-		Helper method to program OP/OPc, EF must be selected first
+		Helper method to program OP/OPc, reads and writes the file
+		selected by isim and _2G
 		"""
-		res = self._read_binary(self.sim.filelen)
-		ef = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+		ef = self.__read_xsim_auth_key(isim, _2G)
 		if ef.algo is SYSMO_ISIMSJA2_ALGO_MILENAGE:
 			ef.algo_key.opc = op
 			ef.algo_pars.use_opc = bool(select)
-			self.sim.update_binary(ef.encode())
-			print("   %s %s programmed." % (gen, id_to_str(sysmo_isimsjax_op_opc, bool(select))));
+			self.__write_xsim_auth_key(ef, isim, _2G)
+			print("   %s %s %s." % (gen, id_to_str(sysmo_isimsjax_op_opc, bool(select)), self.__outcome()));
 		elif ef.algo is SYSMO_ISIMSJA5_ALGO_TUAK and len(op) is 32:
 			ef.algo_key.topc = op
 			ef.algo_pars.use_topc = bool(select)
-			self.sim.update_binary(ef.encode())
-			print("   %s %s programmed." % (gen, id_to_str(sysmo_isimsja5_top_topc, bool(select))));
+			self.__write_xsim_auth_key(ef, isim, _2G)
+			print("   %s %s %s." % (gen, id_to_str(sysmo_isimsja5_top_topc, bool(select)), self.__outcome()));
 		else:
 			print("   %s OP/OPc not applicable for selected algorithm, skipping..." % gen)
 
@@ -1077,15 +1072,14 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		print("   %s: %s" % (id_to_str(sysmo_isimsjax_op_opc, bool(select)), hexdump(op)))
 
 		print(" * Programming...")
-		self.__select_xsim_auth_key(isim = False, _2G = True)
-		self.__program_opc(select, op, "2g")
-		self.__select_xsim_auth_key(isim = False, _2G = False)
-		self.__program_opc(select, op, "3g")
+		self.begin_staging()
+		self.__program_opc(select, op, False, True, "2g")
+		self.__program_opc(select, op, False, False, "3g")
 		if self.sim.has_isim:
-			self.__select_xsim_auth_key(isim = True, _2G = False)
-			self.__program_opc(select, op, "4g5g")
+			self.__program_opc(select, op, True, False, "4g5g")
 
 		print("")
+		self.flush_staged()
 
 	def show_milenage_sqn_params(self):
 		"""
@@ -1095,19 +1089,13 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		self._init()
 
 		print(" * Current SQN Configuration for ADF_USIM:")
-		self.sim.select(GSM_SIM_MF)
-		self.sim.card.SELECT_ADF_USIM()
-		self.sim.select(SYSMO_ISIMSJA2_EF_USIM_SQN)
-		res = self._read_binary(self.sim.filelen)
-		print(SYSMO_ISIMSJAX_FILE_EF_USIM_SQN(res.apdu))
+		content = self.__read_file(("ADF_USIM", tuple(SYSMO_ISIMSJA2_EF_USIM_SQN)))
+		print(SYSMO_ISIMSJAX_FILE_EF_USIM_SQN(content))
 
 		if self.sim.has_isim:
 			print(" * Current SQN Configuration for ADF_ISIM:")
-			self.sim.select(GSM_SIM_MF)
-			self.sim.card.SELECT_ADF_ISIM()
-			self.sim.select(SYSMO_ISIMSJA2_EF_USIM_SQN)
-			res = self._read_binary(self.sim.filelen)
-			print(SYSMO_ISIMSJAX_FILE_EF_USIM_SQN(res.apdu))
+			content = self.__read_file(("ADF_ISIM", tuple(SYSMO_ISIMSJA2_EF_USIM_SQN)))
+			print(SYSMO_ISIMSJAX_FILE_EF_USIM_SQN(content))
 
 		print("")
 
@@ -1119,20 +1107,18 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		self._init()
 
 		print(" * Resetting...")
-		self.sim.select(GSM_SIM_MF)
-
-		self.sim.card.SELECT_ADF_USIM()
-		self.sim.select(SYSMO_ISIMSJA2_EF_USIM_SQN)
+		# Only the parts of the freshness array that are not yet at
+		# their defaults are written (see CardSession.flush)
+		self.begin_staging()
 		ef = SYSMO_ISIMSJAX_FILE_EF_USIM_SQN()
-		self.sim.update_binary(ef.encode())
+		self.__write_file(("ADF_USIM", tuple(SYSMO_ISIMSJA2_EF_USIM_SQN)), ef.encode())
 
 		if self.sim.has_isim:
-			self.sim.card.SELECT_ADF_ISIM()
-			self.sim.select(SYSMO_ISIMSJA2_EF_USIM_SQN)
 			ef = SYSMO_ISIMSJAX_FILE_EF_USIM_SQN()
-			self.sim.update_binary(ef.encode())
+			self.__write_file(("ADF_ISIM", tuple(SYSMO_ISIMSJA2_EF_USIM_SQN)), ef.encode())
 
 		print("")
+		self.flush_staged()
 
 	def __display_tuak_cfg(self, ef, gen:str):
 		"""
@@ -1152,18 +1138,12 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		self._init()
 
 		print(" * Reading...")
-		self.__select_xsim_auth_key(isim = False, _2G = True)
-		res = self._read_binary(self.sim.filelen)
-		ef_2g = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+		ef_2g = self.__read_xsim_auth_key(isim = False, _2G = True)
 
-		self.__select_xsim_auth_key(isim = False, _2G = False)
-		res = self._read_binary(self.sim.filelen)
-		ef_3g = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+		ef_3g = self.__read_xsim_auth_key(isim = False, _2G = False)
 
 		if self.sim.has_isim:
-			self.__select_xsim_auth_key(isim = True, _2G = False)
-			res = self._read_binary(self.sim.filelen)
-			ef_4g5g = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY(res.apdu)
+			ef_4g5g = self.__read_xsim_auth_key(isim = True, _2G = False)
 		else:
 			ef_4g5g = None
 
@@ -1174,19 +1154,19 @@ class Sysmo_isim_sja2(Sysmo_usim):
 			self.__display_tuak_cfg(ef_4g5g, "4g5g")
 		print("")
 
-	def __program_tuak_cfg(self, res_size:int, mac_size:int, ckik_size:int, num_keccak:int, gen:str):
+	def __program_tuak_cfg(self, res_size:int, mac_size:int, ckik_size:int, num_keccak:int, isim:bool, _2G:bool, gen:str):
 		"""
-		Helper method to program key, EF must be selected first
+		Helper method to program key, reads and writes the file
+		selected by isim and _2G
 		"""
-		res = self._read_binary(self.sim.filelen)
-		ef = SYSMO_ISIMSJAX_FILE_EF_USIM_AUTH_KEY_2G(res.apdu)
+		ef = self.__read_xsim_auth_key(isim, _2G)
 		if ef.algo is SYSMO_ISIMSJA5_ALGO_TUAK:
 			ef.algo_key.res_size = res_size
 			ef.algo_key.mac_size = mac_size
 			ef.algo_key.ckik_size = bool(ckik_size)
 			ef.algo_key.num_keccak = num_keccak
-			self.sim.update_binary(ef.encode())
-			print("   %s TUAK configuration programmed." % gen);
+			self.__write_xsim_auth_key(ef, isim, _2G)
+			print("   %s TUAK configuration %s." % (gen, self.__outcome()));
 		else:
 			print("   %s TUAK configuration not applicable for selected algorithm, skipping..." % gen)
 
@@ -1199,27 +1179,19 @@ class Sysmo_isim_sja2(Sysmo_usim):
 
 		res_size = str_to_id(sysmo_isimsja5_res_sizes, res_size_str, -1)
 		if res_size < 0:
-			print(" * Invalid TUAK configuration, RES-Size must be 32, 64, 128 or 256 bit!")
-			print("")
-			return
+			raise ValueError("Invalid TUAK configuration, RES-Size must be 32, 64, 128 or 256 bit!")
 
 		mac_size = str_to_id(sysmo_isimsja5_mac_sizes, mac_size_str, -1)
 		if mac_size < 0:
-			print(" * Invalid TUAK configuration, MAC-Size must be 64, 128 or 256 bit!")
-			print("")
-			return
+			raise ValueError("Invalid TUAK configuration, MAC-Size must be 64, 128 or 256 bit!")
 
 		ckik_size = str_to_id(sysmo_isimsja5_ckik_sizes, ckik_size_str, -1)
 		if ckik_size < 0:
-			print(" * Invalid TUAK configuration, MAC-Size must be 128 or 256 bit!")
-			print("")
-			return
+			raise ValueError("Invalid TUAK configuration, CK/IK-Size must be 128 or 256 bit!")
 
+		if not num_keccak_str.isdigit() or int(num_keccak_str) > 255:
+			raise ValueError("Invalid TUAK configuration, number of Keccak iterations must not exceed 256!")
 		num_keccak = int(num_keccak_str)
-		if num_keccak > 255:
-			print(" * Invalid TUAK configuration, number of Keccak iterations must not exceed 256!")
-			print("")
-			return
 
 		print("   RES size: %s bit" % id_to_str(sysmo_isimsja5_res_sizes, res_size))
 		print("   MAC-A/MAC-S size: %s bit" % id_to_str(sysmo_isimsja5_mac_sizes, mac_size))
@@ -1227,55 +1199,16 @@ class Sysmo_isim_sja2(Sysmo_usim):
 		print("   Keccak iterations: %d" % num_keccak)
 
 		print(" * Programming...")
-		self.__select_xsim_auth_key(isim = False, _2G = True)
-		self.__program_tuak_cfg(res_size, mac_size, ckik_size, num_keccak, "2g")
-		self.__select_xsim_auth_key(isim = False, _2G = False)
-		self.__program_tuak_cfg(res_size, mac_size, ckik_size, num_keccak, "3g")
+		self.begin_staging()
+		self.__program_tuak_cfg(res_size, mac_size, ckik_size, num_keccak, False, True, "2g")
+		self.__program_tuak_cfg(res_size, mac_size, ckik_size, num_keccak, False, False, "3g")
 		if self.sim.has_isim:
-			self.__select_xsim_auth_key(isim = True, _2G = False)
-			self.__program_tuak_cfg(res_size, mac_size, ckik_size, num_keccak, "4g5g")
+			self.__program_tuak_cfg(res_size, mac_size, ckik_size, num_keccak, True, False, "4g5g")
 
 		print("")
+		self.flush_staged()
 
 class Sysmo_isim_sja5(Sysmo_isim_sja2):
 	algorithms = sysmo_isimsja5_algorithms
-
-	def __init__(self):
-		card_detected = False
-
-		# Try card model #1: sysmoISIM-SJA5 (9FV)
-		try:
-			atr = "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 35 75 30 35 02 59 C4"
-			print("Trying to find card with ATR: " + atr)
-			Sysmo_usim.__init__(self, atr)
-			card_detected = True
-		except:
-			print(" * Card not detected!")
-
-		if card_detected == True:
-			return
-
-		# Try card model #2: sysmoISIM-SJA5 (SLM17)
-		try:
-			atr = "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 35 75 30 35 02 65 F8"
-			print("Trying to find card with ATR: " + atr)
-			Sysmo_usim.__init__(self, atr)
-			card_detected = True
-		except:
-			print(" * Card not detected!")
-
-		if card_detected == True:
-			return
-
-		# Try card model #3: sysmoISIM-SJA5 (3FJ)
-		try:
-			atr = "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 35 75 30 35 02 51 CC"
-			print("Trying to find card with ATR: " + atr)
-			Sysmo_usim.__init__(self, atr)
-			card_detected = True
-		except:
-			print(" * Card not detected!")
-
-		# Exit when we are not able to detect the card
-		if card_detected != True:
-			sys.exit(1)
+	models = ("sysmoISIM-SJA5 (9FV)", "sysmoISIM-SJA5 (SLM17)",
+		  "sysmoISIM-SJA5 (3FJ)")
@@ -31,13 +31,67 @@ import sys
 # CHV Types
 SYSMO_USIM_ADM1 = 0x0A
 
+# ATRs of the sysmocom card models: (model, ATR, mask), a card is of the
+# model when its ATR equals the listed one in all bits set in the mask
+# (no mask: all bits are compared). The last historical bytes hold the
+# version of the card OS, they are left out, as is the checksum (TCK). On
+# the SJA5, the last historical byte tells the chip apart.
+SYSMO_ATR_MASK = "FF FF FF FF FF FF FF FF FF FF FF FF FF FF FF FF FF 00 00 00 00 00"
+SYSMO_ATR_MASK_SJA5 = "FF FF FF FF FF FF FF FF FF FF FF FF FF FF FF FF FF 00 00 00 FF 00"
+SYSMO_MODELS = [
+	("sysmoUSIM-SJS1", "3B 9F 96 80 1F C7 80 31 A0 73 BE 21 13 67 43 20 07 18 00 00 01 A5", SYSMO_ATR_MASK),
+	("sysmoISIM-SJA2", "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 4C 75 30 34 05 4B A9", SYSMO_ATR_MASK),
+	("sysmoTSIM", "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 4C 52 75 31 04 51 D5", SYSMO_ATR_MASK),
+	("sysmoISIM-SJA5 (9FV)", "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 35 75 30 35 02 59 C4", SYSMO_ATR_MASK_SJA5),
+	("sysmoISIM-SJA5 (SLM17)", "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 35 75 30 35 02 65 F8", SYSMO_ATR_MASK_SJA5),
+	("sysmoISIM-SJA5 (3FJ)", "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 35 75 30 35 02 51 CC", SYSMO_ATR_MASK_SJA5),
+]
+
+# Find the card model of an ATR (list of bytes), returns None when the ATR
+# is not in SYSMO_MODELS
+def sysmo_model(atr):
+	for model, model_atr, mask in SYSMO_MODELS:
+		model_atr = toBytes(model_atr)
+		if len(atr) != len(model_atr):
+			continue
+		if mask is None:
+			if list(atr) == model_atr:
+				return model
+			continue
+		mask = toBytes(mask)
+		if all((a ^ m) & k == 0 for a, m, k in zip(atr, model_atr, mask)):
+			return model
+	return None
+
 class Sysmo_usim:
 
 	sim = None
 
-	def __init__(self, atr):
+	# Card models (see SYSMO_MODELS) the class is able to handle
+	models = ()
+
+	# Desired-state mode: files are compared against their new contents
+	# and only written when they differ (see _update_binary)
+	skip_unchanged = False
+
+	def __init__(self, transport = None):
 		print("Initializing smartcard terminal...")
-		self.sim = Simcard(GSM_USIM, toBytes(atr))
+
+		# Connect to any card and identify the model from its ATR, so
+		# that only a single connection attempt is made
+		try:
+			self.sim = Simcard(GSM_USIM, None, transport)
+		except Exception as err:
+			print(" * Card not detected! (%s)" % err)
+			sys.exit(1)
+		atr = self.sim.card.ATR
+		model = sysmo_model(atr)
+		if model not in self.models:
+			print(" * Card not detected! (ATR: %s)" % toHexString(atr))
+			if model:
+				print("   Card is a %s, which is not supported by this tool" % model)
+			sys.exit(1)
+
 		self.sim.card.SELECT_ADF_USIM()
 		print(" * Detected Card IMSI:  %s" % self.sim.card.get_imsi())
 		if self.sim.has_isim:
@@ -58,21 +112,62 @@ class Sysmo_usim:
 		print("")
 
 
-	# Initialize card (select master file)
+	# Initialize card (select master file), the MF is only selected when
+	# the task accesses a file relative to it (see Simcard.select_mf)
 	def _init(self):
 		print(" * Initializing...")
-		self.sim.select(GSM_SIM_MF)
+		self.sim.select_mf()
 
 
 	# Read files sensitively
-	def _read_binary(self, length, offset=0):
-		res = self.sim.read_binary(length, offset)
+	def _read_binary(self, length, offset=0, buf=None):
+		res = self.sim.read_binary(length, offset, buf)
 		if len(res.apdu) != length:
 			print("   Error: could not read file (sw=%02x%02x) -- abort!\n" % (res.sw[0], res.sw[1]))
 			exit(1)
 		return res
 
 
+	# Report whether a file was written in desired-state mode
+	def _report_update(self, name, changed):
+		if self.skip_unchanged:
+			if changed:
+				print("   %s: updated" % name)
+			else:
+				print("   %s: unchanged" % name)
+
+
+	# Write the selected file, old holds the current file contents when
+	# already read by the caller. In desired-state mode, the file is read
+	# first (when old is not given) and only the bytes that differ are
+	# written, the outcome is reported with the name of the file.
+	def _update_binary(self, data, name, old = None):
+		if self.skip_unchanged and old is None:
+			old = self.sim.read_binary(len(data)).apdu
+		res = self.sim.update_binary(data, old = old)
+		if old is not None and res.sw == [0x90, 0x00]:
+			self._report_update(name, bytes(old[:len(data)]) != bytes(data))
+		return res
+
+
+	# Stage changes to the files that hold the authentication parameters,
+	# so that several write operations can be combined. The staged changes
+	# are written to the card by flush_staged(). Card models that do not
+	# support staging write their changes immediately. Until then, the
+	# contents of the files that are read are kept, so that each file is
+	# read only once (see Simcard.keep_contents).
+	def begin_staging(self):
+		self.sim.keep_contents()
+
+	def flush_staged(self):
+		self.sim.keep_contents(False)
+
+	# Drop the staged changes when a task failed, the changes that are
+	# dropped are reported
+	def drop_staged(self):
+		self.sim.keep_contents(False)
+
+
 	# Authenticate as administrator
 	def admin_auth(self, adm1, force = False):
 		print("Authenticating...")
@@ -119,7 +214,11 @@ class Sysmo_usim:
 		print("Reading ICCID value...")
 		self._init()
 		print(" * Reading...")
-		print(" * Card ICCID: %s" % self.sim.card.get_ICCID())
+		res = self.sim.read_binary_ef(GSM_SIM_EF_ICCID, 10)
+		iccid = None
+		if res.sw == [0x90, 0x00]:
+			iccid = decode_BCD(res.apdu)
+		print(" * Card ICCID: %s" % iccid)
 		print("")
 
 
@@ -138,7 +237,7 @@ class Sysmo_usim:
 		self.sim.select(GSM_SIM_EF_ICCID)
 
 		print(" * Programming...")
-		self.sim.update_binary(swap_nibbles(iccid))
+		self._update_binary(swap_nibbles(iccid), "EF_ICCID")
 		print("")
 
 
@@ -150,13 +249,12 @@ class Sysmo_usim:
 		print(" * New ISMI setting:")
 		print("   IMSI: " + hexdump(imsi))
 
-		self.sim.select(GSM_SIM_DF_GSM)
-		self.sim.select(GSM_SIM_EF_IMSI)
+		self.sim.select_path([GSM_SIM_DF_GSM, GSM_SIM_EF_IMSI])
 
 		imsi = [len(imsi)] + swap_nibbles(imsi)
 
 		print(" * Programming...")
-		self.sim.update_binary(imsi)
+		self._update_binary(imsi, "DF_GSM/EF_IMSI")
 		print("")
 
 
@@ -166,8 +264,7 @@ class Sysmo_usim:
 		self._init()
 
 		print(" * Reading...")
-		self.sim.select(GSM_SIM_DF_GSM)
-		self.sim.select(GSM_SIM_EF_AD)
+		self.sim.select_path([GSM_SIM_DF_GSM, GSM_SIM_EF_AD])
 		res = self.sim.read_binary(4)
 
 		print(" * Current MNCLEN setting:")
@@ -184,28 +281,24 @@ class Sysmo_usim:
 		print("   MNCLEN: " + "0x" + hexdump(mnclen))
 
 		if len(mnclen) != 1:
-			print(" * Error: mnclen value must consist of a single byte!")
-			return
+			raise ValueError("mnclen value must consist of a single byte!")
 
 		print(" * Programming...")
 
 		# EF.AD in DF.GSM
-		self.sim.select(GSM_SIM_DF_GSM)
-		self.sim.select(GSM_SIM_EF_AD)
+		self.sim.select_path([GSM_SIM_DF_GSM, GSM_SIM_EF_AD])
 
 		res = self.sim.read_binary(4)
-		new_ad = res.apdu[0:3] + mnclen
+		new_ad = bytes(res.apdu[0:3]) + bytes(mnclen)
 
-		self.sim.update_binary(new_ad)
+		self._update_binary(new_ad, "DF_GSM/EF_AD", res.apdu)
 
 		# EF.AD in ADF.USIM
 		self.sim.card.SELECT_ADF_USIM()
-		self.sim.select(GSM_SIM_EF_AD)
-
-		res = self.sim.read_binary(4)
-		new_ad = res.apdu[0:3] + mnclen
+		res = self.sim.read_binary_ef(GSM_SIM_EF_AD, 4)
+		new_ad = bytes(res.apdu[0:3]) + bytes(mnclen)
 
-		self.sim.update_binary(new_ad)
+		self._update_binary(new_ad, "ADF_USIM/EF_AD", res.apdu)
 
 		print("")
 
@@ -217,11 +310,8 @@ class Sysmo_usim:
 		self.sim.card.get_AID()
 		AID = self.sim.card.AID
 		for a in AID:
-			if a[0:7] == [0xA0, 0x00, 0x00, 0x00, 0x87, 0x10, 0x02]:
-				appstr = "USIM"
-			elif a[0:7] == [0xA0, 0x00, 0x00, 0x00, 0x87, 0x10, 0x04]:
-				appstr = "ISIM"
-			else:
+			appstr = self.sim.card.AID_app.get(bytes(a))
+			if appstr is None:
 				appstr = "(unknown)"
 			print("   AID: " + hexdump(a[0:5]) + " " +  hexdump(a[5:7]) + " " +  hexdump(a[7:]) + " ==> " + appstr)
 		print("")
@@ -84,82 +84,52 @@ SYSMO_USIM_EF_DIR_REC_1_CONTENT = [0x61, 0x19, 0x4f, 0x10] + SYSMO_USIM_AID + \
 
 # Abstraction for the file structure of EF.MLNGC, which holds the
 # parameters of the milenage authentication algorithm
-class SYSMO_USIMSJS1_FILE_EF_MLNGC:
+class SYSMO_USIMSJS1_FILE_EF_MLNGC(FileStruct):
 	# Default parameters, see also sysmousim-manual.pdf,
 	# cap. 8.6 "Milenage Configuration (Ci/Ri)
-	C1 = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]
-	C2 = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01]
-	C3 = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x02]
-	C4 = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x04]
-	C5 = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x08]
-	R1 = 0x40
-	R2 = 0x00
-	R3 = 0x20
-	R4 = 0x40
-	R5 = 0x60
+	schema = FileSchema(
+		Field("C1", "16s", [0x00] * 16),
+		Field("C2", "16s", [0x00] * 15 + [0x01]),
+		Field("C3", "16s", [0x00] * 15 + [0x02]),
+		Field("C4", "16s", [0x00] * 15 + [0x04]),
+		Field("C5", "16s", [0x00] * 15 + [0x08]),
+		Field("R1", "B", 0x40),
+		Field("R2", "B", 0x00),
+		Field("R3", "B", 0x20),
+		Field("R4", "B", 0x40),
+		Field("R5", "B", 0x60))
+	__slots__ = schema.names
 
 	def __init__(self, content = None):
-		if content == None:
-			return
-		if len(content) != 85:
-			return
-		self.C1 = content[0:16]
-		self.C2 = content[16:32]
-		self.C3 = content[32:48]
-		self.C4 = content[48:64]
-		self.C5 = content[64:80]
-		self.R1 = content[80]
-		self.R2 = content[81]
-		self.R3 = content[82]
-		self.R4 = content[83]
-		self.R5 = content[84]
-
-	def __str__(self):
-		dump = "   C1: " + hexdump(self.C1) + "\n"
-		dump += "   C2: " + hexdump(self.C2) + "\n"
-		dump += "   C3: " + hexdump(self.C3) + "\n"
-		dump += "   C4: " + hexdump(self.C4) + "\n"
-		dump += "   C5: " + hexdump(self.C5) + "\n"
-		dump += "   R1: " + str(hex(self.R1)) + "\n"
-		dump += "   R2: " + str(hex(self.R2)) + "\n"
-		dump += "   R3: " + str(hex(self.R3)) + "\n"
-		dump += "   R4: " + str(hex(self.R4)) + "\n"
-		dump += "   R5: " + str(hex(self.R5))
-		return dump
-
-	def encode(self):
-		out = self.C1 + self.C2 + self.C3 + self.C4 + self.C5
-		out += [self.R1, self.R2, self.R3, self.R4, self.R5]
-		return out
+		if content != None and len(content) != self.schema.size:
+			content = None
+		super().__init__(content)
 
 
-class SYSMO_USIMSJS1_FILE_EF_SQNC:
+class SYSMO_USIMSJS1_FILE_EF_SQNC(FileStruct):
 	# Default parameters
-	ind_size_bits = 5
-	sqn_check_enabled = True
-	sqn_age_limit_enabled = False
-	sqn_max_delta_enabled = True
-	sqnms_offset = 0
-	max_delta = 2**28 << ind_size_bits
-	age_limit = 2**28 << ind_size_bits
+	schema = FileSchema(
+		Field(None, "B", bits = (
+			Bits("ind_size_bits", 0, 4, int, 5),
+			Bits("sqn_check_enabled", 4, default = True),
+			Bits("sqn_age_limit_enabled", 5, default = False),
+			Bits("sqn_max_delta_enabled", 6, default = True))),
+		Field(None, "2s"), # SQNms offset, see below
+		Field("max_delta", "6s", 2**28 << 5, int),
+		Field("age_limit", "6s", 2**28 << 5, int))
+	__slots__ = schema.names + ("sqnms_offset",)
 
 	def __init__(self, content = None):
+		super().__init__()
+		self.sqnms_offset = 0
 		if content == None:
 			return
 		if len(content) != 15:
 			raise ValueError("unexpected length of %u bytes", len(content))
-		self.ind_size_bits = content[0] & 0xf
-		self.sqn_check_enabled = bool(content[0] & 0x10)
-		self.sqn_age_limit_enabled = bool(content[0] & 0x20)
-		self.sqn_max_delta_enabled = bool(content[0] & 0x40)
+		self.schema.decode(self, content)
 		self.sqnms_offset = list_to_int(content[1:3])/6
-		self.max_delta = list_to_int(content[3:9]) >> self.ind_size_bits
-		self.age_limit = list_to_int(content[9:15]) >> self.ind_size_bits
+		self.max_delta >>= self.ind_size_bits
+		self.age_limit >>= self.ind_size_bits
 
 	def __str__(self):
 		pfx = "   "
@@ -175,24 +145,16 @@ class SYSMO_USIMSJS1_FILE_EF_SQNC:
 		return dump
 
 	def encode(self):
-		out = list(range(0, 3))
-		out[0] = self.ind_size_bits & 0x0f
-		if self.sqn_check_enabled:
-			out[0] |= 0x10
-		if self.sqn_age_limit_enabled:
-			out[0] |= 0x20
-		if self.sqn_max_delta_enabled:
-			out[0] |= 0x40
+		out = super().encode()
 		out[1] = (self.sqnms_offset*6) & 0xff
 		out[2] = (self.sqnms_offset*6) >> 8
-		out += int_to_list(self.max_delta, 6)
-		out += int_to_list(self.age_limit, 6)
 		return out
 
 class SYSMO_USIMSJS1_FILE_EF_SQNA:
 	seq_array = []
 
 	def __init__(self, content, ind = 5):
+		self.seq_array = []
 		if content == None:
 			for i in range(0, 2**ind):
 				self.seq_array.append(0)
@@ -235,9 +197,7 @@ sysmo_usim_opcmodes = (
 
 
 class Sysmo_usim_sjs1(Sysmo_usim):
-
-	def __init__(self):
-		Sysmo_usim.__init__(self, "3B 9F 96 80 1F C7 80 31 A0 73 BE 21 13 67 43 20 07 18 00 00 01 A5")
+	models = ("sysmoUSIM-SJS1",)
 
 
 	# Show the enable status of the USIM application (app is enabled or disabled?)
@@ -246,8 +206,7 @@ class Sysmo_usim_sjs1(Sysmo_usim):
 		self._init()
 
 		print(" * Reading...")
-		self.sim.select(GSM_USIM_EF_DIR)
-		res = self.sim.read_record(0x26, rec_no = 1)
+		res = self.sim.read_record_ef(GSM_USIM_EF_DIR, 0x26, rec_no = 1)
 
 		print(" * Current status of Record No. 1 in EF.DIR:")
 		print("   " + hexdump(res.apdu))
@@ -279,6 +238,8 @@ class Sysmo_usim_sjs1(Sysmo_usim):
 		print(" * Programming...")
 		self.sim.select(GSM_USIM_EF_DIR)
 		self.sim.update_record(new_record, rec_no = 1)
+		# The applications listed in EF.DIR have changed
+		self.sim.card.clear_AID()
 		print("")
 
 
@@ -289,8 +250,7 @@ class Sysmo_usim_sjs1(Sysmo_usim):
 		self._init()
 
 		print(" * Reading...")
-		self.sim.select(SYSMO_USIMSJS1_DF_AUTH)
-		self.sim.select(SYSMO_USIMSJS1_EF_AUTH)
+		self.sim.select_path([SYSMO_USIMSJS1_DF_AUTH, SYSMO_USIMSJS1_EF_AUTH])
 		res = self._read_binary(0x02)
 
 		algo_2g, algo_3g = res.apdu[:2]
@@ -321,9 +281,8 @@ class Sysmo_usim_sjs1(Sysmo_usim):
 		print("   3G: %d=%s" % (algo_3g, id_to_str(sysmo_usim_algorithms, algo_3g)))
 
 		print(" * Programming...")
-		self.sim.select(SYSMO_USIMSJS1_DF_AUTH)
-		self.sim.select(SYSMO_USIMSJS1_EF_AUTH)
-		self.sim.update_binary([algo_2g,algo_3g])
+		self.sim.select_path([SYSMO_USIMSJS1_DF_AUTH, SYSMO_USIMSJS1_EF_AUTH])
+		self._update_binary([algo_2g,algo_3g], "DF_AUTH/EF_AUTH")
 		print("")
 
 
@@ -332,8 +291,7 @@ class Sysmo_usim_sjs1(Sysmo_usim):
 		print("Reading Milenage parameters...")
 		self._init()
 
-		self.sim.select(SYSMO_USIMSJS1_DF_AUTH)
-		self.sim.select(SYSMO_USIMSJS1_EF_MLNGC)
+		self.sim.select_path([SYSMO_USIMSJS1_DF_AUTH, SYSMO_USIMSJS1_EF_MLNGC])
 
 		print(" * Reading...")
 		res = self._read_binary(85)
@@ -353,11 +311,10 @@ class Sysmo_usim_sjs1(Sysmo_usim):
 		ef_mlngc = SYSMO_USIMSJS1_FILE_EF_MLNGC(params)
 		print(str(ef_mlngc))
 
-		self.sim.select(SYSMO_USIMSJS1_DF_AUTH)
-		self.sim.select(SYSMO_USIMSJS1_EF_MLNGC)
+		self.sim.select_path([SYSMO_USIMSJS1_DF_AUTH, SYSMO_USIMSJS1_EF_MLNGC])
 
 		print(" * Programming...")
-		self.sim.update_binary(ef_mlngc.encode())
+		self._update_binary(ef_mlngc.encode(), "DF_AUTH/EF_MLNGC")
 		print("")
 
 
@@ -421,14 +378,19 @@ class Sysmo_usim_sjs1(Sysmo_usim):
 		self._init()
 
 		print(" * Resetting...")
+		# The files are read first, so that only the parts of the SQN
+		# configuration and array that are not yet at their defaults
+		# are written
 		self.sim.card.SELECT_ADF_USIM()
 		ef_sqnc = SYSMO_USIMSJS1_FILE_EF_SQNC(None)
 		self.sim.select(SYSMO_USIMSJS1_EF_SQNC)
-		res = self.sim.update_binary(ef_sqnc.encode())
+		res = self._read_binary(self.sim.filelen)
+		res = self._update_binary(ef_sqnc.encode(), "ADF_USIM/EF_SQNC", res.apdu)
 
 		ef_sqna = SYSMO_USIMSJS1_FILE_EF_SQNA(None, ef_sqnc.ind_size_bits)
 		self.sim.select(SYSMO_USIMSJS1_EF_SQNA)
-		res = self.sim.update_binary(ef_sqna.encode())
+		res = self._read_binary(self.sim.filelen)
+		res = self._update_binary(ef_sqna.encode(), "ADF_USIM/EF_SQNA", res.apdu)
 
 		self.__set_auth_counter("DISABLED")
 		print("")
@@ -462,11 +424,10 @@ class Sysmo_usim_sjs1(Sysmo_usim):
 		print(" * New OPc setting:")
 		print("   %s: %s" % (id_to_str(sysmo_usim_opcmodes, select), hexdump(op)))
 
-		self.sim.select(GSM_SIM_DF_GSM)
-		self.sim.select(SYSMO_USIMSJS1_EF_OPC)
+		self.sim.select_path([GSM_SIM_DF_GSM, SYSMO_USIMSJS1_EF_OPC])
 
 		print(" * Programming...")
-		self.sim.update_binary([select] + op)
+		self._update_binary([select] + op, "DF_GSM/EF_OPC")
 		print("")
 
 
@@ -474,8 +435,7 @@ class Sysmo_usim_sjs1(Sysmo_usim):
 	def show_key_params(self):
 		print("Reading KI value...")
 		print(" * Reading...")
-		self.sim.select(GSM_SIM_DF_GSM)
-		self.sim.select(SYSMO_USIMSJS1_EF_KI)
+		self.sim.select_path([GSM_SIM_DF_GSM, SYSMO_USIMSJS1_EF_KI])
 		res = self._read_binary(16)
 
 		print(" * Current KI setting:")
@@ -491,9 +451,8 @@ class Sysmo_usim_sjs1(Sysmo_usim):
 		print(" * New KI setting:")
 		print("   KI: " + hexdump(ki))
 
-		self.sim.select(GSM_SIM_DF_GSM)
-		self.sim.select(SYSMO_USIMSJS1_EF_KI)
+		self.sim.select_path([GSM_SIM_DF_GSM, SYSMO_USIMSJS1_EF_KI])
 
 		print(" * Programming...")
-		self.sim.update_binary(ki)
+		self._update_binary(ki, "DF_GSM/EF_KI")
 		print("")
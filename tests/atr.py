@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Check the card model detection (see SYSMO_MODELS) against ATR variants
+
+(C) 2026 by sysmocom - s.f.m.c. GmbH
+All Rights Reserved
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Each ATR is checked as listed and with other OS version bytes (with the
+# checksum adjusted), the model must be detected in both cases. ATRs of
+# other cards must not be detected as a sysmo model.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sysmo_usim import *
+
+# (expected model, ATR), the second SJA2 ATR is not listed in SYSMO_MODELS
+ATRS = [
+	("sysmoUSIM-SJS1", "3B 9F 96 80 1F C7 80 31 A0 73 BE 21 13 67 43 20 07 18 00 00 01 A5"),
+	("sysmoISIM-SJA2", "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 4C 75 30 34 05 4B A9"),
+	("sysmoISIM-SJA2", "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 4C 75 31 33 02 51 B2"),
+	("sysmoTSIM", "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 4C 52 75 31 04 51 D5"),
+	("sysmoISIM-SJA5 (9FV)", "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 35 75 30 35 02 59 C4"),
+	("sysmoISIM-SJA5 (SLM17)", "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 35 75 30 35 02 65 F8"),
+	("sysmoISIM-SJA5 (3FJ)", "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 35 75 30 35 02 51 CC"),
+	(None, "3B 9F 96 80 1F 87 80 31 E0 73 FE 21 1B 67 4A 36 75 30 35 02 59 C7"),
+	(None, "3B 9F 96 80 1F C7 80 31 A0 73 BE 21 13 67 43 20 07 18 00 00 01"),
+	(None, "3B 8F 80 01 80 4F 0C A0 00 00 03 06 03 00 01 00 00 00 00 6A"),
+]
+
+# Change the OS version bytes of an ATR and adjust the checksum
+def version_variant(atr):
+	atr = list(atr)
+	atr[17] ^= 0x01
+	atr[18] ^= 0x02
+	atr[19] ^= 0x07
+	atr[-1] = 0
+	for b in atr[1:-1]:
+		atr[-1] ^= b
+	return atr
+
+def main():
+	failed = 0
+	for model, atr in ATRS:
+		atr = toBytes(atr)
+		atrs = [atr]
+		if model:
+			atrs.append(version_variant(atr))
+		for atr in atrs:
+			found = sysmo_model(atr)
+			if found != model:
+				print("ATR %s: detected %s, expected %s" % (toHexString(atr), found, model))
+				failed += 1
+	print("Summary: %d ATRs failed" % failed)
+	return failed
+
+if __name__ == "__main__":
+	sys.exit(1 if main() else 0)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the APDU count and the host CPU cost of the card operations
+
+(C) 2026 by sysmocom - s.f.m.c. GmbH
+All Rights Reserved
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# The operations are executed against the card simulator (see simulator.py),
+# so no card reader is required. For each operation the number of APDUs
+# exchanged with the card and the CPU time spent per call is reported.
+
+import os
+import sys
+import io
+import time
+import getopt
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from simulator import *
+from utils import *
+from sysmo_usim_sjs1 import *
+from sysmo_isim_sja2 import *
+
+SJA2_OPERATIONS = [
+	("show_auth_params", lambda s: s.show_auth_params()),
+	("write_auth_params", lambda s: s.write_auth_params("MILENAGE", "MILENAGE")),
+	("show_key_params", lambda s: s.show_key_params()),
+	("write_key_params", lambda s: s.write_key_params(asciihex_to_list("D7882EAE7CD14F06108C55F8E5CFFE93"))),
+	("show_opc_params", lambda s: s.show_opc_params()),
+	("write_opc_params", lambda s: s.write_opc_params(True, asciihex_to_list("840337c3d45397ce8ea8609ffdc47224"))),
+	("show_milenage_params", lambda s: s.show_milenage_params()),
+	("show_milenage_sqn_params", lambda s: s.show_milenage_sqn_params()),
+	("reset_milenage_sqn_params", lambda s: s.reset_milenage_sqn_params()),
+	("show_mnclen", lambda s: s.show_mnclen()),
+	("write_mnclen", lambda s: s.write_mnclen([0x02])),
+	("show_iccid", lambda s: s.show_iccid()),
+	("show_aid", lambda s: s.show_aid()),
+	("dump", lambda s: s.dump()),
+]
+
+SJS1_OPERATIONS = [
+	("show_sim_mode", lambda s: s.show_sim_mode()),
+	("write_sim_mode", lambda s: s.write_sim_mode(True)),
+	("show_auth_params", lambda s: s.show_auth_params()),
+	("write_auth_params", lambda s: s.write_auth_params("MILENAGE", "MILENAGE")),
+	("show_key_params", lambda s: s.show_key_params()),
+	("write_key_params", lambda s: s.write_key_params(asciihex_to_list("94c7f52c8c7337fad1af3a73b17b56ac"))),
+	("show_opc_params", lambda s: s.show_opc_params()),
+	("write_opc_params", lambda s: s.write_opc_params(True, asciihex_to_list("840337c3d45397ce8ea8609ffdc47224"))),
+	("show_milenage_params", lambda s: s.show_milenage_params()),
+	("show_milenage_sqn_params", lambda s: s.show_milenage_sqn_params()),
+	("reset_milenage_sqn_params", lambda s: s.reset_milenage_sqn_params()),
+	("show_mnclen", lambda s: s.show_mnclen()),
+	("show_iccid", lambda s: s.show_iccid()),
+]
+
+MODELS = {
+	"sja2" : (sim_sysmo_isim_sja2, Sysmo_isim_sja2, "67225880", SJA2_OPERATIONS),
+	"sja5" : (sim_sysmo_isim_sja5, Sysmo_isim_sja5, "11111111", SJA2_OPERATIONS),
+	"sjs1" : (sim_sysmo_usim_sjs1, Sysmo_usim_sjs1, "55538407", SJS1_OPERATIONS),
+}
+
+
+# Run all operations of one card model and print the results
+def bench_model(name, runs, protocol):
+	sim_create, tool_class, adm1, operations = MODELS[name]
+	sim = sim_create()
+	sim.protocol = protocol
+
+	with contextlib.redirect_stdout(io.StringIO()):
+		tool = tool_class(sim)
+		if tool.admin_auth(ascii_to_list(adm1)) == False:
+			raise RuntimeError("authentication against simulated card failed")
+
+	print("%s (T=%u):" % (name, protocol))
+	print("   %-28s %8s %12s %10s" % ("operation", "APDUs", "us/op", "ops/s"))
+	for op_name, op in operations:
+		with contextlib.redirect_stdout(io.StringIO()):
+			apdu_count = sim.apdu_count
+			op(tool)
+			apdus = sim.apdu_count - apdu_count
+
+			start = time.process_time()
+			for i in range(0, runs):
+				op(tool)
+			elapsed = time.process_time() - start
+
+		usec = elapsed * 1000000 / runs
+		print("   %-28s %8u %12.1f %10.0f" % (op_name, apdus, usec, runs / elapsed if elapsed else 0))
+	print("")
+
+
+def usage():
+	print("usage: %s [-n RUNS] [-m MODEL] [-t PROTOCOL]" % sys.argv[0])
+	print("   -n RUNS ........ number of runs per operation (default: 100)")
+	print("   -m MODEL ....... card model (%s), default: all" % ", ".join(MODELS))
+	print("   -t PROTOCOL .... transmission protocol of the simulated card, 0 or 1 (default: 0)")
+
+
+def main(argv):
+	runs = 100
+	models = list(MODELS)
+	protocol = 0
+
+	try:
+		opts, args = getopt.getopt(argv[1:], "hn:m:t:")
+	except getopt.GetoptError as err:
+		print(err)
+		usage()
+		return 2
+
+	for o, a in opts:
+		if o == "-n":
+			runs = int(a)
+		elif o == "-m":
+			if a not in MODELS:
+				usage()
+				return 2
+			models = [a]
+		elif o == "-t":
+			protocol = int(a)
+		else:
+			usage()
+			return 0
+
+	for name in models:
+		bench_model(name, runs, protocol)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
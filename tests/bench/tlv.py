@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the TLV parsers of the card library on growing inputs
+
+(C) 2026 by sysmocom - s.f.m.c. GmbH
+All Rights Reserved
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Each parser is run on inputs of 1 KB up to the maximum size, the time per
+# byte should stay about the same when the parser scales linearly with the
+# input size. The bulk API is run on a batch of FCPs and EF_DIR records.
+
+import os
+import sys
+import time
+import getopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from card.utils import *
+
+# FCP of a transparent EF and an EF_DIR record (USIM application)
+FCP = bytes.fromhex("621e8202412183026f078a01058b036f0603800200098801388102000c")
+DIR_RECORD = bytes.fromhex("61124f10a0000000871002ffffffff89070900005004555349" +
+			   "4dffffffffffffffffffffff")
+
+# Build an input of about size bytes, made of TLV (or LV) records with
+# 8 bytes of value each
+def make_input(size, ber = False, lv = False):
+	if lv:
+		rec = bytes((8,)) + bytes(range(8))
+	elif ber:
+		rec = bytes((0x9F, 0x1A, 8)) + bytes(range(8))
+	else:
+		rec = bytes((0x80, 8)) + bytes(range(8))
+	return rec * (size // len(rec))
+
+PARSERS = [
+	("LV_parser", lambda d: LV_parser(d), dict(lv = True)),
+	("TLV_parser", lambda d: TLV_parser(d), dict()),
+	("BERTLV_parser", lambda d: BERTLV_parser(d), dict(ber = True)),
+	("BERTLV_iter (memoryview)", lambda d: sum(1 for r in BERTLV_iter(memoryview(d))), dict(ber = True)),
+]
+
+
+# Return the CPU time per call of func(arg), in us
+def timeit(func, arg, runs):
+	start = time.process_time()
+	for i in range(0, runs):
+		func(arg)
+	return (time.process_time() - start) * 1000000 / runs
+
+
+def bench_parsers(runs, max_kb):
+	print("   %-26s %8s %12s %10s" % ("parser", "KB", "us/parse", "ns/byte"))
+	for name, parser, args in PARSERS:
+		kb = 1
+		while kb <= max_kb:
+			data = make_input(kb * 1024, **args)
+			usec = timeit(parser, data, runs)
+			print("   %-26s %8u %12.1f %10.1f" % (name, kb, usec, usec * 1000 / len(data)))
+			kb *= 2
+	print("")
+
+
+def bench_bulk(runs, count):
+	print("   %-26s %8s %12s %10s" % ("bulk", "items", "us/batch", "us/item"))
+	for name, func, item in [("decode_FCPs", decode_FCPs, FCP),
+				 ("DIR_AIDs", DIR_AIDs, DIR_RECORD)]:
+		batch = [item] * count
+		usec = timeit(func, batch, runs)
+		print("   %-26s %8u %12.1f %10.2f" % (name, count, usec, usec / count))
+	print("")
+
+
+def usage():
+	print("usage: %s [-n RUNS] [-s MAX_KB]" % sys.argv[0])
+	print("   -n RUNS ........ number of runs per measurement (default: 20)")
+	print("   -s MAX_KB ...... largest input size in KB (default: 32)")
+
+
+def main(argv):
+	runs = 20
+	max_kb = 32
+
+	try:
+		opts, args = getopt.getopt(argv[1:], "hn:s:")
+	except getopt.GetoptError as err:
+		print(err)
+		usage()
+		return 2
+
+	for o, a in opts:
+		if o == "-n":
+			runs = int(a)
+		elif o == "-s":
+			max_kb = int(a)
+		else:
+			usage()
+			return 0
+
+	bench_parsers(runs, max_kb)
+	bench_bulk(runs, 1000)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Print statistics about a binary APDU trace
+
+(C) 2026 by sysmocom - s.f.m.c. GmbH
+All Rights Reserved
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Traces are recorded with option -R (--record) of the tools. The trace is
+# scanned through mmap, so even large traces are not loaded into memory.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from card.ICC import ISO7816
+from card.trace import *
+
+
+def main(argv):
+	if len(argv) != 2:
+		print("usage: %s TRACEFILE" % argv[0])
+		return 1
+
+	trace = TraceReader(argv[1])
+	resets = 0
+	protocols = set()
+	last = 0
+	stats = {}
+	for rec_type, t, duration, command, response in trace:
+		last = t
+		if rec_type == TRACE_REC_ATR:
+			resets += 1
+			protocols.add(trace_atr((rec_type, t, duration, command, response))[1])
+			continue
+		count, total = stats.get(command[1], (0, 0))
+		stats[command[1]] = (count + 1, total + duration)
+
+	print("%u resets (%s), %u APDUs, %.3f s" % (resets, ", ".join("T=%u" % p for p in sorted(protocols)),
+						   sum(s[0] for s in stats.values()), last / 1e9))
+	print("   %-28s %8s %12s" % ("INS", "APDUs", "us/APDU"))
+	for ins in sorted(stats, key = lambda ins: -stats[ins][0]):
+		count, total = stats[ins]
+		name = ISO7816.INS_dic.get(ins, "%02X" % ins)
+		print("   %-28s %8u %12.1f" % (name, count, total / count))
+	trace.close()
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
@@ -8,6 +8,10 @@ $TOOL -a $ADMPIN -T "COMP128v1:MILENAGE:TUAK"
 $TOOL -a $ADMPIN -W 32:64:128:123
 $TOOL -a $ADMPIN -w
 
+# Program/read-back a TUAK configuration with distinct RES and MAC sizes
+$TOOL -a $ADMPIN -W 64:256:256:24
+$TOOL -a $ADMPIN -w
+
 # Program/read-back a 128 bit key
 $TOOL -a $ADMPIN -K a0b1c2d3e4f5061728394a5b6c7d8e9f
 $TOOL -a $ADMPIN -k
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Check the decoding and encoding of the SQN file of the SJA2/SJA5 cards
+
+(C) 2026 by sysmocom - s.f.m.c. GmbH
+All Rights Reserved
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Files with several IND sizes are decoded and encoded again, the result
+# must equal the original contents. A file whose IND size does not match
+# its length is decoded with the IND size that follows from the length.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sysmo_isim_sja2 import *
+
+# Contents of an SQN file: flags, max delta, age limit and freshness data
+def sqn_file(ind_size_bits, file_ind_size_bits = None):
+	if file_ind_size_bits is None:
+		file_ind_size_bits = ind_size_bits
+	content = [0xD0 | file_ind_size_bits, 0x05]
+	content += [0x00, 0x01, 0x02, 0x03, 0x04, 0x05]
+	content += [0x10, 0x11, 0x12, 0x13, 0x14, 0x15]
+	content += [(i * 7 + 1) & 0xFF for i in range(6 * 2**ind_size_bits)]
+	return content
+
+def check(name, content, ind_size_bits, expected):
+	ef = SYSMO_ISIMSJAX_FILE_EF_USIM_SQN(content)
+	failed = 0
+	if ef.ind_size_bits != ind_size_bits:
+		print("%s: IND size %u, expected %u" % (name, ef.ind_size_bits, ind_size_bits))
+		failed += 1
+	if list(ef.freshness_data) != expected[14:]:
+		print("%s: freshness data %s" % (name, hexdump(ef.freshness_data)))
+		failed += 1
+	if list(ef.encode()) != expected:
+		print("%s: encoded %s" % (name, hexdump(ef.encode())))
+		failed += 1
+	return failed
+
+def main():
+	failed = 0
+	for ind_size_bits in (2, 3, 5):
+		content = sqn_file(ind_size_bits)
+		failed += check("IND %u" % ind_size_bits, content, ind_size_bits, content)
+
+	# The IND size in the file is wrong (5 instead of 3)
+	failed += check("IND 5 in a file for IND 3", sqn_file(3, 5), 3, sqn_file(3))
+
+	# The default contents
+	ef = SYSMO_ISIMSJAX_FILE_EF_USIM_SQN()
+	failed += check("default", list(ef.encode()), 5, list(ef.encode()))
+
+	print("Summary: %d checks failed" % failed)
+	return failed
+
+if __name__ == "__main__":
+	sys.exit(1 if main() else 0)
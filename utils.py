@@ -23,22 +23,21 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import struct
+from card.utils import SWAP_NIBBLES
+
 # Convert list to an printable ascii hex string
 def hexdump(array, multilne = False, width = 30, prefix = "   "):
 
-	if array == None:
+	if array is None:
 		return "(no data)"
 
 	if multilne:
-		result = ""
-		for i in range(0, len(array), width):
-			buf = array[i:i + width]
-			result += prefix
-			result += ''.join('{:02x}'.format(x) for x in buf)
-			result += "\n"
-		return result.rstrip()
+		data = bytes(array)
+		return "\n".join([prefix + data[i:i + width].hex()
+				  for i in range(0, len(data), width)]).rstrip()
 	else:
-		return ''.join('{:02x}'.format(x) for x in array)
+		return bytes(array).hex()
 
 
 # Convert ascii string with decimal numbers to numeric ascii-code list
@@ -72,25 +71,33 @@ def pad_asciihex(string, front=False, padding='f'):
 
 # Swap nibbles of each byte in an array
 def swap_nibbles(array):
+	return list(bytes(array).translate(SWAP_NIBBLES))
+
 
+# Convert a column of ascii strings with decimal numbers (e.g. the IMSIs or
+# ICCIDs of a batch of cards) to numeric lists with swapped nibbles, as they
+# are stored on the card. The strings are padded like pad_asciihex() and
+# converted all at once.
+def encode_bcd_batch(strings, front = False, padding = 'f'):
+	strings = [pad_asciihex(s, front, padding) for s in strings]
+	data = bytes.fromhex(''.join(strings)).translate(SWAP_NIBBLES)
 	rc = []
-	for a in array:
-		rc.append(((a & 0xf0) >> 4) | ((a & 0x0f) << 4))
+	pos = 0
+	for s in strings:
+		rc.append(list(data[pos:pos + len(s) // 2]))
+		pos += len(s) // 2
 	return rc
 
 
 # Convert from list of bytes to big-endian integer
 def list_to_int(arr):
-	return int(hexdump(arr), 16)
+	return int.from_bytes(bytes(arr), 'big')
 
 
 # Encode an integer number into list of bytes (e.g. 1025 becomes [4, 1])
 def int_to_list(inp, num_bytes):
-	out = []
-	for i in range(0, num_bytes):
-		shift_bits = ((num_bytes-1-i) * 8)
-		out.append((inp >> shift_bits) & 0xFF)
-	return out
+	inp &= (1 << (num_bytes * 8)) - 1
+	return list(inp.to_bytes(num_bytes, 'big'))
 
 
 # Lookup a string in a given table by its ID
@@ -111,3 +118,166 @@ def str_to_id(table, string, safe_default = None):
 		else:
 			raise ValueError('identifier (\"%s\") not in table %s' % (string, str(table)))
 	return id
+
+
+# Bit field inside a byte oriented Field of a FileSchema: width bits at
+# shift, decoded as bool or int (kind). The offset is added to the decoded
+# value (e.g. a bit that selects function 1 or 2 has offset 1).
+class Bits:
+	__slots__ = ("name", "shift", "mask", "kind", "default", "offset")
+
+	def __init__(self, name, shift, width = 1, kind = bool, default = False, offset = 0):
+		self.name = name
+		self.shift = shift
+		self.mask = (1 << width) - 1
+		self.kind = kind
+		self.default = default
+		self.offset = offset
+
+	def decode(self, value):
+		value = (value >> self.shift) & self.mask
+		if self.kind is bool:
+			return bool(value)
+		return value + self.offset
+
+	def encode(self, value):
+		return ((int(value) - self.offset) & self.mask) << self.shift
+
+
+# Field of a FileSchema. The format is a struct format code: "B" (byte),
+# "H" (16 bit integer) or "<n>s" (n bytes, decoded as a list of bytes, or
+# as a big endian integer when kind is int). Integer fields may instead be
+# made of bits (see Bits). A field without name and bits is reserved: it is
+# ignored when decoding and encoded as zero.
+class Field:
+	__slots__ = ("name", "fmt", "default", "kind", "bits")
+
+	def __init__(self, name, fmt, default = None, kind = None, bits = ()):
+		self.name = name
+		self.fmt = fmt
+		self.default = default
+		self.kind = kind
+		self.bits = bits
+
+
+# Declarative layout of the content of a file, compiled into a single
+# struct.Struct, so that all fields are decoded (or encoded) with one call
+class FileSchema:
+
+	def __init__(self, *fields):
+		self.fields = fields
+		self.struct = struct.Struct(">" + "".join([f.fmt for f in fields]))
+		self.size = self.struct.size
+		names = []
+		for f in fields:
+			if f.name:
+				names.append(f.name)
+			names += [b.name for b in f.bits]
+		self.names = tuple(names)
+
+		# Converters between the struct values and the attributes
+		self.decoders = []
+		self.encoders = []
+		for f in fields:
+			size = struct.calcsize(">" + f.fmt)
+			if f.bits:
+				self.decoders.append((None, f.bits))
+				self.encoders.append((None, f.bits))
+			elif not f.name:
+				self.decoders.append(None)
+				zero = bytes(size) if f.fmt.endswith("s") else 0
+				self.encoders.append((None, zero))
+			elif f.fmt.endswith("s") and f.kind is int:
+				self.decoders.append((f.name, lambda v: int.from_bytes(v, "big")))
+				self.encoders.append((f.name, lambda v, size = size: bytes(int_to_list(v, size))))
+			elif f.fmt.endswith("s"):
+				self.decoders.append((f.name, list))
+				self.encoders.append((f.name, bytes))
+			else:
+				self.decoders.append((f.name, None))
+				self.encoders.append((f.name, None))
+
+	# Return a new schema with the given fields appended
+	def extend(self, *fields):
+		return FileSchema(*(self.fields + fields))
+
+	# Set the default values of all fields in obj
+	def defaults(self, obj):
+		for f in self.fields:
+			if f.name:
+				default = f.default
+				if isinstance(default, list):
+					default = list(default)
+				setattr(obj, f.name, default)
+			for b in f.bits:
+				setattr(obj, b.name, b.default)
+
+	# Decode content (list of bytes, bytes or memoryview), starting at
+	# offset, into the attributes of obj
+	def decode(self, obj, content, offset = 0):
+		if not isinstance(content, (bytes, bytearray, memoryview)):
+			content = bytes(content)
+		if len(content) < offset + self.size:
+			raise ValueError("unexpected length of %u bytes" % len(content))
+		values = self.struct.unpack_from(content, offset)
+		for decoder, value in zip(self.decoders, values):
+			if decoder is None:
+				continue
+			name, conv = decoder
+			if name is None:
+				for b in conv:
+					setattr(obj, b.name, b.decode(value))
+			elif conv:
+				setattr(obj, name, conv(value))
+			else:
+				setattr(obj, name, value)
+
+	# Encode the attributes of obj into a bytearray
+	def encode(self, obj):
+		values = []
+		for name, conv in self.encoders:
+			if name is None:
+				if isinstance(conv, tuple):
+					value = 0
+					for b in conv:
+						value |= b.encode(getattr(obj, b.name))
+				else:
+					value = conv
+			elif conv:
+				value = conv(getattr(obj, name))
+			else:
+				value = getattr(obj, name)
+			values.append(value)
+		out = bytearray(self.size)
+		self.struct.pack_into(out, 0, *values)
+		return out
+
+
+# Base of the classes that model the content of a file with a FileSchema
+# (class attribute "schema", found at "offset" in the file content). The
+# fields are kept in slots, subclasses declare them with
+# __slots__ = schema.names
+class FileStruct:
+	__slots__ = ()
+	schema = None
+	offset = 0
+
+	def __init__(self, content = None):
+		self.schema.defaults(self)
+		if content is not None:
+			self.schema.decode(self, content, self.offset)
+
+	def __str__(self):
+		dump = []
+		for f in self.schema.fields:
+			if not f.name:
+				continue
+			value = getattr(self, f.name)
+			if isinstance(value, int):
+				dump.append("   %s: %s" % (f.name, hex(value)))
+			else:
+				dump.append("   %s: %s" % (f.name, hexdump(value)))
+		return "\n".join(dump)
+
+	def encode(self):
+		return self.schema.encode(self)